@@ -0,0 +1,311 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.management.ManagementFactory;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.net.SocketException;
+import java.net.SocketTimeoutException;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.nio.file.StandardCopyOption;
+import java.security.SecureRandom;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Semaphore;
+import java.util.concurrent.atomic.AtomicInteger;
+import java.util.concurrent.atomic.AtomicLong;
+import javax.tools.JavaCompiler;
+import javax.tools.ToolProvider;
+
+/**
+ * Long-lived build daemon for website2app (driven by builder/daemon.py).
+ *
+ * Keeps javac, d8 and apksigner loaded in one warm JVM and serves requests
+ * on a loopback socket, so repeated builds skip JVM startup and JIT warmup.
+ *
+ * Usage: java -cp classes BuildDaemon <state file> <d8.jar> <apksigner.jar>
+ *
+ * The state file receives "port, token, pid, d8 jar, apksigner jar, java.home" (one per line).
+ * Request:  token \n tool \n argc \n arg_1 \n ... arg_argc \n
+ * Response: exit code \n followed by the tool's combined stdout/stderr.
+ *
+ * Up to MAX_REQUESTS tool requests run at once on a thread pool (e.g. from
+ * parallel batch workers); each one's output is captured separately. When
+ * all slots are taken the daemon answers BUSY at once and the client runs
+ * the tool as a new process instead of queueing.
+ */
+public class BuildDaemon {
+    private static final long IDLE_TIMEOUT_MS = 3L * 60 * 60 * 1000;
+    private static final int HEADER_TIMEOUT_MS = 10 * 1000;
+    private static final int MAX_REQUESTS = Math.max(2, Runtime.getRuntime().availableProcessors() / 2);
+    private static final int BUSY = 125;
+
+    private final String d8Jar;
+    private final String signerJar;
+    private ClassLoader d8Loader;
+    private ClassLoader signerLoader;
+    private volatile boolean shutdown = false;
+    private ServerSocket server;
+    private final ExecutorService pool = Executors.newCachedThreadPool();
+    private final Semaphore slots = new Semaphore(MAX_REQUESTS);
+    private final AtomicInteger active = new AtomicInteger();
+    private final AtomicLong lastUsed = new AtomicLong(System.currentTimeMillis());
+
+    public BuildDaemon(String d8Jar, String signerJar) {
+        this.d8Jar = d8Jar;
+        this.signerJar = signerJar;
+    }
+
+    public static void main(String[] args) throws Exception {
+        String d8Jar = args.length > 1 ? args[1] : "";
+        String signerJar = args.length > 2 ? args[2] : "";
+        new BuildDaemon(d8Jar, signerJar).serve(Paths.get(args[0]));
+        // Requests still running when "shutdown" arrived are dropped; their clients fall back to a process
+        System.exit(0);
+    }
+
+    private void serve(Path stateFile) throws Exception {
+        server = new ServerSocket(0, 50, InetAddress.getLoopbackAddress());
+        String token = newToken();
+        String pid = ManagementFactory.getRuntimeMXBean().getName().split("@")[0];
+        String state = server.getLocalPort() + "\n" + token + "\n" + pid + "\n" + d8Jar + "\n" + signerJar + "\n"
+                + System.getProperty("java.home") + "\n";
+
+        // d8 and apksigner print to System.out/err: route those to the buffer of the request running on the thread
+        System.setOut(new PrintStream(new RequestOutput(System.out), true, "UTF-8"));
+        System.setErr(new PrintStream(new RequestOutput(System.err), true, "UTF-8"));
+
+        Path tmp = stateFile.resolveSibling(stateFile.getFileName() + ".tmp");
+        Files.write(tmp, state.getBytes(StandardCharsets.UTF_8));
+        Files.move(tmp, stateFile, StandardCopyOption.REPLACE_EXISTING);
+
+        server.setSoTimeout(60 * 1000);
+        try {
+            while (!shutdown) {
+                Socket socket;
+                try {
+                    socket = server.accept();
+                } catch (SocketTimeoutException e) {
+                    if (active.get() == 0 && System.currentTimeMillis() - lastUsed.get() > IDLE_TIMEOUT_MS) {
+                        break;
+                    }
+                    continue;
+                } catch (SocketException e) {
+                    if (shutdown) {
+                        break;  // "shutdown" closed the server socket
+                    }
+                    throw e;
+                }
+                try {
+                    dispatch(socket, token);
+                } catch (Exception e) {
+                    // A broken client must not take the daemon down
+                    closeQuietly(socket);
+                }
+            }
+        } finally {
+            server.close();
+            pool.shutdownNow();
+            Files.deleteIfExists(stateFile);
+        }
+    }
+
+    /** Reads the request on the accept thread; control requests are answered here, tools go to the pool. */
+    private void dispatch(Socket socket, String token) throws Exception {
+        socket.setSoTimeout(HEADER_TIMEOUT_MS);
+        BufferedReader in = new BufferedReader(new InputStreamReader(socket.getInputStream(), StandardCharsets.UTF_8));
+        OutputStream out = socket.getOutputStream();
+        if (!token.equals(in.readLine())) {
+            reply(socket, 126, "Invalid daemon token\n");
+            return;
+        }
+        String tool = in.readLine();
+        int argc = Integer.parseInt(in.readLine().trim());
+        String[] args = new String[argc];
+        for (int i = 0; i < argc; i++) {
+            args[i] = in.readLine();
+        }
+        socket.setSoTimeout(0);
+
+        if ("ping".equals(tool)) {
+            reply(socket, 0, "");
+            return;
+        }
+        if ("shutdown".equals(tool)) {
+            shutdown = true;
+            reply(socket, 0, "");
+            server.close();
+            return;
+        }
+        if (!slots.tryAcquire()) {
+            reply(socket, BUSY, "Build daemon busy\n");
+            return;
+        }
+        active.incrementAndGet();
+        pool.execute(() -> {
+            try {
+                ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+                int code = run(tool, args, buffer);
+                out.write((code + "\n").getBytes(StandardCharsets.UTF_8));
+                buffer.writeTo(out);
+                out.flush();
+            } catch (Exception e) {
+                // The client went away (e.g. it timed out); nothing to report to
+            } finally {
+                closeQuietly(socket);
+                lastUsed.set(System.currentTimeMillis());
+                active.decrementAndGet();
+                slots.release();
+            }
+        });
+    }
+
+    private static void reply(Socket socket, int code, String message) throws Exception {
+        try {
+            OutputStream out = socket.getOutputStream();
+            out.write((code + "\n" + message).getBytes(StandardCharsets.UTF_8));
+            out.flush();
+        } finally {
+            closeQuietly(socket);
+        }
+    }
+
+    private static void closeQuietly(Socket socket) {
+        try {
+            socket.close();
+        } catch (Exception e) {
+            // Already closed
+        }
+    }
+
+    private int run(String tool, String[] args, ByteArrayOutputStream buffer) throws Exception {
+        PrintStream capture = new PrintStream(buffer, true, "UTF-8");
+        // Threads the tool starts inherit the target, so their output lands in this request's buffer too
+        RequestOutput.TARGET.set(capture);
+        try {
+            switch (tool) {
+                case "javac":
+                    return runJavac(args, capture);
+                case "d8":
+                    return runD8(args);
+                case "apksigner":
+                    return runApkSigner(args);
+                default:
+                    capture.println("Unknown tool: " + tool);
+                    return 127;
+            }
+        } catch (InvocationTargetException e) {
+            e.getCause().printStackTrace(capture);
+            return 1;
+        } catch (Throwable t) {
+            t.printStackTrace(capture);
+            return 1;
+        } finally {
+            capture.flush();
+            RequestOutput.TARGET.remove();
+        }
+    }
+
+    private int runJavac(String[] args, PrintStream capture) {
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            capture.println("No system Java compiler: the daemon must run on a JDK, not a JRE");
+            return 127;
+        }
+        return compiler.run(null, capture, capture, args);
+    }
+
+    private synchronized ClassLoader d8Loader() throws Exception {
+        if (d8Loader == null) {
+            d8Loader = jarLoader(d8Jar);
+        }
+        return d8Loader;
+    }
+
+    private synchronized ClassLoader signerLoader() throws Exception {
+        if (signerLoader == null) {
+            signerLoader = jarLoader(signerJar);
+        }
+        return signerLoader;
+    }
+
+    private int runD8(String[] args) throws Exception {
+        ClassLoader loader = d8Loader();
+        // Equivalent of D8.main without its System.exit on failure
+        Class<?> d8 = loader.loadClass("com.android.tools.r8.D8");
+        Class<?> commandClass = loader.loadClass("com.android.tools.r8.D8Command");
+        Class<?> originClass = loader.loadClass("com.android.tools.r8.origin.Origin");
+        Object root = originClass.getMethod("root").invoke(null);
+        Object builder = commandClass.getMethod("parse", String[].class, originClass).invoke(null, args, root);
+        Method build = builder.getClass().getMethod("build");
+        build.setAccessible(true);
+        Object command = build.invoke(builder);
+        d8.getMethod("run", commandClass).invoke(null, command);
+        return 0;
+    }
+
+    private int runApkSigner(String[] args) throws Exception {
+        Class<?> tool = signerLoader().loadClass("com.android.apksigner.ApkSignerTool");
+        tool.getMethod("main", String[].class).invoke(null, (Object) args);
+        return 0;
+    }
+
+    private static ClassLoader jarLoader(String jar) throws Exception {
+        if (jar == null || jar.isEmpty() || !new File(jar).isFile()) {
+            throw new IllegalStateException("Tool jar not available: " + jar);
+        }
+        return new URLClassLoader(new URL[] {new File(jar).toURI().toURL()}, BuildDaemon.class.getClassLoader());
+    }
+
+    /** System.out/err replacement writing to the current request's capture stream, or to the daemon log. */
+    private static final class RequestOutput extends OutputStream {
+        static final InheritableThreadLocal<PrintStream> TARGET = new InheritableThreadLocal<>();
+
+        private final PrintStream fallback;
+
+        RequestOutput(PrintStream fallback) {
+            this.fallback = fallback;
+        }
+
+        private PrintStream target() {
+            PrintStream target = TARGET.get();
+            return target != null ? target : fallback;
+        }
+
+        @Override
+        public void write(int b) {
+            target().write(b);
+        }
+
+        @Override
+        public void write(byte[] b, int off, int len) {
+            target().write(b, off, len);
+        }
+
+        @Override
+        public void flush() {
+            target().flush();
+        }
+    }
+
+    private static String newToken() {
+        byte[] bytes = new byte[16];
+        new SecureRandom().nextBytes(bytes);
+        StringBuilder sb = new StringBuilder();
+        for (byte b : bytes) {
+            sb.append(String.format("%02x", b));
+        }
+        return sb.toString();
+    }
+}
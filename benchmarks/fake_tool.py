@@ -0,0 +1,176 @@
+"""
+Stand-ins for aapt2, javac, d8, zipalign, apksigner and keytool.
+
+Each one writes outputs of the shape BuildEngine expects (flat files, a
+resources APK with R.java, parseable .class files, per-class and merged
+dex files, a signed copy) and sleeps for a latency modelled on the real
+tool: a fixed startup cost (JVM start for the Java tools) plus a cost per
+input file or megabyte. W2A_BENCH_LATENCY scales every delay (0 disables
+them, so only the pipeline's own overhead is measured).
+"""
+import os
+import re
+import shutil
+import struct
+import sys
+import time
+import zipfile
+
+# tool -> (startup seconds, seconds per input file, seconds per input MB)
+LATENCY = {
+    "aapt2 compile": (0.02, 0.002, 0.01),
+    "aapt2 link": (0.15, 0.001, 0.02),
+    "javac": (0.6, 0.02, 0.0),
+    "d8": (0.5, 0.005, 0.05),
+    "zipalign": (0.01, 0.0, 0.01),
+    "apksigner": (0.4, 0.0, 0.03),
+    "keytool": (0.4, 0.0, 0.0),
+}
+
+
+def _opt(args, flag):
+    return args[args.index(flag) + 1] if flag in args else None
+
+
+def _simulate(tool, inputs):
+    startup, per_file, per_mb = LATENCY[tool]
+    megabytes = sum(os.path.getsize(p) for p in inputs if os.path.isfile(p)) / (1024 * 1024)
+    delay = (startup + per_file * len(inputs) + per_mb * megabytes) * float(os.environ.get("W2A_BENCH_LATENCY", "1"))
+    if delay > 0:
+        time.sleep(delay)
+
+
+def aapt2(args):
+    if args[0] == "compile":
+        out = _opt(args, "-o")
+        files = [a for a in args[1:] if a not in ("-o", out)]
+        _simulate("aapt2 compile", files)
+        if out.endswith(".zip"):
+            with zipfile.ZipFile(out, "w") as z:
+                for path in files:
+                    z.write(path, os.path.basename(path) + ".flat")
+            return
+        for path in files:
+            folder = os.path.basename(os.path.dirname(path))
+            name = os.path.basename(path)
+            flat = f"{folder}_{os.path.splitext(name)[0]}.arsc.flat" if folder.startswith("values") else \
+                f"{folder}_{name}.flat"
+            shutil.copyfile(path, os.path.join(out, flat))
+    elif args[0] == "link":
+        flats = [a for a in args if a.endswith(".flat")]
+        _simulate("aapt2 link", flats)
+        manifest = open(_opt(args, "--manifest"), encoding="utf-8").read()
+        package = re.search(r'package="([^"]+)"', manifest)
+        package = package.group(1) if package else "com.example.app"
+        with zipfile.ZipFile(_opt(args, "-o"), "w") as z:
+            z.writestr("AndroidManifest.xml", manifest)
+            z.writestr("resources.arsc", b"\0" * 1024, zipfile.ZIP_STORED)
+            for flat in flats:
+                z.write(flat, "res/" + os.path.basename(flat)[:-len(".flat")], zipfile.ZIP_STORED)
+        java_dir = _opt(args, "--java")
+        if java_dir:
+            package_dir = os.path.join(java_dir, *package.split("."))
+            os.makedirs(package_dir, exist_ok=True)
+            with open(os.path.join(package_dir, "R.java"), "w", encoding="utf-8") as f:
+                f.write(f"package {package};\npublic final class R {{}}\n")
+    elif args[0] == "dump":
+        print("package: name='com.example.app'")
+
+
+def javac(args):
+    """Writes a minimal class file per source whose constant pool references the classes it mentions."""
+    if args == ["-version"]:
+        print("javac 17.0.0-bench")
+        return
+    sources = [a for a in args if a.endswith(".java")]
+    _simulate("javac", sources)
+    out = _opt(args, "-d")
+    classes = {}  # simple name -> internal name
+    parsed = []
+    for path in sources:
+        src = open(path, encoding="utf-8").read()
+        package = re.search(r"^\s*package\s+([\w.]+)\s*;", src, re.M)
+        package = package.group(1) if package else ""
+        name = os.path.splitext(os.path.basename(path))[0]
+        classes[name] = (package.replace(".", "/") + "/" if package else "") + name
+        parsed.append((path, package, name, src))
+    for entry in (_opt(args, "-cp") or "").split(os.pathsep):
+        if os.path.isdir(entry):
+            for dirpath, _, filenames in os.walk(entry):
+                for filename in filenames:
+                    if filename.endswith(".class"):
+                        rel = os.path.relpath(os.path.join(dirpath, filename), entry)[:-6].replace(os.sep, "/")
+                        classes.setdefault(rel.rsplit("/", 1)[-1], rel)
+
+    for path, package, name, src in parsed:
+        pool = []
+
+        def utf8(value):
+            pool.append(b"\x01" + struct.pack(">H", len(value)) + value.encode())
+            return len(pool)
+
+        def class_ref(value):
+            index = utf8(value)
+            pool.append(b"\x07" + struct.pack(">H", index))
+            return len(pool)
+
+        this = class_ref(classes[name])
+        super_class = class_ref("java/lang/Object")
+        source_file, source_name = utf8("SourceFile"), utf8(os.path.basename(path))
+        for simple, internal in classes.items():
+            if simple != name and re.search(r"\b" + re.escape(simple) + r"\b", src):
+                class_ref(internal)
+        data = b"\xca\xfe\xba\xbe\x00\x00\x00\x34" + struct.pack(">H", len(pool) + 1) + b"".join(pool)
+        data += struct.pack(">HHHHHHH", 0x21, this, super_class, 0, 0, 0, 1)
+        data += struct.pack(">HIH", source_file, 2, source_name)
+        target_dir = os.path.join(out, *package.split(".")) if package else out
+        os.makedirs(target_dir, exist_ok=True)
+        with open(os.path.join(target_dir, name + ".class"), "wb") as f:
+            f.write(data)
+
+
+def d8(args):
+    out = _opt(args, "--output")
+    inputs = [a for a in args if a.endswith((".class", ".dex"))]
+    _simulate("d8", inputs)
+    if "--file-per-class" in args:
+        for path in inputs:
+            data = open(path, "rb").read()
+            length = struct.unpack_from(">H", data, 11)[0]  # First pool entry: this class' internal name
+            target = os.path.join(out, data[13:13 + length].decode() + ".dex")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(b"dex\n035\0" + data)
+        return
+    with open(os.path.join(out, "classes.dex"), "wb") as f:
+        f.write(b"dex\n035\0")
+        for path in inputs:
+            f.write(open(path, "rb").read())
+
+
+def zipalign(args):
+    _simulate("zipalign", [args[-2]])
+    shutil.copyfile(args[-2], args[-1])
+
+
+def apksigner(args):
+    _simulate("apksigner", [args[-1]])
+    shutil.copyfile(args[-1], _opt(args, "--out"))
+
+
+def keytool(args):
+    _simulate("keytool", [])
+    with open(_opt(args, "-keystore"), "wb") as f:
+        f.write(b"fake keystore")
+
+
+TOOLS = {"aapt2": aapt2, "javac": javac, "d8": d8, "zipalign": zipalign, "apksigner": apksigner, "keytool": keytool}
+
+
+def main(tool, argv):
+    TOOLS[tool](argv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
@@ -0,0 +1,134 @@
+"""Deterministic web content trees, icons and splash screens for the benchmarks."""
+import os
+import random
+
+# Tree size -> number of files per kind and average media file size (KB)
+TREES = {
+    "small": {"pages": 4, "scripts": 6, "styles": 2, "media": 8, "media_kb": 24},
+    "medium": {"pages": 40, "scripts": 120, "styles": 20, "media": 200, "media_kb": 48},
+    "huge": {"pages": 400, "scripts": 1500, "styles": 200, "media": 2000, "media_kb": 32},
+}
+
+_JS_LINES = [
+    "  // {name}: keeps the {word} state in sync",
+    "  const {name} = document.querySelector('#{word}');",
+    "  if ({name} && {name}.dataset.{word}) {{ {name}.classList.add('{word}-ready'); }}",
+    "  function {name}Handler(event) {{ return event.target.value + \"{word}\"; }}",
+    "  /* {word} */ var {name}Count = {number} * 2 / 3;",
+]
+_CSS_LINES = [
+    ".{word}-{name} {{\n  margin: {number}px auto;\n  color: #{color};\n}}",
+    "/* {word} block */\n#{name} > .{word} {{ padding: 0 {number}px; }}",
+]
+_WORDS = ["menu", "header", "footer", "gallery", "slider", "modal", "cart", "search", "profile", "feed"]
+
+
+def make_web_tree(root, size, seed=0):
+    """Writes a site of the given TREES size under root (idempotent). Returns root."""
+    spec = TREES[size]
+    marker = root.rstrip(os.sep) + ".complete"  # Next to the tree so it is not shipped as content
+    if os.path.exists(marker):
+        return root
+    rng = random.Random(seed)
+    for i in range(spec["pages"]):
+        name = "index.html" if i == 0 else os.path.join(f"section{i % 10}", f"page{i}.html")
+        _write(root, name, _html_page(rng, i, spec))
+    for i in range(spec["scripts"]):
+        source = _text(rng, _JS_LINES, 40 + rng.randrange(200), "(function () {\n", "})();\n")
+        _write(root, os.path.join("js", f"module{i % 20}", f"script{i}.js"), source)
+        if i % 10 == 0:
+            _write(root, os.path.join("js", f"module{i % 20}", f"script{i}.js.map"), '{"version":3,"mappings":""}')
+    for i in range(spec["styles"]):
+        _write(root, os.path.join("css", f"style{i}.css"), _text(rng, _CSS_LINES, 60 + rng.randrange(200)))
+    for i in range(spec["media"]):
+        ext = (".png", ".jpg", ".woff2", ".mp4")[i % 4]
+        data = _random_bytes(rng, int(spec["media_kb"] * 1024 * (0.5 + rng.random())))
+        _write(root, os.path.join("media", f"group{i % 50}", f"asset{i}{ext}"), data)
+    with open(marker, "w"):
+        pass
+    return root
+
+
+def make_images(root, seed=0):
+    """Writes a 1024x1024 icon and a 1242x2688 splash (gradients with noise). Returns (icon, splash) paths."""
+    from PIL import Image
+
+    os.makedirs(root, exist_ok=True)
+    paths = []
+    for name, size in (("icon.png", (1024, 1024)), ("splash.png", (1242, 2688))):
+        path = os.path.join(root, name)
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        rng = random.Random(f"{seed}-{name}")
+        gradient = Image.linear_gradient("L").resize(size)
+        bands = [gradient, gradient.rotate(90).resize(size), gradient.transpose(Image.FLIP_TOP_BOTTOM)]
+        image = Image.merge("RGB", bands)
+        noise = Image.frombytes("RGB", size, _random_bytes(rng, size[0] * size[1] * 3))
+        Image.blend(image, noise, 0.1).save(path)
+    return tuple(paths)
+
+
+def make_config(title, web_dir=None, icon=None, splash=None, output_dir=None):
+    """A project config like the GUI's get_config() produces."""
+    return {
+        "app_title": title,
+        "package_name": "com.example." + "".join(c for c in title.lower() if c.isalnum()),
+        "version_name": "1.0.0",
+        "version_code": 1,
+        "output_dir": output_dir or "",
+        "web_mode": "Local Folder" if web_dir else "URL (Remote)",
+        "web_path": web_dir or "",
+        "url": "https://example.com",
+        "start_page": "index.html",
+        "optimize_web_assets": False,
+        "icon_path": icon or "",
+        "splash_path": splash or "",
+        "splash_duration": 2000,
+        "orientation": "Auto Rotate",
+        "image_optimization": "None",
+        "show_status_bar": True,
+        "show_nav_bar": True,
+        "enable_js": True,
+        "enable_dom": True,
+        "enable_file_access": True,
+        "user_agent": "",
+        "headers": "",
+        "extras": {},
+        "build_variant": "Debug",
+        "auto_sign": True,
+        "custom_ks": {},
+        "ios": {"bundle_id": "com.example.bench", "display_name": title, "build_num": 1},
+    }
+
+
+def _html_page(rng, index, spec):
+    scripts = "".join(f'  <script src="/js/module{j % 20}/script{j}.js"></script>\n'
+                      for j in rng.sample(range(spec["scripts"]), min(5, spec["scripts"])))
+    body = "\n".join(f"    <p class=\"{rng.choice(_WORDS)}\">  {' '.join(rng.choices(_WORDS, k=12))}  </p>"
+                     for _ in range(20 + rng.randrange(80)))
+    return (f"<!DOCTYPE html>\n<html>\n<head>\n  <title>Page {index}</title>\n"
+            f"  <link rel=\"stylesheet\" href=\"/css/style0.css\">\n{scripts}</head>\n"
+            f"<body>\n  <!-- page {index} -->\n  <main>\n{body}\n  </main>\n</body>\n</html>\n")
+
+
+def _text(rng, lines, count, head="", tail=""):
+    out = [head]
+    for _ in range(count):
+        out.append(rng.choice(lines).format(name=rng.choice(_WORDS) + str(rng.randrange(100)),
+                                            word=rng.choice(_WORDS), number=rng.randrange(1, 64),
+                                            color=f"{rng.randrange(0x1000000):06x}") + "\n")
+    out.append(tail)
+    return "".join(out)
+
+
+def _random_bytes(rng, count):
+    return rng.getrandbits(count * 8).to_bytes(count, "little") if count else b""
+
+
+def _write(root, rel, content):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = "wb" if isinstance(content, bytes) else "w"
+    with open(path, mode, **({} if mode == "wb" else {"encoding": "utf-8"})) as f:
+        f.write(content)
@@ -0,0 +1,253 @@
+"""
+Benchmarks for the generate-and-build pipeline.
+
+Runs ProjectGenerator.generate, IOSProjectGenerator.generate, the image
+pipeline and BuildEngine.build against deterministic small/medium/huge web
+content trees, with the toolchain replaced by stand-ins that simulate the
+real tools' latency (benchmarks/fake_tool.py), so numbers are reproducible
+on any Linux or macOS box without the Android SDK:
+
+    python -m benchmarks.run                      # small + medium
+    python -m benchmarks.run --sizes huge --repeat 3
+    python -m benchmarks.run --latency 0          # pipeline overhead only
+
+Every run is appended to bench_history.jsonl together with the git commit
+and compared against the latest run of a different commit (or --baseline
+COMMIT); medians that got slower than --threshold are reported as
+regressions, and --fail-on-regression turns them into a non-zero exit.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks.fixtures import TREES, make_config, make_images, make_web_tree  # noqa: E402
+from benchmarks.toolchain import create_toolchain  # noqa: E402
+
+TEMPLATE_DIR = os.path.join(REPO_DIR, "assets", "template")
+TEMPLATE_IOS_DIR = os.path.join(REPO_DIR, "assets", "template_ios")
+HISTORY_FILE = os.path.join(REPO_DIR, "bench_history.jsonl")
+NOISE_FLOOR = 0.005  # Seconds; smaller median changes are never reported as regressions
+
+
+class Case:
+    """One benchmark: setup() runs untimed before every timed run()."""
+
+    def __init__(self, name, run, setup=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+
+    def measure(self, repeat):
+        times = []
+        for _ in range(repeat):
+            if self.setup:
+                self.setup()
+            start = time.perf_counter()
+            self.run()
+            times.append(time.perf_counter() - start)
+        return {"median": statistics.median(times), "min": min(times), "runs": [round(t, 6) for t in times]}
+
+
+def _reset_process_caches():
+    """Forgets the in-memory image and template caches so a run starts like a fresh process."""
+    from builder import images, templates
+    images._shared = None
+    templates._environments.clear()
+
+
+def _fresh_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def build_cases(work_dir, base_dir, sizes):
+    from builder.engine import BuildEngine
+    from builder.generator import ICON_DENSITIES, SPLASH_DENSITIES, ProjectGenerator
+    from builder.generator_ios import IOSProjectGenerator
+    from builder.images import ImagePipeline
+
+    icon, splash = make_images(os.path.join(work_dir, "images"))
+    cache_root = os.environ["XDG_CACHE_HOME"]
+
+    def cold():
+        _reset_process_caches()
+        _fresh_dir(cache_root)
+
+    cases = []
+    image_cache = os.path.join(work_dir, "image-cache")
+
+    def render_images(cache_dir):
+        # What the generator asks for: every icon density, every splash bucket as lossy WebP
+        pipeline = ImagePipeline(cache_dir=cache_dir)
+        pipeline.render(icon, ICON_DENSITIES.values())
+        source = ImagePipeline.source_size(splash)
+        sizes = {ProjectGenerator._splash_size(source, screen) for screen in SPLASH_DENSITIES.values()}
+        pipeline.render(splash, sizes, fmt="webp", lossless=False)
+
+    cases.append(Case("images/cold", lambda: render_images(None)))
+    cases.append(Case("images/disk-cache", lambda: render_images(image_cache),
+                      setup=lambda: render_images(image_cache)))
+
+    for size in sizes:
+        web_dir = make_web_tree(os.path.join(work_dir, "sites", size), size)
+        project = os.path.join(work_dir, "projects", size)
+        config = make_config(f"Bench {size}", web_dir, icon, splash, project)
+        optimized = dict(config, optimize_web_assets=True, image_optimization="WebP")
+
+        # Generators are created inside the timed runs, as every build does
+        def android(c):
+            return lambda: ProjectGenerator(TEMPLATE_DIR).generate(c, c["output_dir"])
+
+        def ios(c):
+            return lambda: IOSProjectGenerator(TEMPLATE_IOS_DIR).generate(c, c["output_dir"])
+
+        def fresh_project(project=project):
+            cold()
+            _fresh_dir(project)
+
+        cases += [
+            Case(f"generate_android/{size}/cold", android(config), setup=fresh_project),
+            Case(f"generate_android/{size}/warm", android(config)),
+            Case(f"generate_android/{size}/optimized-cold", android(optimized), setup=fresh_project),
+            Case(f"generate_ios/{size}/cold", ios(config), setup=fresh_project),
+            Case(f"generate_ios/{size}/warm", ios(config)),
+        ]
+
+        def generate(c=config):
+            _fresh_dir(c["output_dir"])
+            ProjectGenerator(TEMPLATE_DIR).generate(c, c["output_dir"])
+
+        def build(c=config, use_cache=True):
+            engine = BuildEngine(base_dir, logger_callback=lambda msg: None, use_cache=use_cache, use_daemon=False)
+            if not engine.build(c["output_dir"]):
+                raise RuntimeError(f"Build of {c['app_title']} failed")
+
+        cases += [
+            Case(f"build/{size}/full", lambda build=build: build(use_cache=False), setup=generate),
+            Case(f"build/{size}/incremental", build),
+        ]
+    return cases
+
+
+def run(args):
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    # Keep every per-user cache (images, web assets, Jinja bytecode, tools) inside the work dir
+    os.environ["XDG_CACHE_HOME"] = os.path.join(work_dir, "cache")
+    os.environ["W2A_BENCH_LATENCY"] = str(args.latency)
+    base_dir, jdk_dir = create_toolchain(os.path.join(work_dir, "toolchain"))
+    os.environ["PATH"] = jdk_dir + os.pathsep + os.environ.get("PATH", "")
+
+    results = {}
+    for case in build_cases(work_dir, base_dir, args.sizes):
+        if args.filter and args.filter not in case.name:
+            continue
+        results[case.name] = case.measure(args.repeat)
+        print(f"{case.name:<42} median {results[case.name]['median'] * 1000:9.1f} ms   "
+              f"min {results[case.name]['min'] * 1000:9.1f} ms", flush=True)
+    return results
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def record(results, args):
+    entry = {
+        "commit": _git("rev-parse", "HEAD") or "unknown",
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": f"{platform.system()} {platform.machine()} python {platform.python_version()}",
+        "latency": args.latency,
+        "results": results,
+    }
+    with open(args.history, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def find_baseline(entry, args):
+    """Latest earlier run from another commit (or from --baseline) on the same machine and latency."""
+    try:
+        with open(args.history, encoding="utf-8") as f:
+            history = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return None
+    for old in reversed(history[:-1]):
+        if old["machine"] != entry["machine"] or old["latency"] != entry["latency"]:
+            continue
+        if args.baseline and old["commit"].startswith(args.baseline):
+            return old
+        if not args.baseline and old["commit"] != entry["commit"]:
+            return old
+    return None
+
+
+def compare(entry, baseline, threshold):
+    """Prints the change of every median against the baseline. Returns the names of regressed cases."""
+    print(f"\nCompared with {baseline['commit'][:10]} ({baseline['time']}):")
+    regressions = []
+    for name, result in entry["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            continue
+        change = (result["median"] - old["median"]) / old["median"] if old["median"] else 0.0
+        regressed = change > threshold and result["median"] - old["median"] > NOISE_FLOOR
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<42} {old['median'] * 1000:9.1f} -> {result['median'] * 1000:9.1f} ms  "
+              f"{change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Pipeline benchmarks")
+    parser.add_argument("--sizes", default="small,medium",
+                        help=f"Comma-separated web tree sizes: {', '.join(TREES)} or 'all' (default: small,medium)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (default: 3)")
+    parser.add_argument("--latency", type=float, default=1.0,
+                        help="Scale of the simulated tool latency, 0 to disable it (default: 1.0)")
+    parser.add_argument("--filter", help="Only run cases whose name contains this string")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "website2app-bench"),
+                        help="Where fixtures and projects are created (fixtures are reused between runs)")
+    parser.add_argument("--history", default=HISTORY_FILE, help="Run history used to track regressions")
+    parser.add_argument("--baseline", metavar="COMMIT", help="Compare with the latest run of this commit")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative slowdown of a median reported as a regression (default: 0.10)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    parser.add_argument("--json", metavar="FILE", help="Also write this run's results to FILE")
+    args = parser.parse_args(argv)
+    args.sizes = list(TREES) if args.sizes == "all" else [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in args.sizes if s not in TREES]
+    if unknown:
+        parser.error(f"Unknown size(s): {', '.join(unknown)}")
+
+    entry = record(run(args), args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=1)
+    baseline = find_baseline(entry, args)
+    if baseline is None:
+        print("\nNo earlier run of another commit to compare with yet.")
+        return 0
+    regressions = compare(entry, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}.")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""Lays out a stubbed build toolchain that BuildEngine runs like the real one."""
+import os
+import stat
+import sys
+import zipfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Wrapper name -> fake_tool entry; names follow what BuildEngine looks up in bin/ and on PATH
+BIN_TOOLS = {"aapt2.exe": "aapt2", "d8": "d8", "apksigner": "apksigner", "zipalign.exe": "zipalign"}
+JDK_TOOLS = {"javac": "javac", "keytool": "keytool", "java": None}
+
+_WRAPPER = """#!{python}
+import sys
+sys.path.insert(0, {bench_dir!r})
+from fake_tool import main
+sys.exit(main({tool!r}, sys.argv[1:]))
+"""
+_JAVA = """#!{python}
+print('openjdk version "17.0.0" (benchmark stand-in)')
+"""
+
+
+def create_toolchain(root):
+    """
+    Creates root/base (a BuildEngine base dir with bin/ and android.jar) and
+    root/jdk (java, javac and keytool for PATH). Returns (base_dir, jdk_dir).
+    """
+    base_dir = os.path.join(root, "base")
+    bin_dir = os.path.join(base_dir, "bin")
+    jdk_dir = os.path.join(root, "jdk")
+    os.makedirs(bin_dir, exist_ok=True)
+    os.makedirs(jdk_dir, exist_ok=True)
+    for name, tool in BIN_TOOLS.items():
+        _write_script(os.path.join(bin_dir, name), tool)
+    for name, tool in JDK_TOOLS.items():
+        _write_script(os.path.join(jdk_dir, name), tool)
+    with zipfile.ZipFile(os.path.join(bin_dir, "android.jar"), "w") as z:
+        z.writestr("android/app/Activity.class", b"\xca\xfe\xba\xbe")
+    return base_dir, jdk_dir
+
+
+def _write_script(path, tool):
+    template = _JAVA if tool is None else _WRAPPER
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(template.format(python=sys.executable, bench_dir=BENCH_DIR, tool=tool))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
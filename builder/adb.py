@@ -0,0 +1,397 @@
+import fnmatch
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from builder.apk import read_manifest
+from builder.cache import file_sha256
+from builder.process import BuildCancelled, ProcessRunner, ProcessTimeout
+
+ADB_PORT = 5037  # Default adb server port; ANDROID_ADB_SERVER_PORT overrides it, as for adb itself
+MAX_PARALLEL_INSTALLS = 32  # Concurrent `adb install` processes in install_all
+INSTALL_TIMEOUT = 300  # Seconds one device may take to install before its adb process is killed
+QUERY_TIMEOUT = 30  # Seconds for the `adb shell` query of the installed package's digest and version
+UNCHANGED = "Unchanged"  # install_apk()'s message when the device already had the APK
+PACKAGE_NAME = re.compile(r'^[A-Za-z0-9_.]+$')  # Only such names are put into the device shell command
+RECONNECT_DELAY = 1.0  # Seconds DeviceTracker waits before reconnecting to a restarted adb server
+
+
+class AdbError(Exception):
+    pass
+
+
+def server_port():
+    try:
+        return int(os.environ.get("ANDROID_ADB_SERVER_PORT", ADB_PORT))
+    except ValueError:
+        return ADB_PORT
+
+
+def parse_devices(text):
+    """
+    Parses `adb devices` / `adb devices -l` output (and the adb server's
+    host:devices replies) into dicts: {"serial", "state", plus any
+    key:value fields of the long format such as "model" or "product"}.
+    """
+    devices = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("List of devices", "*")):
+            continue
+        if '\t' in line:
+            serial, rest = line.split('\t', 1)
+            fields = rest.split()
+        else:
+            serial, _, rest = line.partition(' ')
+            fields = rest.split()
+        if not fields:
+            continue
+        device = {"serial": serial, "state": fields[0]}
+        for field in fields[1:]:
+            key, sep, value = field.partition(':')
+            if sep:
+                device[key] = value
+        devices.append(device)
+    return devices
+
+
+def select_devices(devices, patterns=None):
+    """
+    Devices that are online and match any of patterns (all when empty).
+    A pattern is a glob on the serial or the model ("emulator-*",
+    "Pixel_7*"), or on one long-format field ("product:cheetah").
+    """
+    online = [d for d in devices if d["state"] == "device"]
+    if not patterns:
+        return online
+    selected = []
+    for device in online:
+        for pattern in patterns:
+            key, sep, value = pattern.partition(':')
+            if sep and key in device and fnmatch.fnmatchcase(device[key], value):
+                break
+            if fnmatch.fnmatchcase(device["serial"], pattern) or fnmatch.fnmatchcase(device.get("model", ""), pattern):
+                break
+        else:
+            continue
+        selected.append(device)
+    return selected
+
+
+class AdbServer:
+    """
+    Minimal client for the adb server's host protocol on its loopback port
+    (the same requests `adb devices` and `adb track-devices` send): each
+    request is a 4 hex digit length plus the service name, answered by
+    OKAY or FAIL, followed by length-prefixed messages.
+    """
+
+    def __init__(self, port=None):
+        self.port = port or server_port()
+
+    def connect(self, service, timeout=5):
+        """Opens a connection and requests service. Returns the socket, positioned at the first message."""
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=timeout)
+        try:
+            request = service.encode('utf-8')
+            sock.sendall(b"%04x" % len(request) + request)
+            status = _recv_exact(sock, 4)
+            if status == b"FAIL":
+                raise AdbError(read_message(sock))
+            if status != b"OKAY":
+                raise AdbError(f"Unexpected adb server reply: {status!r}")
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def query(self, service):
+        with self.connect(service) as sock:
+            return read_message(sock)
+
+
+def read_message(sock):
+    """One length-prefixed message; raises EOFError when the server closes the connection."""
+    length = int(_recv_exact(sock, 4), 16)
+    return _recv_exact(sock, length).decode('utf-8', errors='replace')
+
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("adb server closed the connection")
+        data += chunk
+    return data
+
+
+class DeviceTracker:
+    """
+    Keeps the list of connected devices current by following the adb
+    server's track-devices stream in a daemon thread, instead of running
+    `adb devices` on a timer. The server pushes the full list whenever a
+    device connects, disconnects or changes state; on_change(devices) is
+    called with it from the tracker thread. If the server goes away (e.g.
+    `adb kill-server`) the tracker restarts it and reconnects.
+    """
+
+    def __init__(self, adb, on_change=None):
+        self.adb = adb
+        self.on_change = on_change
+        self.devices = []
+        self._changed = threading.Condition()
+        self._stopped = threading.Event()
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="adb-track-devices", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait_for(self, predicate, timeout=None):
+        """Blocks until predicate(devices) is true or timeout passes. Returns the last device list."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while not predicate(self.devices) and not self._stopped.is_set():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return list(self.devices)
+
+    def _run(self):
+        long_format = True
+        while not self._stopped.is_set():
+            try:
+                self._sock = self.adb.server.connect("host:track-devices-l" if long_format else "host:track-devices",
+                                                     timeout=None)
+                while not self._stopped.is_set():
+                    self._update(parse_devices(read_message(self._sock)))
+            except AdbError as e:
+                if long_format:
+                    long_format = False  # Servers older than platform-tools 29 only have the short form
+                    continue
+                self.adb.log(f"Device tracking failed: {str(e)}")
+                return
+            except (OSError, EOFError, ValueError):
+                if self._stopped.is_set():
+                    return
+                self._update([])
+                self._stopped.wait(RECONNECT_DELAY)
+                if not self._stopped.is_set() and not self.adb.start_server():
+                    self.adb.log("Device tracking stopped: adb is not available.")
+                    return
+            finally:
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+
+    def _update(self, devices):
+        with self._changed:
+            if devices == self.devices:
+                return
+            self.devices = devices
+            self._changed.notify_all()
+        if self.on_change:
+            self.on_change(list(devices))
+
+
+class ADBManager:
+    """
+    Lists devices and installs APKs through adb. Device lists come from
+    the adb server's socket (started with `adb start-server` when it is not
+    running yet); installs run `adb install` through a ProcessRunner so
+    their output is streamed and they can be cancelled.
+
+    Before installing, the device is asked for the SHA-256 and versionCode
+    of the APK it has installed for the same package (`pm path` plus
+    `sha256sum`, one `adb shell` round trip); when both match the local
+    APK the install is skipped. Changed APKs go through plain
+    `adb install`, which streams the APK into the package manager
+    (`cmd package install -S`) on Android 7+ instead of pushing it to
+    /data/local/tmp first; adb falls back to push + pm install by itself
+    on older devices.
+    """
+
+    def __init__(self, tools_dir, logger=None, port=None):
+        self.adb = os.path.join(tools_dir, "adb.exe")
+        self.logger = logger
+        self.server = AdbServer(port)
+        self.runner = ProcessRunner(logger=self.log, timeout=INSTALL_TIMEOUT)
+        self.query_runner = ProcessRunner(timeout=QUERY_TIMEOUT)  # Not logged: its output is parsed
+
+    def log(self, msg):
+        if self.logger: self.logger(msg)
+
+    def start_server(self):
+        """Starts the adb server if it is not running. Returns False if adb could not be run."""
+        try:
+            res = self.runner.run([self.adb, "start-server"], name="adb", timeout=30)
+        except (OSError, ProcessTimeout) as e:
+            self.log(f"Could not start the adb server: {str(e)}")
+            return False
+        return res.returncode == 0
+
+    def devices(self):
+        """Every device the adb server knows, as parse_devices() dicts (including offline/unauthorized ones)."""
+        for attempt in range(2):
+            try:
+                try:
+                    return parse_devices(self.server.query("host:devices-l"))
+                except AdbError:
+                    return parse_devices(self.server.query("host:devices"))
+            except (OSError, EOFError, ValueError, AdbError):
+                if attempt or not self.start_server():
+                    return []
+        return []
+
+    def list_devices(self):
+        return [d["serial"] for d in self.devices() if d["state"] == "device"]
+
+    def track(self, on_change=None):
+        """Starts and returns a DeviceTracker following device changes."""
+        return DeviceTracker(self, on_change).start()
+
+    def cancel(self):
+        """Kills running installs; install_all marks the remaining devices as cancelled."""
+        self.runner.cancel()
+        self.query_runner.cancel()
+
+    def local_state(self, apk_path):
+        """{"package", "version_code", "sha256"} of a local APK; package is None if its manifest is unreadable."""
+        try:
+            package, version_code = read_manifest(apk_path)
+        except (OSError, ValueError, KeyError) as e:
+            self.log(f"Could not read the package name from {os.path.basename(apk_path)}: {str(e)}")
+            package, version_code = None, None
+        return {"package": package, "version_code": version_code, "sha256": file_sha256(apk_path)}
+
+    def installed_state(self, device_id, package):
+        """
+        {"sha256", "version_code"} of package's base APK on the device (None
+        for what could not be found out, e.g. the package is not installed).
+        """
+        state = {"sha256": None, "version_code": None}
+        if not package or not PACKAGE_NAME.match(package):
+            return state
+        script = (f"pm path {package} | head -n 1 | cut -d: -f2 | xargs -r sha256sum; "
+                  f"dumpsys package {package} | grep -m 1 versionCode=")
+        try:
+            res = self.query_runner.run([self.adb, "-s", device_id, "shell", script], name=f"adb {device_id}")
+        except (OSError, ProcessTimeout, BuildCancelled):
+            return state  # After a cancel, the install itself reports the device as cancelled
+        digest = re.search(r'^([0-9a-f]{64})\s', res.stdout, re.MULTILINE)
+        version = re.search(r'versionCode=(\d+)', res.stdout)
+        if digest:
+            state["sha256"] = digest.group(1)
+        if version:
+            state["version_code"] = int(version.group(1))
+        return state
+
+    def install_apk(self, device_id, apk_path, force=False, local=None):
+        """
+        Installs apk_path unless the device already has the identical APK
+        (unless force). local is local_state(apk_path) when the caller has
+        it already. Returns (success, message).
+        """
+        if not os.path.exists(apk_path):
+            return False, "APK file not found."
+
+        if not force:
+            local = local or self.local_state(apk_path)
+            installed = self.installed_state(device_id, local["package"])
+            if installed["sha256"] and installed["sha256"] == local["sha256"] \
+                    and installed["version_code"] == local["version_code"]:
+                self.log(f"{device_id} already has this build of {local['package']}, skipping install.")
+                return True, UNCHANGED
+
+        self.log(f"Installing to {device_id}...")
+        cmd = [self.adb, "-s", device_id, "install", "-r", apk_path]
+        try:
+            res = self.runner.run(cmd, name=f"adb {device_id}")
+        except BuildCancelled:
+            return False, "Cancelled"
+        except Exception as e:
+            self.log(f"Install Failed ({device_id}): {str(e)}")
+            return False, str(e)
+        output = "\n".join(s for s in (res.stdout, res.stderr) if s)
+        # Older adb versions exit with 0 after "Failure [INSTALL_FAILED_...]"
+        if res.returncode == 0 and "Failure" not in output:
+            self.log(f"Install Successful! ({device_id})")
+            return True, "Success"
+        message = next((line for line in reversed(output.splitlines()) if line.strip()), "adb install failed")
+        self.log(f"Install Failed ({device_id}): {message}")
+        return False, message
+
+    def install_all(self, apk_path, patterns=None, devices=None, on_result=None, max_workers=None, force=False):
+        """
+        Installs apk_path on every online device matching patterns (see
+        select_devices) at the same time, so N devices take about as long as
+        the slowest one. devices is a device list to select from instead of
+        asking the server. Devices that already have the identical APK are
+        skipped unless force. Returns one result dict per device, in the order
+        they finished; on_result(result) is called as each one does.
+        """
+        selected = select_devices(self.devices() if devices is None else devices, patterns)
+        if not selected:
+            return []
+        if not os.path.exists(apk_path):
+            return [self._result(d, False, "APK file not found.", 0.0) for d in selected]
+
+        self.log(f"Installing {os.path.basename(apk_path)} to {len(selected)} device(s)...")
+        local = None if force else self.local_state(apk_path)  # Hashed once for all devices
+        results = []
+        workers = min(len(selected), max_workers or MAX_PARALLEL_INSTALLS)
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {pool.submit(self._install_timed, d, apk_path, force, local): d for d in selected}
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if on_result:
+                    on_result(result)
+        except BaseException:
+            # e.g. Ctrl-C: kill the running installs instead of waiting for them in shutdown()
+            self.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+        failed = sum(1 for r in results if not r["success"])
+        skipped = sum(1 for r in results if r["skipped"])
+        self.log(f"Installed on {len(results) - failed} of {len(results)} device(s) ({skipped} already up to date).")
+        return results
+
+    def _install_timed(self, device, apk_path, force, local):
+        started = time.time()
+        if self.runner.cancelled:
+            return self._result(device, False, "Cancelled", 0.0)
+        success, message = self.install_apk(device["serial"], apk_path, force=force, local=local)
+        return self._result(device, success, message, time.time() - started)
+
+    @staticmethod
+    def _result(device, success, message, seconds):
+        return {
+            "serial": device["serial"],
+            "model": device.get("model"),
+            "success": success,
+            "skipped": success and message == UNCHANGED,
+            "message": message,
+            "seconds": round(seconds, 3)
+        }
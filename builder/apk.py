@@ -0,0 +1,203 @@
+import os
+import struct
+import zipfile
+import zlib
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_OF_CENTRAL_DIR = struct.Struct('<IHHHHIIH')
+
+LOCAL_SIG = 0x04034b50
+CENTRAL_SIG = 0x02014b50
+EOCD_SIG = 0x06054b50
+ALIGNMENT_EXTRA_ID = 0xd935  # Same extra field apksigner/zipalign -p use for alignment padding
+DOS_EPOCH = (0, (1 << 5) | 1)  # 1980-01-01 00:00, fixed so identical inputs give identical APKs
+
+# Formats that are already compressed: deflating them again only costs time
+DEFAULT_NO_COMPRESS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp3", ".mp4", ".m4a", ".ogg", ".wav", ".webm",
+    ".woff", ".woff2", ".zip", ".gz", ".br", ".jar", ".apk", ".arsc", ".avif", ".heic", ".m4v", ".mov", ".aac",
+    ".opus", ".flac", ".mkv", ".xz", ".bz2", ".zst", ".7z"
+}
+
+
+class ApkWriter:
+    """
+    Single-pass APK writer.
+
+    Streams entries (raw-copied from the aapt2 output, classes.dex, assets)
+    into one archive whose stored entries are already 4-byte aligned, and
+    page-aligned for native libraries, so no zipalign pass is needed.
+    """
+
+    def __init__(self, path, alignment=4, lib_alignment=4096, no_compress=None, level=6):
+        self.path = path
+        self.alignment = alignment
+        self.lib_alignment = lib_alignment
+        self.no_compress = DEFAULT_NO_COMPRESS if no_compress is None else set(no_compress)
+        self.level = level
+        self._entries = []  # (name_bytes, flags, method, crc, csize, usize, offset)
+        self._names = set()
+        self._fp = open(path, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._fp.close()
+
+    def should_compress(self, name):
+        return os.path.splitext(name)[1].lower() not in self.no_compress
+
+    def add_bytes(self, name, data, compress=None):
+        if compress is None:
+            compress = self.should_compress(name)
+        crc = zlib.crc32(data) & 0xffffffff
+        method = zipfile.ZIP_STORED
+        payload = data
+        if compress and data:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+            deflated = compressor.compress(data) + compressor.flush()
+            if len(deflated) < len(data):
+                method, payload = zipfile.ZIP_DEFLATED, deflated
+        self._write_entry(name, method, crc, payload, len(data))
+
+    def add_file(self, name, src_path, compress=None):
+        with open(src_path, 'rb') as f:
+            self.add_bytes(name, f.read(), compress)
+
+    def add_tree(self, prefix, root, compress=None):
+        """Adds every file under root as prefix/<relative path>, in a stable order."""
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                rel = os.path.relpath(path, root).replace(os.sep, '/')
+                self.add_file(f"{prefix}/{rel}", path, compress)
+
+    def add_zip_entries(self, zip_path, exclude=()):
+        """Copies entries of another zip (e.g. aapt2's output) without recompressing them."""
+        with zipfile.ZipFile(zip_path) as src, open(zip_path, 'rb') as raw:
+            for info in src.infolist():
+                if info.filename in exclude or info.is_dir():
+                    continue
+                if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                    self.add_bytes(info.filename, src.read(info.filename))
+                    continue
+                raw.seek(info.header_offset)
+                header = LOCAL_HEADER.unpack(raw.read(LOCAL_HEADER.size))
+                raw.seek(header[9] + header[10], os.SEEK_CUR)
+                payload = raw.read(info.compress_size)
+                self._write_entry(info.filename, info.compress_type, info.CRC, payload, info.file_size)
+
+    def _write_entry(self, name, method, crc, payload, size):
+        if name in self._names:
+            raise ValueError(f"Duplicate APK entry: {name}")
+        self._names.add(name)
+        name_bytes = name.encode('utf-8')
+        flags = 0x800 if not name.isascii() else 0  # UTF-8 file name
+        offset = self._fp.tell()
+        if offset + len(payload) >= 0xffffffff:
+            raise ValueError("APK exceeds 4 GB, ZIP64 is not supported")
+
+        extra = b''
+        if method == zipfile.ZIP_STORED:
+            alignment = self.lib_alignment if name.endswith(".so") else self.alignment
+            data_start = offset + LOCAL_HEADER.size + len(name_bytes) + 6
+            padding = (-data_start) % alignment
+            extra = struct.pack('<HHH', ALIGNMENT_EXTRA_ID, 2 + padding, alignment) + b'\0' * padding
+
+        version = 20 if method == zipfile.ZIP_DEFLATED else 10
+        self._fp.write(LOCAL_HEADER.pack(LOCAL_SIG, version, flags, method, DOS_EPOCH[0], DOS_EPOCH[1],
+                                         crc, len(payload), size, len(name_bytes), len(extra)))
+        self._fp.write(name_bytes)
+        self._fp.write(extra)
+        self._fp.write(payload)
+        self._entries.append((name_bytes, flags, method, crc, len(payload), size, offset))
+
+    def close(self):
+        cd_offset = self._fp.tell()
+        for name_bytes, flags, method, crc, csize, usize, offset in self._entries:
+            version = 20 if method == zipfile.ZIP_DEFLATED else 10
+            self._fp.write(CENTRAL_HEADER.pack(CENTRAL_SIG, 20, version, flags, method, DOS_EPOCH[0], DOS_EPOCH[1],
+                                               crc, csize, usize, len(name_bytes), 0, 0, 0, 0, 0, offset))
+            self._fp.write(name_bytes)
+        cd_size = self._fp.tell() - cd_offset
+        count = len(self._entries)
+        self._fp.write(END_OF_CENTRAL_DIR.pack(EOCD_SIG, 0, 0, count, count, cd_size, cd_offset, 0))
+        self._fp.close()
+
+
+RES_XML_START_ELEMENT = 0x0102
+RES_STRING_POOL = 0x0001
+RES_XML_RESOURCE_MAP = 0x0180
+UTF8_FLAG = 0x100
+ATTR_VERSION_CODE = 0x0101021b  # android:versionCode
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+
+
+def read_manifest(apk_path):
+    """
+    (package, versionCode) from the compiled AndroidManifest.xml of an APK,
+    read straight from its binary XML; versionCode is 0 when the manifest
+    does not set one. Raises ValueError if the manifest cannot be parsed.
+    """
+    with zipfile.ZipFile(apk_path) as zf:
+        data = zf.read("AndroidManifest.xml")
+    strings, res_ids = [], []
+    pos = 8  # After the RES_XML_TYPE file header
+    try:
+        while pos + 8 <= len(data):
+            chunk_type, header_size, size = struct.unpack_from('<HHI', data, pos)
+            if size < 8:
+                break
+            if chunk_type == RES_STRING_POOL:
+                strings = _string_pool(data, pos, header_size)
+            elif chunk_type == RES_XML_RESOURCE_MAP:
+                res_ids = list(struct.unpack_from(f'<{(size - header_size) // 4}I', data, pos + header_size))
+            elif chunk_type == RES_XML_START_ELEMENT:
+                # The first element is <manifest>
+                ext = pos + header_size
+                attr_start, attr_size, attr_count = struct.unpack_from('<HHH', data, ext + 8)
+                package, version_code = None, 0
+                for i in range(attr_count):
+                    at = ext + attr_start + i * attr_size
+                    _, name, raw, value_type, value = struct.unpack_from('<IIIxxxBI', data, at)
+                    res_id = res_ids[name] if name < len(res_ids) else None
+                    if res_id is None and name < len(strings) and strings[name] == "package":
+                        package = strings[raw] if raw < len(strings) else \
+                            strings[value] if value_type == TYPE_STRING else None
+                    elif res_id == ATTR_VERSION_CODE and value_type in (TYPE_INT_DEC, TYPE_INT_HEX):
+                        version_code = value
+                return package, version_code
+            pos += size
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Malformed AndroidManifest.xml in {apk_path}: {str(e)}")
+    raise ValueError(f"No <manifest> element in {apk_path}")
+
+
+def _string_pool(data, pos, header_size):
+    count, _, flags, strings_start = struct.unpack_from('<IIII', data, pos + 8)
+    offsets = struct.unpack_from(f'<{count}I', data, pos + header_size)
+    strings = []
+    for offset in offsets:
+        at = pos + strings_start + offset
+        if flags & UTF8_FLAG:
+            at += 2 if data[at] & 0x80 else 1  # Length in UTF-16 units, then in bytes
+            length = data[at]
+            if length & 0x80:
+                length = ((length & 0x7f) << 8) | data[at + 1]
+                at += 1
+            strings.append(data[at + 1:at + 1 + length].decode('utf-8'))
+        else:
+            length = struct.unpack_from('<H', data, at)[0]
+            if length & 0x8000:
+                length = ((length & 0x7fff) << 16) | struct.unpack_from('<H', data, at + 2)[0]
+                at += 2
+            strings.append(data[at + 2:at + 2 + length * 2].decode('utf-16-le'))
+    return strings
@@ -0,0 +1,189 @@
+import os
+import re
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed
+
+from builder import trace
+from builder.engine import BuildEngine
+from builder.project_manager import read_project_file
+from builder.templates import precompile
+
+
+def _run_job(base_dir, tools, config, variant, project_dir, record_trace=False):
+    """
+    Worker entry point: generate + build one (config, variant) pair.
+
+    Runs in a separate process, so it must stay a module-level function.
+    Tools, android.jar and the debug keystore under base_dir are only read here;
+    everything written goes to the job's own project_dir. tools is the parent's
+    (jdk_tools, sdk_tools), so workers skip toolchain detection. With record_trace
+    the job's trace spans are returned under "spans".
+    """
+    if record_trace:
+        with trace.recording() as tracer:
+            with trace.span(f"job {config.get('package_name')} {variant}", "build"):
+                result = _run_job(base_dir, tools, config, variant, project_dir)
+        result["spans"] = tracer.spans
+        return result
+
+    from builder.generator import ProjectGenerator
+    from builder.images import format_image_report
+    from builder.web_assets import format_web_report
+
+    lines = []
+    started = time.time()
+    signing_config = {
+        "auto_sign": config.get("auto_sign", True),
+        "custom_ks": config.get("custom_ks", {})
+    }
+    jdk_tools, sdk_tools = tools
+    engine = BuildEngine(base_dir, logger_callback=lines.append, signing_config=signing_config, jdk_tools=jdk_tools,
+                         sdk_tools=sdk_tools)
+    try:
+        os.makedirs(project_dir, exist_ok=True)
+        with trace.span("generate android", "generate"):
+            gen = ProjectGenerator(os.path.join(base_dir, "assets", "template"))
+            stats = gen.generate(config, project_dir)
+        lines.append(format_image_report(stats["images"]))
+        if stats["web"]:
+            lines.append(format_web_report(stats["web"]))
+        success = engine.build(project_dir, variant=variant)
+    except Exception as e:
+        lines.append(f"Critical Error: {str(e)}")
+        success = False
+
+    apk = os.path.join(project_dir, f"output_{variant.lower()}.apk")
+    return {
+        "app_title": config.get("app_title"),
+        "package_name": config.get("package_name"),
+        "variant": variant,
+        "project_dir": project_dir,
+        "apk": apk if success else None,
+        "success": success,
+        "seconds": round(time.time() - started, 3),
+        "log": lines
+    }
+
+
+def _failed_result(job, message):
+    """Result dict of a job that produced no build (crashed worker or cancelled)."""
+    config, variant, project_dir = job
+    return {
+        "app_title": config.get("app_title"),
+        "package_name": config.get("package_name"),
+        "variant": variant,
+        "project_dir": project_dir,
+        "apk": None,
+        "success": False,
+        "seconds": 0,
+        "log": [message]
+    }
+
+
+class BatchBuilder:
+    """
+    Builds many project configs (and variants of each) in parallel.
+
+    Every (config, variant) pair is an independent generate + build pipeline
+    running in its own process with its own work dir:
+        <output_root>/<package_name>/<variant>/
+    Dependency checks, tool downloads and debug keystore creation happen once
+    up front in the parent so workers share those read-only resources.
+    """
+
+    def __init__(self, base_dir, logger=None, max_workers=None):
+        self.base_dir = base_dir
+        self.logger = logger
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cancelled = False
+        self._futures = []
+
+    def cancel(self):
+        """Drops the jobs that have not started yet (they are reported as cancelled); running jobs finish."""
+        self.cancelled = True
+        for future in list(self._futures):
+            future.cancel()
+
+    def log(self, msg):
+        if self.logger:
+            self.logger(msg)
+        else:
+            print(msg)
+
+    @staticmethod
+    def load_projects(paths):
+        """Reads .w2apk project files into config dicts."""
+        return [read_project_file(p) for p in paths]
+
+    def plan(self, configs, variants=None, output_root=None):
+        """Expands configs x variants into (config, variant, project_dir) jobs."""
+        jobs = []
+        seen = set()
+        for config in configs:
+            job_variants = variants or [config.get("build_variant", "Debug")]
+            root = output_root or config.get("output_dir") or os.getcwd()
+            slug = re.sub(r'[^A-Za-z0-9_.-]', '_', config.get("package_name") or config.get("app_title") or "app")
+            for variant in job_variants:
+                project_dir = os.path.join(root, slug, variant.lower())
+                if project_dir in seen:
+                    raise ValueError(f"Two batch jobs would share the work dir {project_dir}")
+                seen.add(project_dir)
+                jobs.append((config, variant, project_dir))
+        return jobs
+
+    def build(self, configs, variants=None, output_root=None, on_result=None):
+        """
+        Runs all jobs across a process pool. Returns one result dict per job,
+        on_result(result) is called as each job finishes.
+        """
+        jobs = self.plan(configs, variants, output_root)
+        if not jobs:
+            return []
+
+        engine = BuildEngine(self.base_dir, logger_callback=self.log)
+        ok, msg = engine.check_dependencies()
+        if not ok:
+            raise Exception(f"Dependency Error: {msg}")
+        # Create the shared keystore once, workers racing to generate it would corrupt it
+        engine.ensure_debug_keystore()
+        # Compile templates into the on-disk bytecode cache once instead of once per worker process
+        precompile(os.path.join(self.base_dir, "assets", "template"))
+        if self.cancelled:
+            return [_failed_result(job, "Cancelled") for job in jobs]
+
+        workers = min(self.max_workers, len(jobs))
+        self.log(f"Batch: {len(jobs)} build(s) on {workers} worker process(es)...")
+        results = []
+        # Workers record their own spans when this process is tracing; they are merged as jobs finish
+        tracer = trace.current()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_run_job, self.base_dir, (engine.jdk_tools, engine.sdk_tools), *job,
+                            record_trace=tracer is not None): job
+                for job in jobs
+            }
+            self._futures = list(futures)
+            if self.cancelled:  # cancel() ran while the jobs were being submitted
+                self.cancel()
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except CancelledError:
+                    result = _failed_result(futures[future], "Cancelled")
+                except Exception as e:
+                    result = _failed_result(futures[future], f"Worker crashed: {str(e)}")
+                spans = result.pop("spans", None)
+                if spans:
+                    tracer.extend(spans)
+                status = "OK" if result["success"] else "FAILED"
+                self.log(f"[{status}] {result['project_dir']} ({result['seconds']}s)")
+                results.append(result)
+                if on_result:
+                    on_result(result)
+
+        self._futures = []
+
+        failed = sum(1 for r in results if not r["success"])
+        self.log(f"Batch finished: {len(results) - failed} succeeded, {failed} failed.")
+        return results
+
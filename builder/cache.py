@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def user_cache_dir(*parts):
+    """Per-user cache directory shared by every project (XDG_CACHE_HOME, or LOCALAPPDATA on Windows)."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "website2app", *parts)
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's contents. Raises OSError if it cannot be read."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_state(path, version):
+    """JSON state saved by save_state(), or None if it is missing, unreadable or from another version."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if isinstance(state, dict) and state.get("version") == version else None
+
+
+def save_state(path, state):
+    """Writes JSON state atomically, so an interrupted build never leaves a half-written file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+class BuildCache:
+    """
+    Step-level build cache.
+
+    Every pipeline step is identified by a key derived from the content hashes
+    of its inputs (files, directory trees, tool binaries and plain settings).
+    When a step's key matches the recorded one and its recorded outputs are
+    still on disk untouched, the step can be skipped and its outputs reused.
+
+    File digests are memoized by (size, mtime) so large inputs such as
+    android.jar are only re-hashed when they actually change.
+    """
+
+    VERSION = 2  # Bump whenever a step's outputs change shape so old records are not reused
+    FILE_NAME = "build_cache.json"
+
+    def __init__(self, work_dir):
+        self.path = os.path.join(work_dir, self.FILE_NAME)
+        self._digests = {}  # path -> [size, mtime_ns, sha256]
+        self._steps = {}  # step name -> {"key": str, "outputs": {path: [size, mtime_ns]}}
+        self._lock = threading.RLock()  # Steps of one build run concurrently (see TaskGraph)
+        self._load()
+
+    def _load(self):
+        data = load_state(self.path, self.VERSION)
+        if data is not None:
+            self._digests = data.get("digests", {})
+            self._steps = data.get("steps", {})
+
+    def save(self):
+        with self._lock:
+            save_state(self.path, {"version": self.VERSION, "digests": self._digests, "steps": self._steps})
+
+    # Hashing helpers
+    def file_digest(self, path):
+        """Returns the sha256 of a file, or 'missing' if it does not exist."""
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return "missing"
+        entry = self._digests.get(path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        digest = file_sha256(path)
+        with self._lock:
+            self._digests[path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def tree_digest(self, root, suffix=None):
+        """Hashes every file (optionally filtered by suffix) under root, including relative paths."""
+        h = hashlib.sha256()
+        for path in self.list_files(root, suffix):
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            h.update(rel.encode('utf-8') + b'\0' + self.file_digest(path).encode('ascii') + b'\n')
+        return h.hexdigest()
+
+    @staticmethod
+    def list_files(root, suffix=None):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if suffix is None or name.endswith(suffix):
+                    files.append(os.path.join(dirpath, name))
+        return files
+
+    def key(self, files=(), trees=(), values=()):
+        """Builds a step key from input files, input directory trees and plain values."""
+        h = hashlib.sha256()
+        for path in files:
+            h.update(b'F' + self.file_digest(path).encode('ascii'))
+        for tree in trees:
+            if isinstance(tree, tuple):
+                root, suffix = tree
+            else:
+                root, suffix = tree, None
+            h.update(b'T' + self.tree_digest(root, suffix).encode('ascii'))
+        for value in values:
+            h.update(b'V' + str(value).encode('utf-8') + b'\0')
+        return h.hexdigest()
+
+    # Step records
+    def is_fresh(self, step, key):
+        """True if the step last ran with this key and its outputs are unchanged since."""
+        record = self._steps.get(step)
+        if not record or record.get("key") != key:
+            return False
+        for path, (size, mtime_ns) in record.get("outputs", {}).items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                return False
+        return True
+
+    def record(self, step, key, outputs):
+        recorded = {}
+        for path in outputs:
+            st = os.stat(path)
+            recorded[os.path.abspath(path)] = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            self._steps[step] = {"key": key, "outputs": recorded}
+            self.save()
+
+    def invalidate(self, step):
+        with self._lock:
+            if self._steps.pop(step, None) is not None:
+                self.save()
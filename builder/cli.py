@@ -0,0 +1,346 @@
+"""
+Headless command line interface.
+
+Drives ProjectGenerator, IOSProjectGenerator and BuildEngine directly without
+importing PyQt6, for build servers and CI:
+
+    website2app build project.w2apk [--variant Release] [--json]
+    website2app ios project.w2apk
+    website2app batch a.w2apk b.w2apk --variant Debug --variant Release
+    website2app install app.apk [--device 'emulator-*'] [--wait-for 20]
+    website2app check
+    website2app daemon start|stop|status
+
+With --json every progress event is printed as one JSON object per line.
+build, ios and batch accept --trace FILE and --chrome-trace FILE to record
+timing spans of every step and tool invocation (see builder/trace.py).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ProgressReporter:
+    """Emits log/status/progress/result events as plain text or JSON lines."""
+
+    def __init__(self, json_mode=False, stream=None):
+        self.json_mode = json_mode
+        self.stream = stream or sys.stdout
+
+    def emit(self, event, **data):
+        if self.json_mode:
+            data = dict(event=event, time=round(time.time(), 3), **data)
+            self.stream.write(json.dumps(data) + "\n")
+        elif event == "log":
+            self.stream.write(data["message"] + "\n")
+        elif event == "status":
+            self.stream.write(f"== {data['message']}\n")
+        elif event == "result":
+            self.stream.write(f"Result: {'SUCCESS' if data.get('success') else 'FAILED'}\n")
+        self.stream.flush()
+
+    def log(self, msg):
+        self.emit("log", message=msg)
+
+    def status(self, msg):
+        self.emit("status", message=msg)
+
+    def progress(self, percent):
+        self.emit("progress", percent=percent)
+
+    def result(self, **data):
+        self.emit("result", **data)
+
+
+def _load_config(args):
+    from builder.project_manager import read_project_file
+    config = read_project_file(args.project)
+    if getattr(args, "output", None):
+        config["output_dir"] = os.path.abspath(args.output)
+    return config
+
+
+def cmd_build(args, reporter):
+    from builder import trace
+    from builder.engine import BuildEngine
+    from builder.generator import ProjectGenerator
+    from builder.images import format_image_report
+    from builder.project_ir import generate_targets
+    from builder.web_assets import format_web_report
+
+    config = _load_config(args)
+    output_dir = config.get("output_dir")
+    if not output_dir:
+        reporter.log("Error: Valid output directory required.")
+        return False
+    os.makedirs(output_dir, exist_ok=True)
+
+    variant = args.variant or config.get("build_variant", "Debug")
+    signing_config = {
+        "auto_sign": config.get("auto_sign", True),
+        "custom_ks": config.get("custom_ks", {})
+    }
+    engine = BuildEngine(args.base_dir, logger_callback=reporter.log, signing_config=signing_config,
+                         use_cache=not args.no_cache, tool_timeout=args.tool_timeout)
+
+    reporter.status("Checking dependencies...")
+    ok, msg = engine.check_dependencies()
+    if not ok:
+        reporter.log(f"Dependency Error: {msg}")
+        return False
+    reporter.progress(20)
+
+    if args.with_ios:
+        # One shared pass: web content walked and icons decoded once for both targets
+        reporter.status("Generating Android and iOS projects...")
+        stats = generate_targets(config, output_dir, args.base_dir, clean=args.clean)["android"]
+        reporter.log(f"iOS project exported to {os.path.join(output_dir, 'WebApp_iOS')}")
+    else:
+        reporter.status("Generating project...")
+        with trace.span("generate android", "generate"):
+            gen = ProjectGenerator(os.path.join(args.base_dir, "assets", "template"))
+            stats = gen.generate(config, output_dir, clean=args.clean)
+    reporter.log(format_image_report(stats["images"]))
+    if stats["web"]:
+        reporter.log(format_web_report(stats["web"]))
+    reporter.progress(40)
+
+    reporter.status(f"Building APK ({variant} variant)...")
+    with trace.span("build apk", "build", variant=variant):
+        success = engine.build(output_dir, variant=variant)
+    reporter.progress(100)
+    apk = os.path.join(output_dir, f"output_{variant.lower()}.apk")
+    reporter.result(success=success, variant=variant, apk=apk if success else None)
+    return success
+
+
+def cmd_ios(args, reporter):
+    from builder.generator_ios import IOSProjectGenerator
+
+    config = _load_config(args)
+    output_dir = config.get("output_dir")
+    if not output_dir:
+        reporter.log("Error: Valid output directory required.")
+        return False
+    os.makedirs(output_dir, exist_ok=True)
+
+    reporter.status("Generating iOS Project...")
+    gen = IOSProjectGenerator(os.path.join(args.base_dir, "assets", "template_ios"))
+    gen.generate(config, output_dir, clean=args.clean)
+    reporter.progress(100)
+    reporter.result(success=True, project=os.path.join(output_dir, "WebApp_iOS"))
+    return True
+
+
+def cmd_batch(args, reporter):
+    from builder.batch import BatchBuilder
+
+    batch = BatchBuilder(args.base_dir, logger=reporter.log, max_workers=args.jobs)
+    configs = batch.load_projects(args.projects)
+    output_root = os.path.abspath(args.output_root) if args.output_root else None
+    total = len(batch.plan(configs, args.variant, output_root))
+    done = []
+
+    def on_result(result):
+        done.append(result)
+        reporter.emit("job", **{k: v for k, v in result.items() if k != "log"})
+        if not result["success"]:
+            for line in result["log"][-5:]:
+                reporter.log(f"    {line}")
+        reporter.progress(int(100 * len(done) / total))
+
+    reporter.status(f"Batch building {total} APK(s)...")
+    results = batch.build(configs, args.variant, output_root, on_result=on_result)
+    success = all(r["success"] for r in results)
+    reporter.result(success=success, builds=len(results), failed=sum(1 for r in results if not r["success"]))
+    return success
+
+
+def cmd_install(args, reporter):
+    from builder.adb import ADBManager, select_devices
+
+    if not os.path.exists(args.apk):
+        reporter.log(f"Error: {args.apk} not found.")
+        return False
+    adb = ADBManager(os.path.join(args.base_dir, "bin"), logger=reporter.log)
+    devices = adb.devices()
+    if args.wait_for and len(select_devices(devices, args.device)) < args.wait_for:
+        reporter.status(f"Waiting for {args.wait_for} device(s)...")
+        tracker = adb.track()
+        try:
+            devices = tracker.wait_for(lambda found: len(select_devices(found, args.device)) >= args.wait_for,
+                                       timeout=args.wait_timeout)
+        finally:
+            tracker.stop()
+    total = len(select_devices(devices, args.device))
+    if not total:
+        reporter.log("No matching ADB devices found.")
+        reporter.result(success=False, devices=0)
+        return False
+    done = []
+
+    def on_result(result):
+        done.append(result)
+        reporter.emit("device", **result)
+        reporter.progress(int(100 * len(done) / total))
+
+    reporter.status(f"Installing to {total} device(s)...")
+    # On Ctrl-C, install_all cancels the running installs itself before re-raising
+    results = adb.install_all(args.apk, patterns=args.device, devices=devices, on_result=on_result,
+                              force=args.force)
+    success = all(r["success"] for r in results)
+    reporter.result(success=success, devices=len(results), failed=sum(1 for r in results if not r["success"]),
+                    skipped=sum(1 for r in results if r["skipped"]))
+    return success
+
+
+def cmd_check(args, reporter):
+    from builder.engine import BuildEngine
+    from builder.templates import precompile
+
+    engine = BuildEngine(args.base_dir, logger_callback=reporter.log)
+    if args.require_pinned:
+        engine.downloader.require_pinned = True
+    # Always re-detect here, whatever the recorded toolchain fingerprint says
+    ok, msg = engine.check_dependencies(refresh=True)
+    reporter.log(msg)
+    if ok and args.verify:
+        ok = engine.downloader.verify_installation()
+    # Warm the on-disk template bytecode cache so the first build skips parsing
+    count = sum(precompile(os.path.join(args.base_dir, "assets", name)) for name in ("template", "template_ios"))
+    reporter.log(f"Precompiled {count} template(s).")
+    reporter.result(success=ok)
+    return ok
+
+
+def cmd_daemon(args, reporter):
+    from builder.engine import BuildEngine
+
+    engine = BuildEngine(args.base_dir, logger_callback=reporter.log)
+    daemon = engine.daemon
+    if args.action == "status":
+        running = daemon.is_running()
+        reporter.log(f"Build daemon is {'running' if running else 'not running'}.")
+        reporter.result(success=True, running=running)
+        return True
+    if args.action == "stop":
+        daemon.stop()
+        reporter.result(success=True, running=False)
+        return True
+
+    ok, msg = engine.check_dependencies()
+    if not ok:
+        reporter.log(f"Dependency Error: {msg}")
+        return False
+    d8 = engine._find_tool("d8")
+    apksigner = engine._find_tool("apksigner")
+    started = daemon.start(engine.jdk_tools['java'], engine.jdk_tools['javac'],
+                           d8_jar=d8 if d8.endswith(".jar") else "",
+                           apksigner_jar=apksigner if apksigner.endswith(".jar") else "")
+    reporter.result(success=started, running=started)
+    return started
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--base-dir", default=BASE_DIR,
+                        help="Directory holding bin/ and assets/ (default: install dir)")
+    common.add_argument("--json", action="store_true", help="Print progress as JSON lines")
+    tracing = argparse.ArgumentParser(add_help=False)
+    tracing.add_argument("--trace", metavar="FILE", help="Write timing spans of every step and tool call as JSON")
+    tracing.add_argument("--chrome-trace", metavar="FILE",
+                         help="Write the same spans in Chrome trace-event format (chrome://tracing, Perfetto)")
+
+    parser = argparse.ArgumentParser(prog="website2app", description="Headless WebSite to Android & iOS App builder.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", parents=[common, tracing], help="Generate and build an APK from a .w2apk project")
+    p.add_argument("project", help="Path to a .w2apk project file")
+    p.add_argument("--variant", choices=["Debug", "Release"], help="Overrides the project's build variant")
+    p.add_argument("--output", help="Overrides the project's output directory")
+    p.add_argument("--clean", action="store_true", help="Wipe the generated app/ tree and build cache first")
+    p.add_argument("--no-cache", action="store_true", help="Run every build step even if its inputs are unchanged")
+    p.add_argument("--with-ios", action="store_true", help="Also export the Xcode project in the same generation pass")
+    p.add_argument("--tool-timeout", type=float, metavar="SECONDS",
+                   help="Kill a build tool that runs longer than this, 0 for no limit (default: 600)")
+    p.set_defaults(func=cmd_build)
+
+    p = sub.add_parser("ios", parents=[common, tracing], help="Export the Xcode project for a .w2apk project")
+    p.add_argument("project", help="Path to a .w2apk project file")
+    p.add_argument("--output", help="Overrides the project's output directory")
+    p.add_argument("--clean", action="store_true", help="Wipe the exported WebApp_iOS/ tree first")
+    p.set_defaults(func=cmd_ios)
+
+    p = sub.add_parser("batch", parents=[common, tracing], help="Build many .w2apk projects in parallel")
+    p.add_argument("projects", nargs="+", help="Paths to .w2apk project files")
+    p.add_argument("--variant", action="append", choices=["Debug", "Release"],
+                   help="Variant to build, repeatable (default: each project's own variant)")
+    p.add_argument("--output-root", help="Root for per-project work dirs (default: each project's output dir)")
+    p.add_argument("--jobs", type=int, help="Worker processes (default: CPU count)")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("install", parents=[common], help="Install an APK on every connected device at once")
+    p.add_argument("apk", help="Path to the APK")
+    p.add_argument("--device", action="append", metavar="PATTERN",
+                   help="Only devices whose serial or model matches this glob, or key:glob on a field such as "
+                        "product (repeatable; default: all)")
+    p.add_argument("--wait-for", type=int, metavar="COUNT",
+                   help="Wait until at least COUNT matching devices are connected before installing")
+    p.add_argument("--wait-timeout", type=float, default=60, metavar="SECONDS",
+                   help="Give up waiting after SECONDS and install to the devices found (default: 60)")
+    p.add_argument("--force", action="store_true", help="Install even on devices that already have this exact APK")
+    p.set_defaults(func=cmd_install)
+
+    p = sub.add_parser("check", parents=[common], help="Check Java and download the minimal build tools")
+    p.add_argument("--verify", action="store_true",
+                   help="Re-hash the shared SDK tools against their manifest and reinstall them if corrupt")
+    p.add_argument("--require-pinned", action="store_true",
+                   help="Refuse SDK archives that have no pinned SHA-256 in builder/downloader.py")
+    p.set_defaults(func=cmd_check)
+
+    p = sub.add_parser("daemon", parents=[common], help="Manage the warm JVM daemon for javac, d8 and apksigner")
+    p.add_argument("action", choices=["start", "stop", "status"])
+    p.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def _run_traced(args, reporter):
+    """Runs the command with a tracer recording, then writes the requested trace files."""
+    from builder import trace
+
+    with trace.recording() as tracer:
+        try:
+            with trace.span(args.command, "build"):
+                return args.func(args, reporter)
+        finally:
+            if args.trace:
+                tracer.write_json(args.trace)
+                reporter.log(f"Trace written to {args.trace}")
+            if args.chrome_trace:
+                tracer.write_chrome(args.chrome_trace)
+                reporter.log(f"Chrome trace written to {args.chrome_trace}")
+            reporter.log(tracer.summary())
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    reporter = ProgressReporter(json_mode=args.json)
+    try:
+        if getattr(args, "trace", None) or getattr(args, "chrome_trace", None):
+            success = _run_traced(args, reporter)
+        else:
+            success = args.func(args, reporter)
+    except KeyboardInterrupt:
+        # Running tools were already killed by the process runner
+        reporter.log("Cancelled.")
+        reporter.result(success=False, error="cancelled")
+        return 130
+    except Exception as e:
+        reporter.log(f"Critical Error: {str(e)}")
+        reporter.result(success=False, error=str(e))
+        success = False
+    return 0 if success else 1
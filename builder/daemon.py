@@ -0,0 +1,252 @@
+import hashlib
+import os
+import signal
+import socket
+import subprocess
+import threading
+import time
+from contextlib import nullcontext
+
+from builder.process import ProcessTimeout
+
+BUSY = 125  # Exit code the daemon answers with when all its request slots are taken
+CONTROL_REQUESTS = ("ping", "shutdown")  # Answered by the daemon itself, never worth stopping it for
+
+
+class DaemonUnavailable(Exception):
+    """The build daemon is not running or did not answer; callers fall back to a subprocess."""
+
+
+class DaemonAborted(Exception):
+    """A request was stopped by cancel()/kill_all() of the runner it was attached to; the daemon was stopped."""
+
+
+class _Request:
+    """An in-flight daemon request; kill_tree() (called by ProcessRunner) aborts it by closing its socket."""
+
+    def __init__(self):
+        self.sock = None
+        self.killed = False
+        self._lock = threading.Lock()
+
+    def connected(self, sock):
+        with self._lock:
+            self.sock = sock
+            if self.killed:
+                _close(sock)
+
+    def kill_tree(self):
+        with self._lock:
+            self.killed = True
+            if self.sock is not None:
+                _close(self.sock)
+
+
+class BuildDaemon:
+    """
+    Client and lifecycle manager for the optional JVM build daemon.
+
+    The daemon (assets/daemon/BuildDaemon.java) keeps javac, d8 and apksigner
+    loaded in one warm JVM and accepts requests on a loopback socket, much like
+    the Gradle daemon. Its port, auth token, pid, the tool jars it serves and
+    its java.home are published in <tools_dir>/daemon/daemon.state. Several
+    requests run at once; when the daemon is saturated it says so right away
+    and the tool runs as a new process instead.
+    """
+
+    SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "assets", "daemon", "BuildDaemon.java")
+
+    def __init__(self, tools_dir, logger=None):
+        self.daemon_dir = os.path.join(tools_dir, "daemon")
+        self.classes_dir = os.path.join(self.daemon_dir, "classes")
+        self.state_file = os.path.join(self.daemon_dir, "daemon.state")
+        self.logger = logger
+
+    def log(self, msg):
+        if self.logger:
+            self.logger(msg)
+
+    def _read_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            return {
+                "port": int(lines[0]),
+                "token": lines[1],
+                "pid": lines[2],
+                "d8": lines[3],
+                "apksigner": lines[4],
+                "java_home": lines[5] if len(lines) > 5 else ""  # Missing in state files of older daemons
+            }
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def is_configured(self):
+        """True if a daemon has published its state file (it may still have died since)."""
+        return os.path.exists(self.state_file)
+
+    def serves(self, tool, jar=None, javac=None):
+        """
+        True if the running daemon can execute this tool: for jar tools the
+        same jar, for javac the JDK that javac (the one hashed into the
+        cache keys) belongs to.
+        """
+        state = self._read_state()
+        if not state:
+            return False
+        if tool == "javac":
+            return bool(javac) and _same_jdk(javac, state["java_home"])
+        return bool(jar) and os.path.normcase(os.path.abspath(jar)) == os.path.normcase(state.get(tool, ""))
+
+    def is_running(self):
+        try:
+            return self.run("ping", [], timeout=5)[0] == 0
+        except DaemonUnavailable:
+            return False
+
+    def run(self, tool, args, timeout=None, runner=None):
+        """
+        Runs a tool inside the daemon. Returns (exit_code, output).
+
+        A tool that has not answered within timeout seconds raises
+        ProcessTimeout; with a ProcessRunner as runner, its cancel() and
+        kill_all() abort the request with DaemonAborted. In both cases the
+        daemon is stopped, as it cannot interrupt the tool, which would
+        otherwise keep running and writing into the build directory.
+        """
+        state = self._read_state()
+        if not state:
+            raise DaemonUnavailable("daemon is not running")
+        args = [str(a) for a in args]
+        if any('\n' in a or '\r' in a for a in args):
+            raise DaemonUnavailable("arguments containing newlines cannot be sent to the daemon")
+
+        request = "\n".join([state["token"], tool, str(len(args))] + args) + "\n"
+        deadline = time.monotonic() + timeout if timeout else None
+        pending = _Request()
+        chunks = []
+        with runner.attach(pending) if runner else nullcontext():
+            try:
+                with socket.create_connection(("127.0.0.1", state["port"]), timeout=5) as sock:
+                    pending.connected(sock)
+                    sock.sendall(request.encode('utf-8'))
+                    sock.shutdown(socket.SHUT_WR)
+                    while True:
+                        sock.settimeout(max(deadline - time.monotonic(), 0.001) if deadline else None)
+                        chunk = sock.recv(65536)
+                        if not chunk:
+                            break
+                        chunks.append(chunk)
+            except socket.timeout as e:
+                if pending.sock is None or tool in CONTROL_REQUESTS:
+                    raise DaemonUnavailable(str(e) or "timed out")
+                self.kill(state)
+                raise ProcessTimeout(f"{tool} did not finish within {timeout:g} s in the build daemon, "
+                                     f"which was stopped")
+            except OSError as e:
+                if not pending.killed:
+                    raise DaemonUnavailable(str(e))
+            if pending.killed:
+                self.kill(state)
+                raise DaemonAborted(f"{tool} was stopped, and the build daemon with it")
+
+        head, _, output = b"".join(chunks).partition(b"\n")
+        if not head:
+            # The tool took the JVM down (e.g. apksigner calling System.exit on bad arguments)
+            raise DaemonUnavailable("daemon closed the connection without a result")
+        if int(head) == BUSY and tool not in CONTROL_REQUESTS:
+            raise DaemonUnavailable("daemon is busy with other builds")
+        return int(head), output.decode('utf-8', 'replace')
+
+    def start(self, java, javac, d8_jar="", apksigner_jar="", timeout=30):
+        """Compiles (if needed) and launches the daemon in the background."""
+        if self.is_running():
+            self.log("Build daemon already running.")
+            return True
+        os.makedirs(self.daemon_dir, exist_ok=True)
+        self._compile(javac)
+
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        cmd = [java, "-Xmx1024M", "-cp", self.classes_dir, "BuildDaemon", self.state_file,
+               os.path.abspath(d8_jar) if d8_jar else "", os.path.abspath(apksigner_jar) if apksigner_jar else ""]
+        kwargs = {}
+        if os.name == 'nt':
+            kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True
+        log_path = os.path.join(self.daemon_dir, "daemon.log")
+        with open(log_path, 'ab') as log_file:
+            subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=log_file, stderr=log_file, **kwargs)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.is_running():
+                self.log("Build daemon started.")
+                return True
+            time.sleep(0.2)
+        self.log(f"Build daemon did not come up, see {log_path}")
+        return False
+
+    def stop(self):
+        if not self.is_configured():
+            return False
+        try:
+            self.run("shutdown", [], timeout=10)
+        except DaemonUnavailable:
+            # Stale state file of a daemon that is already gone
+            pass
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        self.log("Build daemon stopped.")
+        return True
+
+    def kill(self, state=None):
+        """Kills the daemon process (and whatever tool it is running), e.g. after a request timed out."""
+        state = state or self._read_state()
+        if not state:
+            return
+        try:
+            if os.name == 'nt':
+                subprocess.run(["taskkill", "/F", "/T", "/PID", state["pid"]], capture_output=True)
+            else:
+                os.kill(int(state["pid"]), signal.SIGKILL)
+        except (OSError, ValueError):
+            pass
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        self.log("Build daemon stopped.")
+
+    def _compile(self, javac):
+        with open(self.SOURCE, 'rb') as f:
+            source_hash = hashlib.sha256(f.read()).hexdigest()
+        stamp = os.path.join(self.classes_dir, "source.sha256")
+        if os.path.exists(stamp):
+            with open(stamp, 'r') as f:
+                if f.read().strip() == source_hash:
+                    return
+        self.log("Compiling build daemon...")
+        os.makedirs(self.classes_dir, exist_ok=True)
+        res = subprocess.run([javac, "-d", self.classes_dir, self.SOURCE], capture_output=True, text=True)
+        if res.returncode != 0:
+            raise Exception(f"Failed to compile the build daemon: {res.stderr.strip()}")
+        with open(stamp, 'w') as f:
+            f.write(source_hash)
+
+
+def _close(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+def _same_jdk(javac, java_home):
+    """True if javac is <java.home>/bin/javac, or <java.home>/../bin/javac for a Java 8 java.home ending in /jre."""
+    if not java_home:
+        return False
+    jdk = os.path.normcase(os.path.dirname(os.path.dirname(os.path.realpath(javac))))
+    home = os.path.normcase(os.path.realpath(java_home))
+    return jdk in (home, os.path.dirname(home))
@@ -0,0 +1,76 @@
+import os
+import shutil
+
+from builder.cache import load_state, save_state
+
+
+class IncrementalDexer:
+    """
+    Incremental dexing with per-class intermediates, mirroring AGP.
+
+    Each .class file is dexed on its own (d8 --intermediate --file-per-class)
+    into dex_intermediates/, and the intermediate is reused for as long as the
+    class file's content hash is unchanged. classes.dex is then produced by a
+    d8 merge of all intermediates, which is far cheaper than dexing from
+    bytecode again.
+    """
+
+    STATE_FILE = "dex_state.json"
+    VERSION = 1
+
+    def __init__(self, work_dir, obj_dir, run_d8, digest, logger=None):
+        self.work_dir = work_dir
+        self.obj_dir = obj_dir
+        self.intermediates_dir = os.path.join(work_dir, "dex_intermediates")
+        self.state_path = os.path.join(work_dir, self.STATE_FILE)
+        self.run_d8 = run_d8  # callable(args) running d8 (daemon or subprocess)
+        self.digest = digest  # callable(path) -> content hash
+        self.logger = logger
+
+    def log(self, msg):
+        if self.logger:
+            self.logger(msg)
+
+    def dex(self, class_files, options, env_key, output_dir):
+        """Updates the per-class intermediates and merges them into output_dir/classes.dex."""
+        current = {os.path.relpath(p, self.obj_dir): self.digest(p) for p in class_files}
+        state = load_state(self.state_path, self.VERSION)
+        if state is None or state["env"] != env_key:
+            shutil.rmtree(self.intermediates_dir, ignore_errors=True)
+            old = {}
+        else:
+            old = state["classes"]
+        os.makedirs(self.intermediates_dir, exist_ok=True)
+
+        for rel in set(old) - set(current):
+            self._remove(old[rel]["dex"])
+        changed = [rel for rel, h in current.items()
+                   if rel not in old or old[rel]["hash"] != h or not self._exists(old[rel]["dex"])]
+
+        entries = {rel: old[rel] for rel in current if rel not in changed}
+        if changed:
+            self.log(f"Dexing {len(changed)} of {len(current)} class file(s)...")
+            for rel in changed:
+                if rel in old:
+                    self._remove(old[rel]["dex"])
+            self.run_d8(list(options) + ["--intermediate", "--file-per-class", "--output", self.intermediates_dir]
+                        + [os.path.join(self.obj_dir, rel) for rel in sorted(changed)])
+            for rel in changed:
+                dex_rel = rel[:-len(".class")] + ".dex"
+                # Synthetic classes can be emitted together with their context class
+                entries[rel] = {"hash": current[rel], "dex": dex_rel if self._exists(dex_rel) else None}
+        else:
+            self.log("Dex intermediates are up to date.")
+
+        dex_files = sorted({os.path.join(self.intermediates_dir, e["dex"]) for e in entries.values() if e["dex"]})
+        self.log(f"Merging {len(dex_files)} dex intermediate(s)...")
+        self.run_d8(list(options) + ["--output", output_dir] + dex_files)
+        save_state(self.state_path, {"version": self.VERSION, "env": env_key, "classes": entries})
+        return os.path.join(output_dir, "classes.dex")
+
+    def _exists(self, dex_rel):
+        return bool(dex_rel) and os.path.exists(os.path.join(self.intermediates_dir, dex_rel))
+
+    def _remove(self, dex_rel):
+        if self._exists(dex_rel):
+            os.remove(os.path.join(self.intermediates_dir, dex_rel))
@@ -1,88 +1,245 @@
+import hashlib
+import json
 import os
-import zipfile
-import urllib.request
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from builder.fetch import DownloadError, NotStreamable, ResumableDownload, extract_zip_file, extract_zip_stream
+from builder.tool_store import ToolStore
+
+SDK_REPOSITORY = "https://dl.google.com/android/repository/"
+MIRROR_ENV = "WEBSITE2APP_SDK_MIRROR"  # Base URL serving the same file names, e.g. a local or corporate mirror
+# "1" refuses archives without a pinned digest, like `check --require-pinned`
+REQUIRE_PINNED_ENV = "WEBSITE2APP_REQUIRE_PINNED"
+
+# Pinned archives: a download that does not match its sha256 is rejected and deleted. An archive whose sha256 is
+# None cannot be verified; it is accepted with a warning logging the digest of what was downloaded, so it can be
+# recorded here, unless pinned archives are required.
+SDK_ARCHIVES = {
+    "build-tools": {"file": "build-tools_r33.0.1-windows.zip", "sha256": None, "label": "Build Tools (~50MB)"},
+    "platform": {"file": "platform-33_r02.zip", "sha256": None, "label": "Android Platform jar (~70MB)"},
+    "platform-tools": {"file": "platform-tools_r33.0.3-windows.zip", "sha256": None,
+                       "label": "Platform Tools (ADB) (~5MB)"},
+}
+TOOLSET_FILE = ".toolset.json"  # In bin/: the store toolset linked there, with each file's size and mtime
+
+
+def toolset_key():
+    """Store key of the toolset SDK_ARCHIVES describes; changes whenever an archive or its pinned digest does."""
+    spec = json.dumps([[name, a["file"], a["sha256"]] for name, a in sorted(SDK_ARCHIVES.items())])
+    return "sdk-" + hashlib.sha256(spec.encode('utf-8')).hexdigest()[:16]
+
 
 class MinimalToolsDownloader:
-    # Google Repository Links
-    BUILD_TOOLS_URL = "https://dl.google.com/android/repository/build-tools_r33.0.1-windows.zip"
-    PLATFORM_URL = "https://dl.google.com/android/repository/platform-33_r02.zip"
-    PLATFORM_TOOLS_URL = "https://dl.google.com/android/repository/platform-tools-latest-windows.zip"
+    """
+    Installs the SDK tools into <base_dir>/bin.
 
-    def __init__(self, base_dir, logger=None):
+    The tools are downloaded once per host (or per shared cache volume)
+    into the ToolStore and linked into each workspace's bin/, so further
+    checkouts, containers and CI workers start from a cache hit.
+    """
+
+    def __init__(self, base_dir, logger=None, mirror=None, store=None, require_pinned=None):
         self.base_dir = base_dir
         self.tools_dir = os.path.join(base_dir, "bin")
         self.logger = logger or print
+        self.repository = (mirror or os.environ.get(MIRROR_ENV) or SDK_REPOSITORY).rstrip('/') + '/'
+        self.store = store or ToolStore()
+        if require_pinned is None:
+            require_pinned = os.environ.get(REQUIRE_PINNED_ENV) == "1"
+        self.require_pinned = require_pinned
 
     def log(self, msg):
         self.logger(msg)
 
     def is_installed(self):
-        """Checks if essential tools exist."""
-        essentials = [
-            os.path.join(self.tools_dir, "aapt2.exe"),
-            os.path.join(self.tools_dir, "zipalign.exe"),
-            os.path.join(self.tools_dir, "android.jar")
-        ]
-        return all(os.path.exists(f) for f in essentials)
+        """
+        Checks that bin/ holds the current toolset, unchanged (size and
+        mtime) since it was linked from the store.
+        """
+        state = self._linked_toolset()
+        if state is None:
+            # bin/ filled by hand or by an older version without a store: only existence can be checked
+            # APKs are zip-aligned in-process (builder/apk.py), so zipalign is not required
+            essentials = [
+                os.path.join(self.tools_dir, "aapt2.exe"),
+                os.path.join(self.tools_dir, "android.jar")
+            ]
+            return all(os.path.exists(f) for f in essentials)
+        if state.get("key") != toolset_key():
+            return False
+        for name, info in state["files"].items():
+            try:
+                st = os.stat(os.path.join(self.tools_dir, name))
+            except OSError:
+                return False
+            if st.st_size != info["size"] or st.st_mtime_ns != info["mtime_ns"]:
+                return False
+        return True
 
     def download_and_setup(self):
+        """
+        Links the toolset from the shared store into bin/, downloading it
+        into the store first if no process on this host has done so yet.
+        """
         if self.is_installed():
             self.log("Minimal tools already installed.")
             return True
+        return self._setup()
 
-        os.makedirs(self.tools_dir, exist_ok=True)
-        temp_dir = os.path.join(self.base_dir, "temp")
-        os.makedirs(temp_dir, exist_ok=True)
-
-        try:
-            # 1. Download Build Tools
-            bt_zip = os.path.join(temp_dir, "build-tools.zip")
-            self.log("Downloading Build Tools (~50MB)...")
-            urllib.request.urlretrieve(self.BUILD_TOOLS_URL, bt_zip)
-            
-            self.log("Extracting essential build binaries...")
-            with zipfile.ZipFile(bt_zip, 'r') as zip_ref:
-                for file in zip_ref.namelist():
-                    # We only need a few things
-                    if any(x in file for x in ["aapt2.exe", "zipalign.exe", "apksigner", "d8"]):
-                        filename = os.path.basename(file)
-                        if filename:
-                            with zip_ref.open(file) as source, open(os.path.join(self.tools_dir, filename), "wb") as target:
-                                shutil.copyfileobj(source, target)
-            
-            # 2. Download Platform (for android.jar)
-            p_zip = os.path.join(temp_dir, "platform.zip")
-            self.log("Downloading Android Platform jar (~70MB)...")
-            urllib.request.urlretrieve(self.PLATFORM_URL, p_zip)
-            
-            self.log("Extracting android.jar...")
-            with zipfile.ZipFile(p_zip, 'r') as zip_ref:
-                for file in zip_ref.namelist():
-                    if file.endswith("android.jar"):
-                        with zip_ref.open(file) as source, open(os.path.join(self.tools_dir, "android.jar"), "wb") as target:
-                            shutil.copyfileobj(source, target)
-                            break
-            
-            # 3. Download Platform Tools (ADB)
-            pt_zip = os.path.join(temp_dir, "platform-tools.zip")
-            self.log("Downloading Platform Tools (ADB) (~5MB)...")
-            urllib.request.urlretrieve(self.PLATFORM_TOOLS_URL, pt_zip)
-            
-            self.log("Extracting ADB...")
-            with zipfile.ZipFile(pt_zip, 'r') as zip_ref:
-                for file in zip_ref.namelist():
-                    if file.endswith("adb.exe") or file.endswith("AdbWinApi.dll") or file.endswith("AdbWinUsbApi.dll"):
-                        filename = os.path.basename(file)
-                        with zip_ref.open(file) as source, open(os.path.join(self.tools_dir, filename), "wb") as target:
-                            shutil.copyfileobj(source, target)
-
-            self.log("Minimal SDK setup complete (including ADB).")
+    def verify_installation(self):
+        """Re-hashes the stored toolset against its manifest and reinstalls it if anything is corrupt."""
+        key = toolset_key()
+        bad = self.store.verify(key)
+        if not bad:
+            self.log(f"SDK tools verified ({self.store.path(key)}).")
             return True
+        self.log(f"SDK tools corrupt or missing ({', '.join(bad)}), reinstalling...")
+        self.store.remove(key)
+        # bin/ may hold hard links to the corrupt files, so it is relinked even if it looks unchanged
+        return self._setup()
 
-        except Exception as e:
-            self.log(f"Setup failed: {str(e)}")
+    def _setup(self):
+        unpinned = [a["file"] for a in SDK_ARCHIVES.values() if not a["sha256"]]
+        if unpinned and self.require_pinned:
+            self.log(f"Setup failed: no pinned SHA-256 for {', '.join(unpinned)}, so the download cannot be verified. "
+                     f"Pin the digests in SDK_ARCHIVES (builder/downloader.py).")
             return False
+        key = toolset_key()
+        manifest = self.store.get(key)
+        if manifest is None:
+            try:
+                # Concurrent builds wait on the store's lock and then find the toolset installed
+                manifest = self.store.install(key, self._download_toolset,
+                                              version=", ".join(a["file"] for a in SDK_ARCHIVES.values()))
+            except Exception as e:
+                self.log(f"Setup failed: {str(e)}")
+                return False
+        else:
+            self.log(f"Using cached SDK tools from {self.store.path(key)}")
+        self._link_toolset(key, manifest)
+        self.log("Minimal SDK setup complete (including ADB).")
+        return True
+
+    def _linked_toolset(self):
+        try:
+            with open(os.path.join(self.tools_dir, TOOLSET_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _link_toolset(self, key, manifest):
+        """Hardlinks (or, across filesystems, copies) every stored file into bin/."""
+        os.makedirs(self.tools_dir, exist_ok=True)
+        files = {}
+        for name in manifest["files"]:
+            src = os.path.join(self.store.path(key), name)
+            dest = os.path.join(self.tools_dir, name)
+            tmp = dest + ".tmp"
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            try:
+                os.link(src, tmp)
+            except OSError:
+                shutil.copy2(src, tmp)
+            os.replace(tmp, dest)
+            st = os.stat(dest)
+            files[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        with open(os.path.join(self.tools_dir, TOOLSET_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"key": key, "store": self.store.path(key), "files": files}, f, indent=2)
+
+    def _download_toolset(self, dest_dir):
+        """
+        Fetches the SDK archives concurrently and unpacks the needed members
+        into dest_dir while they download, so setup takes about as long as
+        the largest archive. Partial downloads are kept in the store and
+        resumed by the next attempt instead of starting from zero.
+        """
+        os.makedirs(self.store.partial_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=len(SDK_ARCHIVES)) as pool:
+            futures = {name: pool.submit(self._install_archive, name, spec, dest_dir)
+                       for name, spec in SDK_ARCHIVES.items()}
+        downloads, failed = [], []
+        for name, future in futures.items():
+            try:
+                downloads.append(future.result())
+            except Exception as e:
+                failed.append(name)
+                self.log(f"Setup failed ({name}): {str(e)}")
+        if failed:
+            # dest_dir is thrown away, so the archives that did succeed are kept for the next attempt too
+            raise DownloadError("Downloads were kept and will be resumed on the next attempt.")
+        for download in downloads:
+            download.discard()
+
+    def _install_archive(self, name, spec, dest_dir):
+        """Downloads one archive and moves its selected members into dest_dir. Returns the (complete) download."""
+        url = self.repository + spec["file"]
+        temp_dir = self.store.partial_dir
+        # Extracted files wait in a staging dir until the archive's hash is verified
+        staging = os.path.join(dest_dir, f".staging-{name}")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        select = self._selector(name)
+
+        self.log(f"Downloading {spec['label']}...")
+        download = ResumableDownload(url, os.path.join(temp_dir, spec["file"] + ".part"), logger=self.log,
+                                     on_progress=self._progress_logger(spec["file"]))
+        try:
+            try:
+                extract_zip_stream(download, select, staging)
+                download.drain()
+            except NotStreamable as e:
+                self.log(f"{spec['file']}: {str(e)}, extracting once the download completes.")
+                download.drain()
+                shutil.rmtree(staging)
+                os.makedirs(staging)
+                extract_zip_file(download.part_path, self._selector(name), staging)
+            digest = download.sha256.hexdigest()
         finally:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
+            download.close()
+
+        if spec["sha256"] and digest != spec["sha256"]:
+            download.discard()
+            raise DownloadError(f"SHA-256 mismatch for {spec['file']}: expected {spec['sha256']}, got {digest}")
+        if not spec["sha256"]:
+            self.log(f"Warning: {spec['file']} has no pinned SHA-256 in SDK_ARCHIVES and was not verified "
+                     f"(downloaded SHA-256: {digest})")
+        for filename in os.listdir(staging):
+            os.replace(os.path.join(staging, filename), os.path.join(dest_dir, filename))
+        os.rmdir(staging)
+        self.log(f"Installed {spec['label'].split(' (')[0]}.")
+        return download
+
+    @staticmethod
+    def _selector(name):
+        """select(member name) for extract_zip_*: the file name to install in bin/, or None."""
+        if name == "build-tools":
+            def select(member):
+                filename = os.path.basename(member)
+                return filename if filename and any(x in member for x in ["aapt2.exe", "apksigner", "d8"]) else None
+        elif name == "platform":
+            found = []
+
+            def select(member):
+                if member.endswith("android.jar") and not found:
+                    found.append(member)
+                    return "android.jar"
+                return None
+        else:
+            def select(member):
+                keep = member.endswith("adb.exe") or member.endswith("AdbWinApi.dll") \
+                    or member.endswith("AdbWinUsbApi.dll")
+                return os.path.basename(member) if keep else None
+        return select
+
+    def _progress_logger(self, filename):
+        logged = [0]
+
+        def on_progress(position, size):
+            if size:
+                quarter = position * 4 // size
+                if quarter > logged[0]:
+                    logged[0] = quarter
+                    self.log(f"{filename}: {25 * quarter}% of {size / (1024 * 1024):.1f} MB")
+        return on_progress
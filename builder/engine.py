@@ -1,17 +1,40 @@
 import subprocess
 import os
+import hashlib
 import shutil
 import glob
+from builder.apk import ApkWriter
+from builder.cache import BuildCache
+from builder.daemon import BuildDaemon, DaemonAborted, DaemonUnavailable
+from builder.dex import IncrementalDexer
+from builder.javac import IncrementalJavac
+from builder.resources import IncrementalResourceCompiler
+from builder import signer, trace
 from builder.downloader import MinimalToolsDownloader
+from builder.process import BuildCancelled, ProcessRunner
+from builder.task_graph import TaskGraph
+from builder.toolchain import ToolchainResolver
 
 class BuildEngine:
-    def __init__(self, base_dir, logger_callback=None, signing_config=None):
+    MIN_SDK = 21  # Matches minSdkVersion in assets/template/AndroidManifest.xml
+    TOOL_TIMEOUT = 600  # Seconds any single aapt2/javac/d8/apksigner run may take before it is killed
+
+    def __init__(self, base_dir, logger_callback=None, signing_config=None, use_cache=True, jdk_tools=None,
+                 use_daemon=True, sdk_tools=None, tool_timeout=None):
         self.base_dir = base_dir
+        self.use_cache = use_cache
         self.tools_dir = os.path.join(base_dir, "bin")
         self.logger = logger_callback
         self.signing_config = signing_config
         self.downloader = MinimalToolsDownloader(base_dir, logger=self.log)
-        self.jdk_tools = {} # Cache paths for java, javac, keytool
+        self.jdk_tools = dict(jdk_tools or {}) # Cache paths for java, javac, keytool
+        self.sdk_tools = dict(sdk_tools or {})  # Resolved bin/ tools (d8, apksigner, ...), see check_dependencies
+        self.resolver = ToolchainResolver(self.tools_dir, logger=self.log)
+        # Tool output is streamed to the log line by line as it is produced
+        self.runner = ProcessRunner(logger=self.log,
+                                    timeout=self.TOOL_TIMEOUT if tool_timeout is None else tool_timeout)
+        # javac/d8/apksigner run inside the build daemon when one is up (see builder/daemon.py)
+        self.daemon = BuildDaemon(self.tools_dir, logger=self.log) if use_daemon else None
 
     def log(self, msg):
         if self.logger:
@@ -19,73 +42,66 @@ class BuildEngine:
         else:
             print(msg)
 
-    def check_dependencies(self):
-        """Checks for Java and Minimal Tools."""
+    def check_dependencies(self, refresh=False):
+        """
+        Checks for Java and Minimal Tools. The toolchain is only re-detected
+        when one of the paths recorded at the last detection changed (see
+        builder/toolchain.py), or when refresh is set.
+        """
         self.log("Checking System Dependencies...")
-        
-        java = shutil.which("java")
-        javac = shutil.which("javac")
-        keytool = shutil.which("keytool")
-        
-        # If keytool is missing from PATH, try to find it near javac
-        if javac and not keytool:
-            jdk_bin = os.path.dirname(javac)
-            keytool_alt = os.path.join(jdk_bin, "keytool.exe" if os.name == 'nt' else "keytool")
-            if os.path.exists(keytool_alt):
-                keytool = keytool_alt
-                
-        # More aggressive search for keytool on Windows
-        if not keytool and os.name == 'nt':
-            search_paths = [
-                "C:\\Program Files\\Java",
-                "C:\\Program Files (x86)\\Java"
-            ]
-            for sp in search_paths:
-                if os.path.exists(sp):
-                    for root, dirs, files in os.walk(sp):
-                        if "keytool.exe" in files:
-                            keytool = os.path.join(root, "keytool.exe")
-                            break
-                if keytool: break
-        
+        with trace.span("resolve toolchain", "step") as span:
+            toolchain = self.resolver.resolve(refresh=refresh)
+            span["cached"] = toolchain["cached"]
+        tools = toolchain["tools"]
+        java, javac, keytool = tools["java"], tools["javac"], tools["keytool"]
+
         self.jdk_tools['java'] = java
         self.jdk_tools['javac'] = javac
         self.jdk_tools['keytool'] = keytool
-        
+        self.sdk_tools = {name: path for name, path in tools.items() if name not in self.jdk_tools and path}
+
+        version = toolchain["versions"].get("jdk")
         self.log(f"Java: {'Found' if java else 'MISSING'}")
-        self.log(f"Javac: {'Found' if javac else 'MISSING'}")
+        self.log(f"Javac: {'Found' if javac else 'MISSING'}{f' ({version})' if javac and version else ''}")
         self.log(f"Keytool: {'Found' if keytool else 'MISSING'}")
         
         if not java or not javac:
             return False, "Java JDK is missing. Please install Java JDK 8 or 11/17."
         
         if not keytool:
-            self.log("Warning: keytool not found. Signing (Step 7) might fail.")
+            self.log("Warning: keytool not found. Signing (Step 6) might fail." if not signer.is_available()
+                     else "keytool not found; the in-process signer will be used.")
 
         # Check if minimal tools are already downloaded
         if not self.downloader.is_installed():
             self.log("Minimal tools not found. Starting auto-download...")
             if not self.downloader.download_and_setup():
                 return False, "Failed to download minimal build tools."
+            self.sdk_tools = {name: path for name, path in self.resolver.resolve()["tools"].items()
+                              if name not in self.jdk_tools and path}
         
         return True, "Minimal tools and Java are ready."
 
     def build(self, project_path, variant="Debug"):
         """
         SDK-less build pipeline:
-        1. Compile Resources (aapt2 compile)
+        1. Compile Resources per file (aapt2 compile)
         2. Link Resources (aapt2 link) -> creates R.java and base APK
         3. Compile Java source to .class (javac)
         4. Dex classes to classes.dex (d8)
-        5. Add classes.dex to APK
-        6. Align (zipalign)
-        7. Sign (apksigner)
+        5. Package resources, classes.dex and assets into an aligned APK (in-process)
+        6. Sign (in-process v1/v2/v3 signer, apksigner as fallback)
+
+        The steps run as a TaskGraph: the assets are compressed and the debug
+        keystore is created alongside steps 1-4. Every step is keyed by the
+        content hashes of its inputs (see BuildCache), so steps whose inputs
+        did not change since the last build are skipped and their outputs in
+        build_manual/ are reused.
         """
         try:
             # Setup paths
             bin_dir = self.tools_dir
             aapt2 = os.path.join(bin_dir, "aapt2.exe")
-            zipalign = os.path.join(bin_dir, "zipalign.exe")
             android_jar = os.path.join(bin_dir, "android.jar")
             
             # Find d8 and apksigner (might be jars or bat/exe)
@@ -101,65 +117,121 @@ class BuildEngine:
             
             build_work_dir = os.path.join(app_dir, "build_manual")
             os.makedirs(build_work_dir, exist_ok=True)
+            cache = BuildCache(build_work_dir)
+            javac_cmd = self.jdk_tools.get('javac') or 'javac'
+            java_cmd = self.jdk_tools.get('java') or 'java'
             
-            self.log("Step 1: Compiling resources...")
-            compiled_res = os.path.join(build_work_dir, "compiled_res.zip")
-            cmd = [aapt2, "compile", "--dir", res_dir, "-o", compiled_res]
-            self._run_cmd(cmd)
+            # Each step is a task of a dependency graph; independent ones (signing keystore, asset compression)
+            # run alongside the aapt2 -> javac -> d8 chain, so the critical path sets the build time
+            graph = TaskGraph(on_failure=self.runner.kill_all)
+            # Resources are compiled per file into build_manual/flat/, only changed files hit aapt2
+            res_compiler = IncrementalResourceCompiler(build_work_dir, digest=cache.file_digest, logger=self.log,
+                                                       run_aapt2=lambda args: self._run_cmd([aapt2] + args))
+
+            def compile_resources():
+                self.log("Step 1: Compiling resources...")
+                key = cache.key(files=[aapt2], trees=[res_dir])
+                self._cached_step(cache, "compile_resources", key,
+                                  lambda: res_compiler.compile(res_dir, cache.key(files=[aapt2])))
+            graph.add("compile_resources", compile_resources, inputs=[aapt2, res_dir], outputs=[res_compiler.flat_dir])
 
-            self.log("Step 2: Linking resources and generating R.java...")
             gen_java_dir = os.path.join(build_work_dir, "gen")
-            os.makedirs(gen_java_dir, exist_ok=True)
-            unsigned_apk = os.path.join(build_work_dir, "unsigned.apk")
-            cmd = [
-                aapt2, "link", "-I", android_jar, 
-                "--manifest", manifest,
-                compiled_res,
-                "-o", unsigned_apk,
-                "--java", gen_java_dir,
-                "--auto-add-overlay"
-            ]
-            self._run_cmd(cmd)
+            resources_apk = os.path.join(build_work_dir, "resources.apk")
+
+            def link_resources():
+                self.log("Step 2: Linking resources and generating R.java...")
+                key = cache.key(files=[aapt2, android_jar, manifest], trees=[(res_compiler.flat_dir, ".flat")])
+
+                def link():
+                    # Start from an empty gen/ so R.java of a previous package name is not compiled again
+                    shutil.rmtree(gen_java_dir, ignore_errors=True)
+                    os.makedirs(gen_java_dir, exist_ok=True)
+                    flat_files = cache.list_files(res_compiler.flat_dir, ".flat")
+                    self._run_cmd([
+                        aapt2, "link", "-I", android_jar,
+                        "--manifest", manifest
+                    ] + flat_files + [
+                        "-o", resources_apk,
+                        "--java", gen_java_dir,
+                        "--auto-add-overlay"
+                    ])
+                    return [resources_apk] + cache.list_files(gen_java_dir)
+                self._cached_step(cache, "link_resources", key, link)
+            graph.add("link_resources", link_resources, inputs=[aapt2, android_jar, manifest, res_compiler.flat_dir],
+                      outputs=[resources_apk, gen_java_dir])
 
-            self.log("Step 3: Compiling Java source...")
             obj_dir = os.path.join(build_work_dir, "obj")
-            os.makedirs(obj_dir, exist_ok=True)
-            
-            # Find all java files
-            java_files = glob.glob(os.path.join(java_src, "**", "*.java"), recursive=True)
-            java_files += glob.glob(os.path.join(gen_java_dir, "**", "*.java"), recursive=True)
-            
-            # Enforce Java 8 compatibility to ensure d8 can process the class files
-            javac_cmd = self.jdk_tools.get('javac', 'javac')
-            cmd = [javac_cmd, "-source", "1.8", "-target", "1.8", "-d", obj_dir, "-cp", android_jar] + java_files
-            self._run_cmd(cmd)
 
-            self.log("Step 4: Dexing class files...")
+            def compile_java():
+                self.log("Step 3: Compiling Java source...")
+                # Enforce Java 8 compatibility to ensure d8 can process the class files
+                javac_options = ["-source", "1.8", "-target", "1.8"]
+                javac_env = cache.key(files=[android_jar, self._tool_path(javac_cmd)], values=javac_options)
+                key = cache.key(trees=[(java_src, ".java"), (gen_java_dir, ".java")], values=[javac_env])
+
+                def compile_sources():
+                    # Only changed sources and their dependents are recompiled; obj/ persists between builds
+                    java_files = glob.glob(os.path.join(java_src, "**", "*.java"), recursive=True)
+                    java_files += glob.glob(os.path.join(gen_java_dir, "**", "*.java"), recursive=True)
+                    javac = IncrementalJavac(build_work_dir, obj_dir, digest=cache.file_digest, logger=self.log,
+                                             run_javac=lambda args: self._run_java_tool("javac", args,
+                                                                                        [javac_cmd] + args))
+                    javac.compile(java_files, [android_jar], javac_options, javac_env)
+                    return cache.list_files(obj_dir, ".class")
+                self._cached_step(cache, "compile_java", key, compile_sources)
+            # The template's MainActivity uses R, so javac always waits for link_resources
+            graph.add("compile_java", compile_java, inputs=[android_jar, java_src, gen_java_dir], outputs=[obj_dir])
+
             dex_file = os.path.join(build_work_dir, "classes.dex")
-            class_files = glob.glob(os.path.join(obj_dir, "**", "*.class"), recursive=True)
-            
-            if d8.endswith(".jar"):
-                cmd = ["java", "-Xmx1024M", "-cp", d8, "com.android.tools.r8.D8"]
-            else:
-                cmd = [d8]
-            
-            # Explicitly set min-api to 21 to avoid some D8/R8 NPEs with modern bytecode
-            cmd += ["--min-api", "21", "--lib", android_jar, "--output", build_work_dir] + class_files
-            self._run_cmd(cmd)
 
-            self.log("Step 5: Injecting classes.dex into APK...")
-            # We can use aapt2 or just a zip tool. aapt2 'add' isn't standard, usually we use jar or zip.
-            # But aapt2 link can take --java as input? No. 
-            # We'll use a zip library or just 'jar' if available.
-            self._add_to_zip(unsigned_apk, dex_file, "classes.dex")
+            def dex_classes():
+                self.log("Step 4: Dexing class files...")
+                # Explicitly set min-api to 21 to avoid some D8/R8 NPEs with modern bytecode
+                key = cache.key(files=[android_jar, d8], trees=[(obj_dir, ".class")], values=["--min-api 21"])
+
+                def dex():
+                    # Only changed classes are re-dexed; classes.dex is a merge of cached per-class dex files
+                    class_files = glob.glob(os.path.join(obj_dir, "**", "*.class"), recursive=True)
+                    if d8.endswith(".jar"):
+                        cmd = [java_cmd, "-Xmx1024M", "-cp", d8, "com.android.tools.r8.D8"]
+                    else:
+                        cmd = [d8]
+                    dexer = IncrementalDexer(build_work_dir, obj_dir, digest=cache.file_digest, logger=self.log,
+                                             run_d8=lambda args: self._run_java_tool("d8", args, cmd + args, jar=d8))
+                    options = ["--min-api", "21", "--lib", android_jar]
+                    dexer.dex(class_files, options, cache.key(files=[d8, android_jar], values=options), build_work_dir)
+                    return [dex_file]
+                self._cached_step(cache, "dex", key, dex)
+            graph.add("dex", dex_classes, inputs=[android_jar, d8, obj_dir], outputs=[dex_file])
+
+            # Assets are compressed on their own, while the code is compiled, and copied into the APK as they are
+            assets_dir = os.path.join(src_main, "assets")
+            assets_zip = os.path.join(build_work_dir, "assets.zip")
+
+            def pack_assets():
+                key = cache.key(trees=[assets_dir])
+                self._cached_step(cache, "pack_assets", key, lambda: self._pack_assets(assets_zip, assets_dir))
+            graph.add("pack_assets", pack_assets, inputs=[assets_dir], outputs=[assets_zip])
 
-            self.log("Step 6: Aligning APK...")
+            # One in-process pass writes the aapt2 output, classes.dex and assets already zip-aligned
             aligned_apk = os.path.join(build_work_dir, "aligned.apk")
-            cmd = [zipalign, "-f", "4", unsigned_apk, aligned_apk]
-            self._run_cmd(cmd)
 
-            # Step 7: Sign APK
+            def package():
+                self.log("Step 5: Packaging aligned APK...")
+                key = cache.key(files=[resources_apk, dex_file, assets_zip])
+
+                def write_apk():
+                    self._package_apk(aligned_apk, resources_apk, dex_file, assets_zip)
+                    return [aligned_apk]
+                self._cached_step(cache, "package", key, write_apk)
+            graph.add("package", package, inputs=[resources_apk, dex_file, assets_zip], outputs=[aligned_apk])
+
+            # Step 6: Sign APK
             final_apk = os.path.join(project_path, f"output_{variant.lower()}.apk")
+            if apksigner.endswith(".jar"):
+                signer_cmd = [java_cmd, "-Xmx1024M", "-jar", apksigner]
+            else:
+                signer_cmd = [apksigner]
             
             # Prioritize custom keystore if Variant is Release OR if auto_sign is disabled
             use_custom = False
@@ -167,6 +239,7 @@ class BuildEngine:
                 if variant == "Release" or not self.signing_config.get('auto_sign', True):
                     use_custom = True
 
+            keystore = None
             if use_custom:
                 ks = self.signing_config.get('custom_ks', {})
                 ks_path = ks.get('path')
@@ -175,12 +248,8 @@ class BuildEngine:
                 ks_key_pass = ks.get('key_pass')
                 
                 if ks_path and os.path.exists(ks_path) and ks_alias:
-                    self.log(f"Step 7: Signing APK (Release/Custom)...")
-                    if apksigner.endswith(".jar"):
-                        cmd = ["java", "-Xmx1024M", "-jar", apksigner]
-                    else:
-                        cmd = [apksigner]
-                    cmd += [
+                    sign_title = "Step 6: Signing APK (Release/Custom)..."
+                    args = [
                         "sign", 
                         "--ks", ks_path, 
                         "--ks-pass", f"pass:{ks_pass}",
@@ -188,39 +257,127 @@ class BuildEngine:
                         "--key-pass", f"pass:{ks_key_pass}",
                         "--out", final_apk, aligned_apk
                     ]
-                    self._run_cmd(cmd)
-                    self.log(f"RELEASE BUILD SUCCESSFUL! APK at: {final_apk}")
-                    return True
+                    keystore = (ks_path, ks_pass, ks_alias, ks_key_pass)
+                    sign_values = [ks_alias, self._secret_digest(ks_pass), self._secret_digest(ks_key_pass),
+                                   signer.is_available()]
+                    success = f"RELEASE BUILD SUCCESSFUL! APK at: {final_apk}"
                 else:
                     self.log("Warning: Custom keystore info incomplete. Falling back to debug.")
             
             # Fallback to debug keystore if specifically Debug variant OR if release info is missing
-            self.log(f"Step 7: Signing APK ({variant})...")
-            if variant == "Release" and (not self.signing_config or self.signing_config.get('auto_sign', True)):
-                 self.log("Warning: Release variant requested but no custom keystore provided. Using debug keystore.")
-            
-            debug_keystore = os.path.join(self.base_dir, "debug.keystore")
-            if not os.path.exists(debug_keystore):
-                self._gen_debug_keystore(debug_keystore)
+            if keystore is None:
+                if variant == "Release" and (not self.signing_config or self.signing_config.get('auto_sign', True)):
+                    self.log("Warning: Release variant requested but no custom keystore provided. "
+                             "Using debug keystore.")
+                sign_title = f"Step 6: Signing APK ({variant})..."
+                debug_keystore = os.path.join(self.base_dir, "debug.keystore")
+                # Generated (first build only) while the rest of the pipeline runs
+                graph.add("debug_keystore", self.ensure_debug_keystore, outputs=[debug_keystore])
+                args = ["sign", "--ks", debug_keystore, "--ks-pass", "pass:android", "--out", final_apk, aligned_apk]
+                keystore = (debug_keystore, "android", "androiddebugkey", "android")
+                sign_values = ["androiddebugkey", signer.is_available()]
+                success = f"DEBUG BUILD SUCCESSFUL! APK at: {final_apk}"
 
-            if apksigner.endswith(".jar"):
-                cmd = ["java", "-Xmx1024M", "-jar", apksigner]
-            else:
-                cmd = [apksigner]
-                
-            cmd += ["sign", "--ks", debug_keystore, "--ks-pass", "pass:android", "--out", final_apk, aligned_apk]
-            self._run_cmd(cmd)
+            def sign():
+                self.log(sign_title)
+                # The output path is part of the key: Debug and Release share aligned.apk and may share a keystore
+                key = cache.key(files=[apksigner, aligned_apk, keystore[0]], values=sign_values + [final_apk, variant])
+                self._cached_step(cache, "sign", key,
+                                  lambda: self._sign(aligned_apk, final_apk, keystore, args, signer_cmd, apksigner))
+            graph.add("sign", sign, inputs=[apksigner, aligned_apk, keystore[0]], outputs=[final_apk])
 
-            self.log(f"DEBUG BUILD SUCCESSFUL! APK at: {final_apk}")
+            graph.run()
+            self.log(graph.summary())
+            if not os.path.exists(final_apk):
+                self.log(f"BUILD FAILED: {final_apk} was not written.")
+                return False
+            self.log(success)
             return True
 
+        except BuildCancelled:
+            self.log("BUILD CANCELLED.")
+            return False
         except Exception as e:
             self.log(f"BUILD FAILED: {str(e)}")
             import traceback
             self.log(traceback.format_exc())
             return False
 
-    def _run_cmd(self, cmd):
+    def cancel(self):
+        """Stops the running build from another thread: running tools are killed, no further step starts."""
+        self.runner.cancel()
+
+    def ensure_debug_keystore(self):
+        """Returns the shared debug keystore path, generating it on first use."""
+        debug_keystore = os.path.join(self.base_dir, "debug.keystore")
+        if not os.path.exists(debug_keystore):
+            self._gen_debug_keystore(debug_keystore)
+        return debug_keystore
+
+    def _cached_step(self, cache, name, key, action):
+        """Runs action() unless the cache holds fresh outputs for this key. action returns its output paths."""
+        self.runner.check_cancelled()
+        with trace.span(name, "step") as span:
+            if self.use_cache and cache.is_fresh(name, key):
+                self.log(f"Up to date, reusing cached outputs ({name}).")
+                span["cached"] = True
+                return False
+            cache.invalidate(name)
+            outputs = action()
+            # A step the daemon finished after cancel() must not be recorded as fresh
+            self.runner.check_cancelled()
+            cache.record(name, key, outputs)
+            span["bytes_out"] = trace.path_bytes(outputs)
+            return True
+
+    @staticmethod
+    def _tool_path(tool):
+        """Resolves a tool name to the file that should be hashed as its version."""
+        if os.path.isabs(tool):
+            return tool
+        return shutil.which(tool) or tool
+
+    @staticmethod
+    def _secret_digest(value):
+        return hashlib.sha256((value or "").encode('utf-8')).hexdigest()
+
+    def _sign(self, unsigned_apk, final_apk, keystore, args, signer_cmd, apksigner):
+        """Signs in-process when 'cryptography' is installed and can read the keystore, else runs apksigner."""
+        if signer.is_available():
+            try:
+                private_key, certificates = signer.load_keystore(*keystore)
+            except signer.SigningError as e:
+                self.log(f"Native signer unavailable ({str(e)}), falling back to apksigner.")
+            else:
+                self.log("Signing in-process (v1 + v2 + v3 signature schemes)...")
+                signer.ApkSigner(private_key, certificates, min_sdk=self.MIN_SDK).sign(unsigned_apk, final_apk)
+                return [final_apk]
+        self._run_java_tool("apksigner", args, signer_cmd + args, jar=apksigner)
+        return [final_apk]
+
+    def _run_java_tool(self, tool, args, cmd, jar=None):
+        """Runs javac/d8/apksigner in the warm build daemon if it serves this tool, else as a new process."""
+        # javac only when the daemon runs on the JDK of the javac hashed into the cache keys
+        javac = self._tool_path(self.jdk_tools.get('javac') or 'javac')
+        if self.daemon and (jar is None or jar.endswith(".jar")) and self.daemon.serves(tool, jar, javac=javac):
+            self.log(f"Executing in build daemon: {tool} {' '.join(str(a) for a in args[:4])} ...")
+            try:
+                with trace.span(tool, "tool", daemon=True, bytes_in=trace.path_bytes(args)) as span:
+                    # Same timeout as a subprocess; cancel() and a failing parallel task abort the request too
+                    code, output = self.daemon.run(tool, args, timeout=self.runner.timeout, runner=self.runner)
+                    span["exit_code"] = code
+            except DaemonAborted:
+                self.runner.check_cancelled()
+                raise Exception(f"{tool} was stopped because another build step failed")
+            except DaemonUnavailable as e:
+                self.log(f"Build daemon unavailable ({str(e)}), falling back to a new process.")
+            else:
+                if code != 0:
+                    raise Exception(f"Command failed with exit code {code}: {output.strip() or 'Unknown error'}")
+                return
+        self._run_cmd(cmd, name=tool)
+
+    def _run_cmd(self, cmd, name=None):
         # Normalize all paths in the command to avoid issues with mixed slashes or non-ASCII
         # Note: We only normalize strings that look like paths (contain / or \)
         safe_cmd = []
@@ -231,14 +388,18 @@ class BuildEngine:
             else:
                 safe_cmd.append(str(arg))
 
-        self.log(f"Executing: {' '.join(['\"'+a+'\"' if ' ' in a else a for a in safe_cmd])}")
+        quoted = ['"' + a + '"' if ' ' in a else a for a in safe_cmd]
+        self.log(f"Executing: {' '.join(quoted)}")
         
         # Use a more robust way to handle non-ASCII paths on Windows
         try:
-            res = subprocess.run(safe_cmd, capture_output=True, text=True, shell=(os.name == 'nt'))
+            res = self.runner.run(safe_cmd, name=name, shell=(os.name == 'nt'))
             if res.returncode != 0:
+                # Output was already streamed to the log; the last lines of stderr are kept for the message
                 error_msg = res.stderr.strip() if res.stderr else "Unknown error (empty stderr)"
                 raise Exception(f"Command failed with exit code {res.returncode}: {error_msg}")
+        except BuildCancelled:
+            raise
         except Exception as e:
             if "Command failed" in str(e):
                 raise e
@@ -246,6 +407,8 @@ class BuildEngine:
 
     def _find_tool(self, name):
         """Finds tool in bin dir, supports .jar, .exe, .bat."""
+        if self.sdk_tools.get(name):
+            return self.sdk_tools[name]
         # Prioritize .jar so we can control JVM args directly
         for ext in [".jar", ".exe", ".bat", ""]:
             path = os.path.join(self.tools_dir, name + ext)
@@ -253,52 +416,41 @@ class BuildEngine:
                 return path
         raise Exception(f"Tool {name} not found in {self.tools_dir}")
 
-    def _add_to_zip(self, zip_path, file_to_add, arcname):
-        import zipfile
-        with zipfile.ZipFile(zip_path, 'a') as z:
-            z.write(file_to_add, arcname)
+    def _pack_assets(self, assets_zip, assets_dir):
+        """Compresses assets/ into a zip whose entries _package_apk copies into the APK without recompressing."""
+        tmp_path = assets_zip + ".tmp"
+        with ApkWriter(tmp_path) as apk:
+            if os.path.isdir(assets_dir):
+                apk.add_tree("assets", assets_dir)
+        os.replace(tmp_path, assets_zip)
+        return [assets_zip]
+
+    def _package_apk(self, apk_path, resources_apk, dex_file, assets_zip):
+        tmp_path = apk_path + ".tmp"
+        with ApkWriter(tmp_path) as apk:
+            apk.add_zip_entries(resources_apk, exclude={"classes.dex"})
+            apk.add_file("classes.dex", dex_file, compress=True)
+            apk.add_zip_entries(assets_zip)
+        os.replace(tmp_path, apk_path)
 
     def _gen_debug_keystore(self, path):
         self.log("Generating debug keystore...")
-        keytool = self.jdk_tools.get('keytool', 'keytool')
-        cmd = [
-            keytool, "-genkey", "-v", "-keystore", path, 
-            "-storepass", "android", "-alias", "androiddebugkey", 
-            "-keypass", "android", "-keyalg", "RSA", "-keysize", "2048", 
-            "-validity", "10000", "-dname", "CN=Android Debug,O=Android,C=US"
-        ]
-        self._run_cmd(cmd)
-
-class ADBManager:
-    def __init__(self, tools_dir, logger=None):
-        self.adb = os.path.join(tools_dir, "adb.exe")
-        self.logger = logger
-
-    def log(self, msg):
-        if self.logger: self.logger(msg)
-
-    def list_devices(self):
-        try:
-            res = subprocess.run([self.adb, "devices"], capture_output=True, text=True, shell=True)
-            lines = res.stdout.strip().split('\n')[1:]
-            devices = [line.split('\t')[0] for line in lines if '\tdevice' in line]
-            return devices
-        except:
-            return []
-
-    def install_apk(self, device_id, apk_path):
-        if not os.path.exists(apk_path):
-            return False, "APK file not found."
-        
-        self.log(f"Installing to {device_id}...")
-        cmd = [self.adb, "-s", device_id, "install", "-r", apk_path]
-        res = subprocess.run(cmd, capture_output=True, text=True, shell=True)
-        if res.returncode == 0:
-            self.log("Install Successful!")
-            return True, "Success"
+        # Written aside and renamed, so a keytool killed by a failing sibling step leaves no half keystore
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if signer.is_available():
+            signer.create_debug_keystore(tmp_path)
         else:
-            self.log(f"Install Failed: {res.stderr}")
-            return False, res.stderr
+            keytool = self.jdk_tools.get('keytool') or 'keytool'
+            cmd = [
+                keytool, "-genkey", "-v", "-keystore", tmp_path,
+                "-storepass", "android", "-alias", "androiddebugkey",
+                "-keypass", "android", "-keyalg", "RSA", "-keysize", "2048",
+                "-validity", "10000", "-dname", "CN=Android Debug,O=Android,C=US"
+            ]
+            self._run_cmd(cmd)
+        os.replace(tmp_path, path)
 
 class APKAnalyzer:
     def __init__(self, aapt2_path):
@@ -0,0 +1,298 @@
+import hashlib
+import http.client
+import json
+import os
+import struct
+import time
+import urllib.error
+import urllib.request
+import zipfile
+import zlib
+
+CHUNK_SIZE = 256 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class NotStreamable(Exception):
+    """The archive cannot be unpacked front to back; it has to be extracted once it is complete."""
+
+
+class ResumableDownload:
+    """
+    File-like reader over an HTTP download that is saved to part_path as it is read.
+
+    Bytes already in part_path (left by an interrupted run) are served
+    first and only the rest is requested, with a Range header; a dropped
+    connection is resumed the same way, up to `retries` times in a row.
+    If-Range with the server's ETag / Last-Modified makes sure the parts
+    belong to the same file. sha256 covers every byte read so far.
+    """
+
+    def __init__(self, url, part_path, timeout=30, retries=5, logger=None, on_progress=None):
+        self.url = url
+        self.part_path = part_path
+        self.timeout = timeout
+        self.retries = retries
+        self.logger = logger
+        self.on_progress = on_progress  # callable(position, size or None)
+        self.sha256 = hashlib.sha256()
+        self.position = 0
+        self.size = None
+        self._response = None
+        self._validator = self._load_meta()
+        self._disk = open(part_path, 'a+b')
+        self._on_disk = self._disk.seek(0, os.SEEK_END)
+        # Connect before anything is read so a server that ignores Range simply restarts the file
+        self._connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def log(self, msg):
+        if self.logger:
+            self.logger(msg)
+
+    def read(self, n=CHUNK_SIZE):
+        if self.position < self._on_disk:
+            self._disk.seek(self.position)
+            data = self._disk.read(min(n, self._on_disk - self.position))
+        else:
+            data = self._read_network(n)
+        self.position += len(data)
+        self.sha256.update(data)
+        if data and self.on_progress:
+            self.on_progress(self.position, self.size)
+        return data
+
+    def drain(self):
+        """Reads (and hashes) the rest of the download."""
+        while self.read(CHUNK_SIZE):
+            pass
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+        self._disk.close()
+
+    def discard(self):
+        """Deletes the part file and its metadata (after a successful install, or a corrupt download)."""
+        self.close()
+        for path in (self.part_path, self.part_path + ".json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _read_network(self, n):
+        failures = 0
+        while True:
+            try:
+                if self._response is None:
+                    return b""
+                data = self._response.read(n)
+                if not data and self.size is not None and self.position < self.size:
+                    raise http.client.IncompleteRead(b"", self.size - self.position)
+                if data:
+                    self._disk.write(data)
+                    self._disk.flush()
+                    self._on_disk += len(data)
+                return data
+            except (OSError, http.client.HTTPException) as e:
+                failures += 1
+                if failures > self.retries:
+                    raise DownloadError(f"Download of {self.url} failed: {e}")
+                self.log(f"Connection lost ({e}), resuming at {self.position / (1024 * 1024):.1f} MB...")
+                time.sleep(min(2 ** (failures - 1), 30))
+                if self._response is not None:
+                    self._response.close()
+                self._connect()
+
+    def _connect(self):
+        request = urllib.request.Request(self.url, headers={"User-Agent": "website2app"})
+        if self._on_disk:
+            request.add_header("Range", f"bytes={self._on_disk}-")
+            if self._validator:
+                request.add_header("If-Range", self._validator)
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and self._on_disk:
+                self._response = None  # Nothing left to fetch: the part file is already complete
+                self.size = self._on_disk
+                return
+            raise DownloadError(f"Download of {self.url} failed: HTTP {e.code}")
+        except urllib.error.URLError as e:
+            raise DownloadError(f"Download of {self.url} failed: {e.reason}")
+
+        if response.status == 206:
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rsplit("/", 1)[-1]
+            self.size = int(total) if total.isdigit() else None
+        else:
+            if self.position:
+                response.close()
+                raise DownloadError(f"{self.url} changed on the server during the download")
+            if self._on_disk:
+                self.log(f"Server did not resume {os.path.basename(self.part_path)}, starting over.")
+            self._disk.truncate(0)
+            self._on_disk = 0
+            length = response.headers.get("Content-Length")
+            self.size = int(length) if length and length.isdigit() else None
+        self._response = response
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if response.status != 206 or (validator and validator != self._validator):
+            # Weak ETags are not allowed in If-Range
+            self._validator = validator if validator and not validator.startswith("W/") else None
+            self._save_meta()
+
+    def _load_meta(self):
+        try:
+            with open(self.part_path + ".json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("url") != self.url and os.path.exists(self.part_path):
+            os.remove(self.part_path)  # Left over from another URL (or without metadata): useless
+            return None
+        return meta.get("validator")
+
+    def _save_meta(self):
+        with open(self.part_path + ".json", 'w', encoding='utf-8') as f:
+            json.dump({"url": self.url, "validator": self._validator}, f)
+
+
+class _Reader:
+    """Exact reads with push-back over a read(n) stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = b""
+
+    def read(self, n):
+        if self.buffer:
+            data, self.buffer = self.buffer[:n], self.buffer[n:]
+            return data
+        return self.stream.read(n)
+
+    def read_upto(self, n):
+        """n bytes, or fewer at the end of the stream."""
+        data = b""
+        while len(data) < n:
+            chunk = self.read(n - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def read_exact(self, n):
+        data = self.read_upto(n)
+        if len(data) < n:
+            raise DownloadError("Archive is truncated")
+        return data
+
+    def unread(self, data):
+        self.buffer = data + self.buffer
+
+
+def extract_zip_stream(stream, select, dest_dir):
+    """
+    Extracts zip members while the archive is still arriving, by walking
+    its local file headers front to back (the central directory at the end
+    is never needed). select(member name) returns the file name to write
+    under dest_dir, or None to skip the member. Raises NotStreamable for
+    layouts that need the whole file (stored members with data descriptors,
+    encryption, unusual compression).
+    """
+    reader = _Reader(stream)
+    written = []
+    while True:
+        if reader.read_upto(4) != b"PK\x03\x04":
+            return written  # Central directory: every member has been seen
+        _, flags, method, _, _, crc, csize, usize, name_len, extra_len = struct.unpack("<HHHHHIIIHH",
+                                                                                    reader.read_exact(26))
+        name = reader.read_exact(name_len).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = reader.read_exact(extra_len)
+        zip64 = csize == 0xFFFFFFFF or usize == 0xFFFFFFFF
+        if zip64:
+            usize, csize = _zip64_sizes(extra, usize, csize)
+        if flags & 0x1 or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise NotStreamable(f"{name} is encrypted or uses compression method {method}")
+        descriptor = bool(flags & 0x8)
+        if descriptor and method == zipfile.ZIP_STORED:
+            raise NotStreamable(f"{name} is stored without its size in the local header")
+
+        target = None if name.endswith('/') else select(name)
+        out = open(os.path.join(dest_dir, target), 'wb') if target else None
+        try:
+            actual_crc = _copy_member(reader, out, method, None if descriptor else csize)
+        finally:
+            if out:
+                out.close()
+        if descriptor:
+            signature = reader.read_exact(4)
+            if signature != b"PK\x07\x08":
+                reader.unread(signature)  # The descriptor signature is optional
+            crc = struct.unpack("<I", reader.read_exact(4))[0]
+            reader.read_exact(16 if zip64 else 8)
+        if target:
+            if actual_crc != crc:
+                raise DownloadError(f"CRC mismatch in {name}")
+            written.append(target)
+
+
+def _copy_member(reader, out, method, csize):
+    """Copies (inflating if needed) one member's data to out (None to skip it). Returns its CRC-32."""
+    crc = 0
+    inflater = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+    remaining = csize
+    while remaining is None or remaining > 0:
+        chunk = reader.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise DownloadError("Archive is truncated")
+        if remaining is not None:
+            remaining -= len(chunk)
+        data = inflater.decompress(chunk) if inflater else chunk
+        if out:
+            crc = zlib.crc32(data, crc)
+            out.write(data)
+        if inflater and inflater.eof:
+            reader.unread(inflater.unused_data)
+            break
+    return crc
+
+
+def _zip64_sizes(extra, usize, csize):
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, pos)
+        if header_id == 0x0001:
+            values = list(struct.unpack_from(f"<{size // 8}Q", extra, pos + 4))
+            if usize == 0xFFFFFFFF and values:
+                usize = values.pop(0)
+            if csize == 0xFFFFFFFF and values:
+                csize = values.pop(0)
+            break
+        pos += 4 + size
+    return usize, csize
+
+
+def extract_zip_file(path, select, dest_dir):
+    """extract_zip_stream for a complete archive on disk (works for every layout zipfile supports)."""
+    written = []
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            target = None if info.is_dir() else select(info.filename)
+            if target:
+                with archive.open(info) as source, open(os.path.join(dest_dir, target), 'wb') as out:
+                    while True:
+                        chunk = source.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                written.append(target)
+    return written
@@ -1,29 +1,72 @@
 import os
 import shutil
-from jinja2 import Environment, FileSystemLoader
+from builder import trace
+from builder.images import FORMATS, shared_pipeline
+from builder.project_ir import ProjectIR
+from builder.templates import get_environment
+from builder.tree_writer import TreeWriter
+
+ICON_DENSITIES = {
+    "mipmap-mdpi": 48,
+    "mipmap-hdpi": 72,
+    "mipmap-xhdpi": 96,
+    "mipmap-xxhdpi": 144,
+    "mipmap-xxxhdpi": 192
+}
+
+# Screen size (portrait, px) each splash bucket is scaled to cover
+SPLASH_DENSITIES = {
+    "drawable-mdpi": (320, 480),
+    "drawable-hdpi": (480, 800),
+    "drawable-xhdpi": (720, 1280),
+    "drawable-xxhdpi": (1080, 1920),
+    "drawable-xxxhdpi": (1440, 2560)
+}
+
+# Without density buckets there is one splash that Android never rescales by density
+SPLASH_SINGLE_DIR = "drawable-nodpi"
+
+# "image_optimization" config value -> (format, lossless splash, splash per density bucket); icons are always lossless
+IMAGE_OPTIMIZATIONS = {
+    "None": ("png", True, False),
+    "Lossless PNG": ("png-optimized", True, True),
+    "WebP": ("webp", False, True)
+}
 
 class ProjectGenerator:
     def __init__(self, template_dir):
-        self.env = Environment(loader=FileSystemLoader(template_dir))
+        self.env = get_environment(template_dir)
         self.template_dir = template_dir
 
-    def generate(self, config, output_dir):
+    def generate(self, config, output_dir, clean=False, ir=None):
         """
         Generates the Android project structure.
+
+        The tree is rendered into memory first and then applied with a
+        TreeWriter: only files whose bytes changed are rewritten and files
+        that are no longer generated are deleted, so mtimes of unchanged
+        files survive and incremental build steps keep hitting their cache.
+        Pass clean=True to wipe app/ (including build_manual/) first, and a
+        ProjectIR to share parsing and web content with other targets.
+        Returns the written/unchanged/deleted file counts plus an "images"
+        report of the source image bytes against the bytes shipped, and
+        a "web" report when optimize_web_assets is enabled.
         """
         # Define paths
         app_dir = os.path.join(output_dir, "app")
         
-        # CLEAN OLD OUTPUT to prevent stale files from breaking the build
-        if os.name == 'nt':
-            if os.path.exists(app_dir):
-                import time
-                shutil.rmtree(app_dir, ignore_errors=True)
-                # Brief wait to let OneDrive release any locks
-                time.sleep(0.5)
-        elif os.path.exists(app_dir):
-            shutil.rmtree(app_dir)
+        if clean:
+            if os.name == 'nt':
+                if os.path.exists(app_dir):
+                    import time
+                    shutil.rmtree(app_dir, ignore_errors=True)
+                    # Brief wait to let OneDrive release any locks
+                    time.sleep(0.5)
+            elif os.path.exists(app_dir):
+                shutil.rmtree(app_dir)
         
+        # build_manual/ holds BuildEngine's cached intermediates and must survive regeneration
+        self.writer = TreeWriter(app_dir, keep=["build_manual"])
         src_main = os.path.join(app_dir, "src", "main")
         assets_dir = os.path.join(src_main, "assets")
         java_dir = os.path.join(src_main, "java")
@@ -33,14 +76,15 @@ class ProjectGenerator:
         package_path = config['package_name'].replace('.', os.sep)
         final_java_path = os.path.join(java_dir, package_path)
         
-        os.makedirs(final_java_path, exist_ok=True)
-        os.makedirs(os.path.join(res_dir, "layout"), exist_ok=True)
-        os.makedirs(os.path.join(res_dir, "values"), exist_ok=True)
-        os.makedirs(assets_dir, exist_ok=True)
-        
         # Handle Web Content
-        self._process_web_content(config, assets_dir)
+        ir = ir or ProjectIR(config)
+        ir.add_web_content(self.writer, assets_dir)
         
+        optimization = config.get('image_optimization', "None")
+        self.image_format, self.lossless_splash, self.splash_buckets = IMAGE_OPTIMIZATIONS.get(
+            optimization, IMAGE_OPTIMIZATIONS["None"])
+        self.image_report = {"original_bytes": 0, "output_bytes": 0}
+
         # Process Icons (Use default if not provided)
         if config.get('icon_path') and os.path.exists(config['icon_path']):
             self._process_icons(config['icon_path'], res_dir)
@@ -52,159 +96,125 @@ class ProjectGenerator:
             self._process_splash(config['splash_path'], res_dir)
 
         # Prepare config for template
-        template_config = config.copy()
-        if config.get('headers'):
-            try:
-                import json
-                template_config['headers_dict'] = json.loads(config['headers'])
-            except:
-                template_config['headers_dict'] = {}
-        else:
-            template_config['headers_dict'] = {}
+        template_config = ir.template_context()
 
         # Render and write files
-        self._render_to_file('build.gradle', template_config, os.path.join(app_dir, "build.gradle"))
-        self._render_to_file('AndroidManifest.xml', template_config, os.path.join(src_main, "AndroidManifest.xml"))
-        self._render_to_file('MainActivity.java', template_config, os.path.join(final_java_path, "MainActivity.java"))
-        
-        # Resources
-        self._create_strings_xml(config['app_title'], os.path.join(res_dir, "values", "strings.xml"))
-        self._create_layout_xml(config, os.path.join(res_dir, "layout", "activity_main.xml"))
-        
+        with trace.span("render templates", "generate"):
+            self._render_to_file('build.gradle', template_config, os.path.join(app_dir, "build.gradle"))
+            self._render_to_file('AndroidManifest.xml', template_config, os.path.join(src_main, "AndroidManifest.xml"))
+            self._render_to_file('MainActivity.java', template_config,
+                                 os.path.join(final_java_path, "MainActivity.java"))
+
+            # Resources
+            self._render_to_file('strings.xml', template_config, os.path.join(res_dir, "values", "strings.xml"))
+            self._render_to_file('activity_main.xml', template_config,
+                                 os.path.join(res_dir, "layout", "activity_main.xml"))
+
+        with trace.span("write android tree", "generate") as span:
+            stats = self.writer.commit()
+            span.update(stats)
+        report = self.image_report
+        stats["images"] = dict(report, saved_bytes=report["original_bytes"] - report["output_bytes"])
+        stats["web"] = ir.web_stats
+
         # Root level build.gradle and settings.gradle
         self._create_root_gradle(output_dir)
-
-    def _process_web_content(self, config, assets_dir):
-        mode = config.get('web_mode')
-        path = config.get('web_path')
-        
-        if mode == "Local Folder" and path and os.path.exists(path):
-            # Copy entire folder to assets
-            for item in os.listdir(path):
-                s = os.path.join(path, item)
-                d = os.path.join(assets_dir, item)
-                if os.path.isdir(s):
-                    shutil.copytree(s, d, dirs_exist_ok=True)
-                else:
-                    shutil.copy2(s, d)
-        elif mode == "Single HTML File" and path and os.path.exists(path):
-            shutil.copy2(path, os.path.join(assets_dir, "index.html"))
+        return stats
 
     def _process_icons(self, icon_path, res_dir):
         try:
-            from PIL import Image
-            img = Image.open(icon_path)
-            densities = {
-                "mipmap-mdpi": 48,
-                "mipmap-hdpi": 72,
-                "mipmap-xhdpi": 96,
-                "mipmap-xxhdpi": 144,
-                "mipmap-xxxhdpi": 192
-            }
-            for name, size in densities.items():
-                target_dir = os.path.join(res_dir, name)
-                os.makedirs(target_dir, exist_ok=True)
-                resized = img.resize((size, size), Image.Resampling.LANCZOS)
-                resized.save(os.path.join(target_dir, "ic_launcher.png"))
+            with trace.span("icons", "assets", bytes_in=os.path.getsize(icon_path)) as span:
+                pipeline = shared_pipeline()
+                images = pipeline.render(icon_path, ICON_DENSITIES.values(), fmt=self.image_format)
+                self._write_icons(images, res_dir)
+                span["bytes_out"] = sum(map(len, images.values()))
+            self._report(os.path.getsize(icon_path), sum(map(len, images.values())))
         except Exception as e:
             print(f"Icon processing failed: {e}")
 
     def _generate_default_icon(self, res_dir):
         try:
-            from PIL import Image, ImageDraw
-            # Create a simple blue icon with a white square
-            size = 512
-            img = Image.new('RGB', (size, size), color=(33, 150, 243))
-            draw = ImageDraw.Draw(img)
-            draw.rectangle([size//4, size//4, 3*size//4, 3*size//4], fill=(255, 255, 255))
-            
-            densities = {
-                "mipmap-mdpi": 48,
-                "mipmap-hdpi": 72,
-                "mipmap-xhdpi": 96,
-                "mipmap-xxhdpi": 144,
-                "mipmap-xxxhdpi": 192
-            }
-            for name, target_size in densities.items():
-                target_dir = os.path.join(res_dir, name)
-                os.makedirs(target_dir, exist_ok=True)
-                resized = img.resize((target_size, target_size), Image.Resampling.LANCZOS)
-                resized.save(os.path.join(target_dir, "ic_launcher.png"))
+            images = shared_pipeline().render_generated("default-icon-1", self._draw_default_icon,
+                                                        ICON_DENSITIES.values(), fmt=self.image_format)
+            self._write_icons(images, res_dir)
         except Exception as e:
             print(f"Default icon generation failed: {e}")
 
+    @staticmethod
+    def _draw_default_icon():
+        from PIL import Image, ImageDraw
+        # Create a simple blue icon with a white square
+        size = 512
+        img = Image.new('RGB', (size, size), color=(33, 150, 243))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([size//4, size//4, 3*size//4, 3*size//4], fill=(255, 255, 255))
+        return img
+
+    def _write_icons(self, images, res_dir):
+        ext = FORMATS[self.image_format]
+        for name, size in ICON_DENSITIES.items():
+            self.writer.write_bytes(os.path.join(res_dir, name, "ic_launcher" + ext), images[size])
+
     def _process_splash(self, splash_path, res_dir):
+        """
+        Emits one splash drawable per density bucket, scaled down to just
+        cover that bucket's screen size, instead of one full-size bitmap that
+        every device has to decode at startup. Without an optimization mode
+        the buckets would add up to more than the source, so a single splash
+        capped at the largest bucket's size is shipped instead.
+
+        A splash at the source's size reuses the source file's bytes when it
+        is already in the output format and no larger than the encoding.
+        """
         try:
-            from PIL import Image
-            img = Image.open(splash_path)
-            # Create a drawable folder for splash
-            target_dir = os.path.join(res_dir, "drawable")
-            os.makedirs(target_dir, exist_ok=True)
-            # Just copy the splash as is or resize to a standard large size
-            img.save(os.path.join(target_dir, "splash.png"))
+            with trace.span("splash", "assets", bytes_in=os.path.getsize(splash_path)) as span:
+                pipeline = shared_pipeline()
+                source = pipeline.source_size(splash_path)
+                if self.splash_buckets:
+                    sizes = {name: self._splash_size(source, screen) for name, screen in SPLASH_DENSITIES.items()}
+                else:
+                    sizes = {SPLASH_SINGLE_DIR: self._splash_size(source, SPLASH_DENSITIES["drawable-xxxhdpi"])}
+                original = None
+                if source in sizes.values() and \
+                        pipeline.source_format(splash_path) == FORMATS[self.image_format][1:].upper():
+                    with open(splash_path, 'rb') as f:
+                        original = f.read()
+                images = {}
+                if original is None or self.splash_buckets:
+                    images = pipeline.render(splash_path, set(sizes.values()), fmt=self.image_format,
+                                             lossless=self.lossless_splash)
+                if original is not None and len(original) <= len(images.get(source, original)):
+                    images[source] = original
+                filename = "splash" + FORMATS[self.image_format]
+                for name, size in sizes.items():
+                    self.writer.write_bytes(os.path.join(res_dir, name, filename), images[size])
+                span["bytes_out"] = sum(len(images[size]) for size in sizes.values())
+            # Baseline is the source file: encoding anything just for the report would cost more than it saves
+            self._report(os.path.getsize(splash_path), sum(len(images[size]) for size in sizes.values()))
         except Exception as e:
             print(f"Splash processing failed: {e}")
 
+    @staticmethod
+    def _splash_size(source, screen):
+        width, height = source
+        if width > height:
+            screen = (screen[1], screen[0])
+        scale = min(1.0, max(screen[0] / width, screen[1] / height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def _report(self, original_bytes, output_bytes):
+        self.image_report["original_bytes"] += original_bytes
+        self.image_report["output_bytes"] += output_bytes
+
     def _render_to_file(self, template_name, context, output_path):
         template = self.env.get_template(template_name)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(template.render(context))
-
-    def _create_strings_xml(self, app_name, path):
-        content = f'''<resources>
-    <string name="app_name">{app_name}</string>
-</resources>'''
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
-
-    def _create_layout_xml(self, config, path):
-        # Simple FrameLayout that works without AndroidX
-        template_content = '''<?xml version="1.0" encoding="utf-8"?>
-<FrameLayout xmlns:android="http://schemas.android.com/apk/res/android"
-    android:layout_width="match_parent"
-    android:layout_height="match_parent">
-
-    <WebView
-        android:id="@+id/webview"
-        android:layout_width="match_parent"
-        android:layout_height="match_parent" />
-
-</FrameLayout>
-'''
-        # Create a dummy Jinja2 environment for this specific string template
-        # This allows us to use Jinja2 logic directly within the Python string
-        env = Environment(loader=FileSystemLoader('.')) # Loader doesn't matter as we use from_string
-        template = env.from_string(template_content)
-        content = template.render(config)
-
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        self.writer.write_text(output_path, template.render(context))
 
     def _create_root_gradle(self, output_dir):
-        settings = "rootProject.name = 'My Application'\ninclude ':app'"
-        with open(os.path.join(output_dir, "settings.gradle"), "w", encoding='utf-8') as f:
-            f.write(settings)
-            
-        build_gradle = """// Top-level build file where you can add configuration options common to all sub-projects/modules.
-buildscript {
-    repositories {
-        google()
-        mavenCentral()
-    }
-    dependencies {
-        classpath 'com.android.tools.build:gradle:7.4.2'
-    }
-}
-
-allprojects {
-    repositories {
-        google()
-        mavenCentral()
-    }
-}
-
-task clean(type: Delete) {
-    delete rootProject.buildDir
-}"""
-        with open(os.path.join(output_dir, "build.gradle"), "w", encoding='utf-8') as f:
-            f.write(build_gradle)
+        # The output directory belongs to the user, so only our two files are managed here
+        root_writer = TreeWriter(output_dir, prune=False)
+        root_writer.write_text(os.path.join(output_dir, "settings.gradle"),
+                               self.env.get_template('settings.gradle').render())
+        root_writer.write_text(os.path.join(output_dir, "build.gradle"),
+                               self.env.get_template('root.build.gradle').render())
+        root_writer.commit()
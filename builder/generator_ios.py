@@ -1,35 +1,50 @@
 import os
 import shutil
-from jinja2 import Environment, FileSystemLoader
+from builder import trace
+from builder.images import shared_pipeline
+from builder.project_ir import ProjectIR
+from builder.templates import get_environment
+from builder.tree_writer import TreeWriter
+
+# AppIcon.appiconset file -> pixel size; 120px is shared by icon-40@3x and icon-60@2x
+ICON_SIZES = {
+    "icon-20@2x.png": 40, "icon-20@3x.png": 60,
+    "icon-29@2x.png": 58, "icon-29@3x.png": 87,
+    "icon-40@2x.png": 80, "icon-40@3x.png": 120,
+    "icon-60@2x.png": 120, "icon-60@3x.png": 180,
+    "icon-1024.png": 1024
+}
 
 class IOSProjectGenerator:
     def __init__(self, template_dir):
-        self.env = Environment(loader=FileSystemLoader(template_dir))
+        self.env = get_environment(template_dir)
         self.template_dir = template_dir
 
-    def generate(self, config, output_dir):
+    def generate(self, config, output_dir, clean=False, ir=None):
         """
         Generates the iOS Xcode project structure.
+
+        Like ProjectGenerator.generate, only files whose bytes changed are
+        rewritten and stale files are deleted unless clean=True is passed.
+        Returns the writer stats plus the "web" report of the ProjectIR.
         """
         project_name = "WebApp"
         ios_dir = os.path.join(output_dir, "WebApp_iOS")
         
         # Clean old export
-        if os.path.exists(ios_dir):
+        if clean and os.path.exists(ios_dir):
             shutil.rmtree(ios_dir, ignore_errors=True)
         
-        os.makedirs(ios_dir, exist_ok=True)
+        self.writer = TreeWriter(ios_dir)
         
         # 1. Copy common web content to assets directory
+        ir = ir or ProjectIR(config)
         assets_dest = os.path.join(ios_dir, project_name, "www")
-        os.makedirs(assets_dest, exist_ok=True)
-        self._process_web_content(config, assets_dest)
+        ir.add_web_content(self.writer, assets_dest)
         
         # 2. Render Swift source and Plist
-        template_config = config.copy()
         # Merge iOS specific config into root for easier template access
-        if 'ios' in config:
-            template_config.update(config['ios'])
+        template_config = ir.template_context(config.get('ios'))
             
         render_files = [
             ("WebApp/AppDelegate.swift", f"{project_name}/AppDelegate.swift"),
@@ -39,34 +54,26 @@ class IOSProjectGenerator:
             ("WebApp.xcodeproj/project.pbxproj", f"{project_name}.xcodeproj/project.pbxproj")
         ]
         
-        for t_path, o_path in render_files:
-            target_out = os.path.join(ios_dir, o_path)
-            os.makedirs(os.path.dirname(target_out), exist_ok=True)
-            self._render_to_file(t_path, template_config, target_out)
+        with trace.span("render ios templates", "generate"):
+            for t_path, o_path in render_files:
+                target_out = os.path.join(ios_dir, o_path)
+                self._render_to_file(t_path, template_config, target_out)
 
         # 3. Process Icons for iOS
         self._process_ios_icons(config.get('icon_path'), os.path.join(ios_dir, project_name, "Assets.xcassets"))
 
-    def _process_web_content(self, config, assets_dir):
-        from builder.generator import ProjectGenerator
-        # Reuse the existing web content processing logic if possible, 
-        # but let's just implement it simply here to avoid tight coupling.
-        mode = config.get('web_mode')
-        path = config.get('web_path')
-        
-        if mode == "Local Folder" and path and os.path.exists(path):
-            shutil.copytree(path, assets_dir, dirs_exist_ok=True)
-        elif mode == "Single HTML File" and path and os.path.exists(path):
-            shutil.copy2(path, os.path.join(assets_dir, "index.html"))
+        with trace.span("write ios tree", "generate") as span:
+            stats = self.writer.commit()
+            span.update(stats)
+        stats["web"] = ir.web_stats
+        return stats
 
     def _render_to_file(self, template_name, context, output_path):
         template = self.env.get_template(template_name)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(template.render(context))
+        self.writer.write_text(output_path, template.render(context))
 
     def _process_ios_icons(self, icon_path, xcassets_dir):
         icon_set_dir = os.path.join(xcassets_dir, "AppIcon.appiconset")
-        os.makedirs(icon_set_dir, exist_ok=True)
         
         # Basic Contents.json for Xcode
         contents_json = """{
@@ -83,18 +90,14 @@ class IOSProjectGenerator:
   ],
   "info" : { "version" : 1, "author" : "xcode" }
 }"""
-        with open(os.path.join(icon_set_dir, "Contents.json"), "w") as f:
-            f.write(contents_json)
+        self.writer.write_text(os.path.join(icon_set_dir, "Contents.json"), contents_json)
             
         if icon_path and os.path.exists(icon_path):
             try:
-                from PIL import Image
-                img = Image.open(icon_path)
-                sizes = [40, 60, 58, 87, 80, 120, 120, 180, 1024]
-                filenames = ["icon-20@2x.png", "icon-20@3x.png", "icon-29@2x.png", "icon-29@3x.png", 
-                             "icon-40@2x.png", "icon-40@3x.png", "icon-60@2x.png", "icon-60@3x.png", "icon-1024.png"]
-                for size, fname in zip(sizes, filenames):
-                    resized = img.resize((size, size), Image.Resampling.LANCZOS)
-                    resized.save(os.path.join(icon_set_dir, fname))
+                with trace.span("ios icons", "assets", bytes_in=os.path.getsize(icon_path)) as span:
+                    images = shared_pipeline().render(icon_path, set(ICON_SIZES.values()))
+                    for fname, size in ICON_SIZES.items():
+                        self.writer.write_bytes(os.path.join(icon_set_dir, fname), images[size])
+                    span["bytes_out"] = sum(len(images[size]) for size in ICON_SIZES.values())
             except:
                 pass # Fallback if Pillow fails
@@ -0,0 +1,209 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from builder.cache import file_sha256, user_cache_dir
+
+# Output formats: "png-optimized" is lossless (smaller zlib stream), "webp" needs API 18+ for alpha
+FORMATS = {"png": ".png", "png-optimized": ".png", "webp": ".webp"}
+WEBP_QUALITY = 90
+
+
+class ImagePipeline:
+    """
+    Shared icon/splash rasterizer.
+
+    A source image is decoded once and reduced into a pyramid of half-size
+    levels; every requested size is resampled (LANCZOS) from the smallest
+    level that is still at least twice as large, on a thread pool (Pillow
+    releases the GIL while resizing and encoding). Encoded results are kept
+    in memory and on disk, keyed by the source's content hash plus the
+    target spec, so the Android and iOS generators share work and unchanged
+    icons are never resized again.
+    """
+
+    VERSION = 1  # Bump when the output for a given spec changes
+    MAX_DECODED = 2  # Decoded sources kept around for the other platform's sizes
+
+    def __init__(self, cache_dir=None, max_workers=None):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._encoded = {}  # cache key -> bytes
+        self._decoded = OrderedDict()  # source key -> list of pyramid levels
+        self._digests = {}  # path -> (size, mtime_ns, sha256)
+        self._lock = threading.Lock()
+        self._source_locks = {}
+
+    def render(self, path, sizes, fmt="png", lossless=True):
+        """
+        Returns {size: encoded bytes} for an image file.
+
+        A size is (w, h), an int for squares or None for the source size.
+        fmt is a key of FORMATS; lossless only matters for WebP.
+        """
+        source_key = self._file_digest(path)
+
+        def load():
+            from PIL import Image
+            with Image.open(path) as img:
+                img.load()
+                return img.copy()
+        return self._render(source_key, load, sizes, (fmt, lossless))
+
+    def render_generated(self, name, factory, sizes, fmt="png", lossless=True):
+        """Like render() for an image drawn in code; name must change whenever factory's drawing does."""
+        return self._render(f"generated:{name}", factory, sizes, (fmt, lossless))
+
+    @staticmethod
+    def source_size(path):
+        """(width, height) of an image file, read from its header without decoding the pixels."""
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+
+    @staticmethod
+    def source_format(path):
+        """PIL format name of an image file ("PNG", "JPEG", "WEBP", ...), read from its header."""
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.format
+
+    def _render(self, source_key, load, sizes, output):
+        if output[0] not in FORMATS:
+            raise ValueError(f"Unknown image format: {output[0]}")
+        specs = {}
+        for size in sizes:
+            specs[size] = (size, size) if isinstance(size, int) else size
+
+        with self._lock:
+            source_lock = self._source_locks.setdefault(source_key, threading.Lock())
+        # One thread per source: a concurrent request for the same icon waits and then hits the cache
+        with source_lock:
+            results, missing = {}, {}
+            for size, spec in specs.items():
+                key = self._cache_key(source_key, spec, output)
+                data = self._lookup(key)
+                if data is None:
+                    missing[size] = (spec, key)
+                else:
+                    results[size] = data
+            if not missing:
+                return results
+
+            levels = self._levels(source_key, load)
+            unique = {}
+            for spec, key in missing.values():
+                unique[key] = spec
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique))) as pool:
+                encoded = dict(zip(unique, pool.map(lambda spec: self._encode(levels, spec, output), unique.values())))
+            for key, data in encoded.items():
+                self._store(key, data)
+            for size, (spec, key) in missing.items():
+                results[size] = encoded[key]
+            return results
+
+    def _levels(self, source_key, load):
+        with self._lock:
+            levels = self._decoded.get(source_key)
+            if levels is not None:
+                self._decoded.move_to_end(source_key)
+                return levels
+        img = load()
+        if img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA")  # Palette/bilevel images cannot be LANCZOS-resampled
+        levels = [img]
+        while min(levels[-1].size) >= 64:
+            levels.append(levels[-1].reduce(2))
+        with self._lock:
+            self._decoded[source_key] = levels
+            while len(self._decoded) > self.MAX_DECODED:
+                self._decoded.popitem(last=False)
+        return levels
+
+    @staticmethod
+    def _encode(levels, spec, output):
+        from PIL import Image
+        img = levels[0]
+        if spec is not None:
+            width, height = spec
+            for level in levels:
+                if level.size[0] >= 2 * width and level.size[1] >= 2 * height:
+                    img = level
+            if img.size != (width, height):
+                img = img.resize((width, height), Image.Resampling.LANCZOS)
+        fmt, lossless = output
+        buf = io.BytesIO()
+        if fmt == "webp":
+            if lossless:
+                img.save(buf, format="WEBP", lossless=True, quality=100, method=6)
+            else:
+                img.save(buf, format="WEBP", quality=WEBP_QUALITY, method=6)
+        else:
+            img.save(buf, format="PNG", optimize=(fmt == "png-optimized"))
+        return buf.getvalue()
+
+    # Caching
+    def _cache_key(self, source_key, spec, output):
+        return hashlib.sha256(f"{self.VERSION}|{source_key}|{spec}|{output}".encode('utf-8')).hexdigest()
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _lookup(self, key):
+        data = self._encoded.get(key)
+        if data is None and self.cache_dir:
+            try:
+                with open(self._cache_path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                return None
+            self._encoded[key] = data
+        return data
+
+    def _store(self, key, data):
+        self._encoded[key] = data
+        if not self.cache_dir:
+            return
+        path = self._cache_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # The disk cache is only an optimization
+
+    def _file_digest(self, path):
+        st = os.stat(path)
+        cached = self._digests.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_sha256(path)
+        self._digests[path] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_pipeline():
+    """The process-wide pipeline used by the project generators."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ImagePipeline(cache_dir=user_cache_dir("images"))
+        return _shared
+
+
+def format_image_report(report):
+    """One log line for the generators' image report: {"original_bytes", "output_bytes", "saved_bytes"}."""
+    saved = report["saved_bytes"]
+    percent = 100.0 * saved / report["original_bytes"] if report["original_bytes"] else 0.0
+    return (f"Images: {report['output_bytes'] / 1024:.1f} KB "
+            f"(source images {report['original_bytes'] / 1024:.1f} KB, saved {saved / 1024:.1f} KB / {percent:.0f}%)")
@@ -0,0 +1,220 @@
+import os
+import re
+import shutil
+import struct
+
+from builder.cache import load_state, save_state
+
+DESCRIPTOR_CLASS_RE = re.compile(r'L([\w/$]+);')
+
+
+def read_class_info(path):
+    """
+    Parses a .class file and returns (internal_name, source_file, referenced_classes).
+
+    References cover CONSTANT_Class entries and every class named in a type
+    descriptor, which is what another class's ABI change can break.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'\xca\xfe\xba\xbe':
+        raise ValueError(f"{path} is not a class file")
+
+    count = struct.unpack_from('>H', data, 8)[0]
+    pos = 10
+    utf8 = {}
+    class_refs = []
+    index = 1
+    while index < count:
+        tag = data[pos]
+        if tag == 1:  # Utf8
+            length = struct.unpack_from('>H', data, pos + 1)[0]
+            utf8[index] = data[pos + 3:pos + 3 + length].decode('utf-8', 'replace')
+            pos += 3 + length
+        elif tag == 7:  # Class
+            class_refs.append((index, struct.unpack_from('>H', data, pos + 1)[0]))
+            pos += 3
+        elif tag in (8, 16, 19, 20):  # String, MethodType, Module, Package
+            pos += 3
+        elif tag == 15:  # MethodHandle
+            pos += 4
+        elif tag in (3, 4, 9, 10, 11, 12, 17, 18):  # Integer, Float, *ref, NameAndType, Dynamic, InvokeDynamic
+            pos += 5
+        elif tag in (5, 6):  # Long, Double take two slots
+            pos += 9
+            index += 1
+        else:
+            raise ValueError(f"{path}: unknown constant pool tag {tag}")
+        index += 1
+
+    classes = {i: utf8.get(name_index, "") for i, name_index in class_refs}
+    this_class = struct.unpack_from('>H', data, pos + 2)[0]
+    name = classes.get(this_class, "")
+    pos += 6
+    interfaces = struct.unpack_from('>H', data, pos)[0]
+    pos += 2 + 2 * interfaces
+
+    # Skip fields and methods to reach the class attributes
+    for _ in range(2):
+        members = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+        for _ in range(members):
+            attrs = struct.unpack_from('>H', data, pos + 6)[0]
+            pos += 8
+            for _ in range(attrs):
+                pos += 6 + struct.unpack_from('>I', data, pos + 2)[0]
+
+    source_file = None
+    attrs = struct.unpack_from('>H', data, pos)[0]
+    pos += 2
+    for _ in range(attrs):
+        attr_name = utf8.get(struct.unpack_from('>H', data, pos)[0])
+        length = struct.unpack_from('>I', data, pos + 2)[0]
+        if attr_name == "SourceFile":
+            source_file = utf8.get(struct.unpack_from('>H', data, pos + 6)[0])
+        pos += 6 + length
+
+    refs = set()
+    for ref in classes.values():
+        if ref.startswith('['):
+            refs.update(DESCRIPTOR_CLASS_RE.findall(ref))
+        else:
+            refs.add(ref)
+    for text in utf8.values():
+        if ';' in text and ('(' in text or text.startswith('L') or text.startswith('[')):
+            refs.update(DESCRIPTOR_CLASS_RE.findall(text))
+    refs.discard(name)
+    return name, source_file, refs
+
+
+class IncrementalJavac:
+    """
+    Incremental Java compilation into a persistent obj/ directory.
+
+    Tracks a content hash per source file, the class files each source produced
+    and the classes those reference. On rebuild only changed sources and the
+    sources depending on them (transitively) are recompiled; unchanged classes
+    stay in obj/ and are put on the classpath. Because javac inlines
+    compile-time constants (every field of the regenerated R.java), sources that
+    mention a changed class by name are treated as dependents as well.
+    """
+
+    STATE_FILE = "javac_state.json"
+    VERSION = 1
+    PACKAGE_RE = re.compile(r'^\s*package\s+([\w.]+)\s*;', re.MULTILINE)
+
+    def __init__(self, work_dir, obj_dir, run_javac, digest, logger=None):
+        self.state_path = os.path.join(work_dir, self.STATE_FILE)
+        self.obj_dir = obj_dir
+        self.run_javac = run_javac  # callable(args) running javac (daemon or subprocess)
+        self.digest = digest  # callable(path) -> content hash
+        self.logger = logger
+        self._texts = {}
+
+    def log(self, msg):
+        if self.logger:
+            self.logger(msg)
+
+    def compile(self, sources, classpath, options, env_key):
+        """
+        Brings obj/ up to date with sources. env_key covers everything that forces
+        a full rebuild when it changes (javac, android.jar, options).
+        Returns the list of class files in obj/.
+        """
+        current = {os.path.abspath(p): self.digest(p) for p in sources}
+        state = load_state(self.state_path, self.VERSION)
+        if state is None or state["env"] != env_key or not os.path.isdir(self.obj_dir):
+            self.log("Full Java compilation.")
+            shutil.rmtree(self.obj_dir, ignore_errors=True)
+            os.makedirs(self.obj_dir, exist_ok=True)
+            old = {}
+            to_compile = set(current)
+        else:
+            old = state["sources"]
+            changed = {p for p, h in current.items() if p not in old or old[p]["hash"] != h}
+            changed |= {p for p in current if p in old and not self._outputs_exist(old[p])}
+            removed = set(old) - set(current)
+            to_compile = self._with_dependents(changed | removed, old, current) & set(current)
+            for p in to_compile | removed:
+                for rel in old.get(p, {}).get("classes", []):
+                    path = os.path.join(self.obj_dir, rel)
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        entries = {p: e for p, e in old.items() if p in current and p not in to_compile}
+        if to_compile:
+            self.log(f"Compiling {len(to_compile)} of {len(current)} Java source(s)...")
+            before = self._snapshot()
+            args = list(options) + ["-d", self.obj_dir, "-cp", os.pathsep.join(list(classpath) + [self.obj_dir])]
+            self.run_javac(args + sorted(to_compile))
+            entries.update(self._attribute(to_compile, before, current))
+        else:
+            self.log("Java classes are up to date.")
+
+        save_state(self.state_path, {"version": self.VERSION, "env": env_key, "sources": entries})
+        return [os.path.join(self.obj_dir, rel) for e in entries.values() for rel in e["classes"]]
+
+    def _with_dependents(self, seeds, old, current):
+        result = set(seeds)
+        pending = list(seeds)
+        while pending:
+            entry = old.get(pending.pop())
+            if not entry:
+                continue
+            names = {rel[:-len(".class")].replace(os.sep, '/') for rel in entry["classes"]}
+            simple = {n.rsplit('/', 1)[-1].split('$')[0] for n in names}
+            for q in current:
+                if q in result:
+                    continue
+                refs = set(old[q]["refs"]) if q in old else set()
+                if refs & names or self._mentions(q, simple):
+                    result.add(q)
+                    pending.append(q)
+        return result
+
+    def _mentions(self, path, simple_names):
+        if not simple_names:
+            return False
+        if path not in self._texts:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                self._texts[path] = f.read()
+        pattern = r'\b(?:' + '|'.join(re.escape(n) for n in simple_names) + r')\b'
+        return re.search(pattern, self._texts[path]) is not None
+
+    def _attribute(self, compiled, before, current):
+        """Maps class files written by javac back to the sources they came from."""
+        by_location = {}
+        for p in compiled:
+            with open(p, 'r', encoding='utf-8', errors='replace') as f:
+                match = self.PACKAGE_RE.search(f.read())
+            package_dir = match.group(1).replace('.', '/') if match else ""
+            by_location[(package_dir, os.path.basename(p))] = p
+
+        entries = {p: {"hash": current[p], "classes": [], "refs": []} for p in compiled}
+        refs = {p: set() for p in compiled}
+        for rel, mtime in self._snapshot().items():
+            if before.get(rel) == mtime:
+                continue
+            name, source_file, class_refs = read_class_info(os.path.join(self.obj_dir, rel))
+            package_dir = name.rsplit('/', 1)[0] if '/' in name else ""
+            owner = by_location.get((package_dir, source_file))
+            if owner is None:
+                continue
+            entries[owner]["classes"].append(rel)
+            refs[owner] |= class_refs
+        for p in compiled:
+            entries[p]["classes"].sort()
+            entries[p]["refs"] = sorted(refs[p])
+        return entries
+
+    def _snapshot(self):
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.obj_dir):
+            for name in filenames:
+                if name.endswith(".class"):
+                    path = os.path.join(dirpath, name)
+                    files[os.path.relpath(path, self.obj_dir)] = os.stat(path).st_mtime_ns
+        return files
+
+    def _outputs_exist(self, entry):
+        return all(os.path.exists(os.path.join(self.obj_dir, rel)) for rel in entry["classes"])
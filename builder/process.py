@@ -0,0 +1,254 @@
+import asyncio
+import codecs
+import locale
+import os
+import signal
+import subprocess
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from builder import trace
+
+TAIL_LINES = 200  # Output lines kept per stream for the result; everything is streamed to the logger
+MAX_LINE = 64 * 1024  # Longer "lines" (binary output, progress bars) are split so memory stays bounded
+PIPE_GRACE = 1.0  # Seconds to keep reading after the tool exited, in case a grandchild holds its pipes open
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+class ProcessTimeout(Exception):
+    pass
+
+
+class ProcessRunner:
+    """
+    Runs external tools with their stdout/stderr streamed line by line to
+    the logger while they run.
+
+    Children are driven by one asyncio loop shared by the whole process, so
+    runs started from several threads (or gathered with run_async) overlap.
+    Only the last TAIL_LINES lines of each stream are kept for the result,
+    so verbose tools don't grow memory. Every tool runs in its own process
+    group, so a timeout or cancel() kills the whole tree (taskkill /T on
+    Windows), including JVMs or compilers it spawned.
+    """
+
+    def __init__(self, logger=None, timeout=None):
+        self.logger = logger
+        self.timeout = timeout  # Default per-process timeout in seconds; None or 0 for no limit
+        self.cancelled = False
+        self._children = set()
+        self._lock = threading.Lock()
+
+    def log(self, msg):
+        if self.logger:
+            self.logger(msg)
+
+    def run(self, cmd, name=None, timeout=None, shell=False):
+        """
+        Runs cmd to completion; callable from any thread. Returns a
+        CompletedProcess whose stdout/stderr hold the last lines of output.
+        Raises ProcessTimeout or BuildCancelled.
+        """
+        name = name or trace.tool_name(cmd)
+        with trace.tool_span(cmd, name) as span:
+            future = asyncio.run_coroutine_threadsafe(self._run(cmd, name, timeout, shell), _shared_loop())
+            try:
+                result, usage = future.result()
+            except KeyboardInterrupt:
+                self.cancel()
+                raise
+            trace.record_process(span, result.returncode, usage)
+        return result
+
+    async def run_async(self, cmd, name=None, timeout=None, shell=False):
+        """run() for coroutines running on any event loop (without a trace span)."""
+        result, _ = await self._run(cmd, name or trace.tool_name(cmd), timeout, shell)
+        return result
+
+    def cancel(self):
+        """Kills every process tree this runner started; its later runs raise BuildCancelled. Thread-safe."""
+        self.cancelled = True
+        self.kill_all()
+
+    def kill_all(self):
+        """Kills the process trees running right now (their runs fail) without cancelling later runs."""
+        with self._lock:
+            children = list(self._children)
+        for child in children:
+            child.kill_tree()
+
+    @contextmanager
+    def attach(self, child):
+        """
+        Lets cancel() and kill_all() also stop work this runner did not
+        start, while the block runs: child needs a kill_tree() method (e.g.
+        an in-flight build daemon request).
+        """
+        with self._lock:
+            self._children.add(child)
+        try:
+            if self.cancelled:
+                child.kill_tree()
+            yield child
+        finally:
+            with self._lock:
+                self._children.discard(child)
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise BuildCancelled("Build cancelled.")
+
+    async def _run(self, cmd, name, timeout, shell):
+        self.check_cancelled()
+        timeout = self.timeout if timeout is None else timeout
+        child = await (_PosixChild.start(cmd, shell) if os.name != 'nt' else _WindowsChild.start(cmd, shell))
+        with self._lock:
+            self._children.add(child)
+        if self.cancelled:
+            child.kill_tree()  # cancel() ran while the child was starting
+        tails = (deque(maxlen=TAIL_LINES), deque(maxlen=TAIL_LINES))
+        pumps = asyncio.gather(self._pump(child.stdout, tails[0], name), self._pump(child.stderr, tails[1], name))
+        pumps.add_done_callback(lambda f: f.cancelled() or f.exception())  # Cancelled below; don't warn about it
+
+        async def finish():
+            status = await child.wait()
+            try:
+                await asyncio.wait_for(asyncio.shield(pumps), PIPE_GRACE)
+            except asyncio.TimeoutError:
+                pass
+            return status
+
+        try:
+            returncode, usage = await asyncio.wait_for(finish(), timeout or None)
+        except asyncio.TimeoutError:
+            child.kill_tree()
+            await child.wait()
+            raise ProcessTimeout(f"{name} did not finish within {timeout:g} s and was stopped")
+        finally:
+            pumps.cancel()
+            child.close()
+            with self._lock:
+                self._children.discard(child)
+        self.check_cancelled()
+        return subprocess.CompletedProcess(cmd, returncode, "\n".join(tails[0]), "\n".join(tails[1])), usage
+
+    async def _pump(self, stream, tail, name):
+        """Logs each line of stream as it arrives, keeping the last ones in tail."""
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace')
+        pending = ""
+        while True:
+            chunk = await stream.read(65536)
+            pending += decoder.decode(chunk, final=not chunk)
+            lines = pending.split("\n")
+            pending = lines.pop()
+            if len(pending) > MAX_LINE or (not chunk and pending):
+                lines.append(pending)
+                pending = ""
+            for line in lines:
+                line = line.rstrip("\r")
+                tail.append(line)
+                if line.strip():
+                    self.log(f"[{name}] {line}")
+            if not chunk:
+                return
+
+
+class _PosixChild:
+    """
+    Popen in a new session with its pipes read by the loop. Reaped with
+    wait4() in an executor thread rather than by asyncio's child watcher,
+    so the child's resource usage is available for trace spans.
+    """
+
+    def __init__(self, popen):
+        self.popen = popen
+        self.pid = popen.pid
+        self.stdout = self.stderr = None
+        self._transports = []
+        self._waiter = None
+
+    @classmethod
+    async def start(cls, cmd, shell):
+        popen = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 shell=shell, start_new_session=True)
+        child = cls(popen)
+        loop = asyncio.get_running_loop()
+        readers = []
+        for pipe in (popen.stdout, popen.stderr):
+            reader = asyncio.StreamReader()
+            transport, _ = await loop.connect_read_pipe(lambda reader=reader: asyncio.StreamReaderProtocol(reader),
+                                                        pipe)
+            child._transports.append(transport)
+            readers.append(reader)
+        child.stdout, child.stderr = readers
+        return child
+
+    async def wait(self):
+        """(exit code, rusage). Safe to await again after a timeout."""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().run_in_executor(None, os.wait4, self.pid, 0)
+        _, status, usage = await asyncio.shield(self._waiter)
+        # Reaped here, so tell Popen the exit code instead of letting it wait again
+        self.popen.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        return self.popen.returncode, usage
+
+    def kill_tree(self):
+        if self.popen.returncode is not None:
+            return  # Reaped: the process group id may already belong to someone else
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def close(self):
+        for transport in self._transports:
+            transport.close()
+
+
+class _WindowsChild:
+    """asyncio subprocess in a new process group, killed with taskkill /T."""
+
+    def __init__(self, process):
+        self.process = process
+        self.pid = process.pid
+        self.stdout = process.stdout
+        self.stderr = process.stderr
+
+    @classmethod
+    async def start(cls, cmd, shell):
+        options = dict(stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                       creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+        if shell:
+            process = await asyncio.create_subprocess_shell(subprocess.list2cmdline(cmd), **options)
+        else:
+            process = await asyncio.create_subprocess_exec(*cmd, **options)
+        return cls(process)
+
+    async def wait(self):
+        return await self.process.wait(), None
+
+    def kill_tree(self):
+        if self.process.returncode is None:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(self.pid)], capture_output=True)
+
+    def close(self):
+        pass
+
+
+def _shared_loop():
+    """Event loop running in a daemon thread, started on first use (again in forked batch workers)."""
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="process-runner", daemon=True).start()
+        return _loop
@@ -0,0 +1,90 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from builder import trace
+from builder.tree_writer import walk_files
+from builder.web_assets import WebAssetPipeline
+
+TARGETS = ("android", "ios")
+
+
+class ProjectIR:
+    """
+    Target-independent view of a project config, built once and shared by
+    ProjectGenerator and IOSProjectGenerator.
+
+    Parses the config (extra headers), walks the web content once
+    (honoring .w2aignore) and, when optimize_web_assets is set, minifies it
+    once. Icons need nothing here: the shared ImagePipeline already decodes
+    each source once for every target that asks for it.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        try:
+            self.headers_dict = json.loads(config['headers']) if config.get('headers') else {}
+        except ValueError:
+            self.headers_dict = {}
+        self.web_stats = None
+        with trace.span("web content", "assets") as span:
+            self.web_entries = self._collect_web_content()  # [(relative path, source path, bytes or None)]
+            span["files"] = len(self.web_entries)
+            if self.web_stats:
+                span["bytes_in"] = self.web_stats["original_bytes"]
+                span["bytes_out"] = self.web_stats["output_bytes"]
+
+    def template_context(self, overrides=None):
+        context = self.config.copy()
+        if overrides:
+            context.update(overrides)
+        context['headers_dict'] = self.headers_dict
+        return context
+
+    def add_web_content(self, writer, dest_dir):
+        """Adds the web content to a TreeWriter under dest_dir (copied, or optimized bytes)."""
+        for rel, src, data in self.web_entries:
+            dest = os.path.join(dest_dir, rel)
+            if data is None:
+                writer.copy_file(dest, src)
+            else:
+                writer.write_bytes(dest, data)
+
+    def _collect_web_content(self):
+        mode = self.config.get('web_mode')
+        path = self.config.get('web_path')
+        if not path or not os.path.exists(path) or mode not in ("Local Folder", "Single HTML File"):
+            return []
+        web = WebAssetPipeline() if self.config.get('optimize_web_assets') else None
+        if web:
+            self.web_stats = web.stats
+        if mode == "Local Folder":
+            if web:
+                return web.process_tree(path)
+            return [(rel, src, None) for rel, src in walk_files(path)]
+        return [("index.html", path, web.process_file(path) if web else None)]
+
+
+def generate_targets(config, output_dir, base_dir, targets=TARGETS, clean=False):
+    """
+    Generates several targets from one ProjectIR, concurrently.
+
+    Web content is walked (and optimized) once and icons decoded once for
+    all targets. Returns {target: generator stats}.
+    """
+    from builder.generator import ProjectGenerator
+    from builder.generator_ios import IOSProjectGenerator
+
+    ir = ProjectIR(config)
+    generators = {
+        "android": lambda: ProjectGenerator(os.path.join(base_dir, "assets", "template")),
+        "ios": lambda: IOSProjectGenerator(os.path.join(base_dir, "assets", "template_ios")),
+    }
+
+    def generate(target):
+        with trace.span(f"generate {target}", "generate"):
+            return generators[target]().generate(config, output_dir, clean=clean, ir=ir)
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        futures = {t: pool.submit(generate, t) for t in targets}
+        return {t: f.result() for t, f in futures.items()}
@@ -1,6 +1,11 @@
 import json
 import os
 
+def read_project_file(file_path):
+    """Reads a .w2apk project file into a config dict (the same shape as MainWindow.get_config)."""
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
 class ProjectManager:
     def __init__(self, main_window):
         self.main_window = main_window
@@ -21,9 +26,7 @@ class ProjectManager:
             if not os.path.exists(file_path):
                 return False, "File does not exist."
             
-            with open(file_path, 'r') as f:
-                config = json.load(f)
-            
+            config = read_project_file(file_path)
             self.main_window.set_config(config)
             return True, "Project loaded successfully."
         except Exception as e:
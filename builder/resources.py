@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+
+from builder.cache import load_state, save_state
+
+
+class IncrementalResourceCompiler:
+    """
+    Per-file incremental aapt2 compile.
+
+    Instead of 'aapt2 compile --dir res', every resource file is compiled on
+    its own into build_manual/flat/ and its .flat output is reused for as long
+    as the source file's content hash is unchanged. The link step consumes the
+    resulting set of .flat files.
+    """
+
+    STATE_FILE = "res_state.json"
+    VERSION = 1
+    BATCH_SIZE = 100  # Files per aapt2 invocation, keeps Windows command lines short
+
+    def __init__(self, work_dir, run_aapt2, digest, logger=None):
+        self.work_dir = work_dir
+        self.flat_dir = os.path.join(work_dir, "flat")
+        self.state_path = os.path.join(work_dir, self.STATE_FILE)
+        self.run_aapt2 = run_aapt2  # callable(args) running aapt2
+        self.digest = digest  # callable(path) -> content hash
+        self.logger = logger
+
+    def log(self, msg):
+        if self.logger:
+            self.logger(msg)
+
+    @staticmethod
+    def flat_name(rel_path):
+        """Name aapt2 gives the compiled output of res/<dir>/<file>."""
+        res_type, filename = rel_path.replace(os.sep, '/').split('/')[-2:]
+        if res_type.split('-')[0] == "values":
+            return f"{res_type}_{os.path.splitext(filename)[0]}.arsc.flat"
+        return f"{res_type}_{filename}.flat"
+
+    @staticmethod
+    def list_resources(res_dir):
+        files = []
+        if not os.path.isdir(res_dir):
+            return files
+        for type_dir in sorted(os.listdir(res_dir)):
+            type_path = os.path.join(res_dir, type_dir)
+            if type_dir.startswith('.') or not os.path.isdir(type_path):
+                continue
+            for name in sorted(os.listdir(type_path)):
+                if not name.startswith('.') and os.path.isfile(os.path.join(type_path, name)):
+                    files.append(os.path.join(type_dir, name))
+        return files
+
+    def compile(self, res_dir, env_key):
+        """Brings build_manual/flat/ up to date with res_dir. Returns the .flat files to link."""
+        current = {rel: self.digest(os.path.join(res_dir, rel)) for rel in self.list_resources(res_dir)}
+        state = load_state(self.state_path, self.VERSION)
+        if state is None or state["env"] != env_key:
+            shutil.rmtree(self.flat_dir, ignore_errors=True)
+            old = {}
+        else:
+            old = state["files"]
+        os.makedirs(self.flat_dir, exist_ok=True)
+
+        for rel in set(old) - set(current):
+            self._remove(old[rel]["flats"])
+        changed = [rel for rel, h in current.items()
+                   if rel not in old or old[rel]["hash"] != h or not self._exists(old[rel]["flats"])]
+
+        entries = {rel: old[rel] for rel in current if rel not in changed}
+        if changed:
+            self.log(f"Compiling {len(changed)} of {len(current)} resource file(s)...")
+            for rel in changed:
+                if rel in old:
+                    self._remove(old[rel]["flats"])
+            for i in range(0, len(changed), self.BATCH_SIZE):
+                batch = changed[i:i + self.BATCH_SIZE]
+                self.run_aapt2(["compile", "-o", self.flat_dir] + [os.path.join(res_dir, rel) for rel in batch])
+                for rel in batch:
+                    entries[rel] = {"hash": current[rel], "flats": self._outputs_of(res_dir, rel)}
+        else:
+            self.log("Compiled resources are up to date.")
+
+        save_state(self.state_path, {"version": self.VERSION, "env": env_key, "files": entries})
+        return sorted(os.path.join(self.flat_dir, name) for e in entries.values() for name in e["flats"])
+
+    def _outputs_of(self, res_dir, rel):
+        name = self.flat_name(rel)
+        if os.path.exists(os.path.join(self.flat_dir, name)):
+            return [name]
+        # Unexpected naming (e.g. a future aapt2): compile alone into a scratch dir to learn the outputs
+        scratch = tempfile.mkdtemp(dir=self.work_dir)
+        try:
+            self.run_aapt2(["compile", "-o", scratch, os.path.join(res_dir, rel)])
+            names = sorted(os.listdir(scratch))
+            for n in names:
+                os.replace(os.path.join(scratch, n), os.path.join(self.flat_dir, n))
+            return names
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def _exists(self, names):
+        return all(os.path.exists(os.path.join(self.flat_dir, n)) for n in names)
+
+    def _remove(self, names):
+        for n in names:
+            path = os.path.join(self.flat_dir, n)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,385 @@
+import base64
+import hashlib
+import mmap
+import os
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from builder.apk import END_OF_CENTRAL_DIR, EOCD_SIG, ApkWriter
+
+APK_SIG_BLOCK_MAGIC = b"APK Sig Block 42"
+V2_BLOCK_ID = 0x7109871a
+V3_BLOCK_ID = 0xf05368c0
+STRIPPING_PROTECTION_ATTR_ID = 0xbeeff00d
+RSA_PKCS1_SHA256 = 0x0103
+ECDSA_SHA256 = 0x0201
+CHUNK_SIZE = 1024 * 1024
+V3_MIN_SDK = 28  # Android P, the first release that verifies v3
+JKS_MAGIC = 0xfeedfeed
+JKS_KEY_PROTECTOR_OID = "1.3.6.1.4.1.42.2.17.1.1"
+
+
+class SigningError(Exception):
+    """Signing could not be done in-process; callers may fall back to apksigner."""
+
+
+def is_available():
+    try:
+        import cryptography  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# Keystores
+def load_keystore(path, store_pass, alias=None, key_pass=None):
+    """Returns (private_key, [certificates]) from a PKCS#12 or JKS keystore."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) >= 4 and struct.unpack('>I', data[:4])[0] == JKS_MAGIC:
+        try:
+            return _load_jks(data, store_pass, alias, key_pass)
+        except (struct.error, IndexError, ValueError) as e:
+            raise SigningError(f"Cannot read JKS keystore {path}: {str(e)}")
+
+    from cryptography.exceptions import UnsupportedAlgorithm
+    from cryptography.hazmat.primitives.serialization import pkcs12
+    try:
+        store = pkcs12.load_pkcs12(data, (store_pass or "").encode('utf-8'))
+    except (ValueError, UnsupportedAlgorithm) as e:
+        raise SigningError(f"Cannot open keystore {path}: {str(e)}")
+    if store.key is None or store.cert is None:
+        raise SigningError(f"Keystore {path} holds no private key entry")
+    friendly = store.cert.friendly_name.decode('utf-8') if store.cert.friendly_name else None
+    if alias and friendly and friendly.lower() != alias.lower():
+        raise SigningError(f"Alias '{alias}' not found in {path}")
+    return store.key, [store.cert.certificate] + [c.certificate for c in store.additional_certs]
+
+
+def _load_jks(data, store_pass, alias, key_pass):
+    from cryptography import x509
+    from cryptography.hazmat.primitives.serialization import load_der_private_key
+
+    password = (key_pass or store_pass or "").encode('utf-16-be')
+    version, count = struct.unpack_from('>II', data, 4)
+    pos = 12
+
+    def read_utf():
+        nonlocal pos
+        length = struct.unpack_from('>H', data, pos)[0]
+        value = data[pos + 2:pos + 2 + length].decode('utf-8', 'replace')
+        pos += 2 + length
+        return value
+
+    def read_blob():
+        nonlocal pos
+        length = struct.unpack_from('>I', data, pos)[0]
+        value = data[pos + 4:pos + 4 + length]
+        pos += 4 + length
+        return value
+
+    for _ in range(count):
+        tag = struct.unpack_from('>I', data, pos)[0]
+        pos += 4
+        entry_alias = read_utf()
+        pos += 8  # Timestamp
+        if tag == 1:  # Private key entry
+            protected = read_blob()
+            chain_length = struct.unpack_from('>I', data, pos)[0]
+            pos += 4
+            chain = []
+            for _ in range(chain_length):
+                if version == 2:
+                    read_utf()  # Certificate type, always X.509
+                chain.append(read_blob())
+            if alias and entry_alias.lower() != alias.lower():
+                continue
+            key = load_der_private_key(_jks_decrypt_key(protected, password), None)
+            return key, [x509.load_der_x509_certificate(c) for c in chain]
+        if version == 2:
+            read_utf()
+        read_blob()  # Trusted certificate entry
+    raise SigningError(f"No private key entry{' ' + repr(alias) if alias else ''} in JKS keystore")
+
+
+def _jks_decrypt_key(protected, password):
+    """Undoes Sun's JKS KeyProtector (SHA-1 keystream XOR) and returns PKCS#8 DER."""
+    _, start, end = _der_next(protected, 0)  # EncryptedPrivateKeyInfo SEQUENCE
+    _, alg_start, alg_end = _der_next(protected, start)
+    _, oid_start, oid_end = _der_next(protected, alg_start)
+    if _decode_oid(protected[oid_start:oid_end]) != JKS_KEY_PROTECTOR_OID:
+        raise SigningError("Unsupported JKS key protection algorithm")
+    _, enc_start, enc_end = _der_next(protected, alg_end)
+    encrypted = protected[enc_start:enc_end]
+    salt, ciphertext, check = encrypted[:20], encrypted[20:-20], encrypted[-20:]
+
+    stream = b""
+    digest = salt
+    while len(stream) < len(ciphertext):
+        digest = hashlib.sha1(password + digest).digest()
+        stream += digest
+    plain = bytes(a ^ b for a, b in zip(ciphertext, stream))
+    if hashlib.sha1(password + plain).digest() != check:
+        raise SigningError("Wrong key password for JKS keystore")
+    return plain
+
+
+def _der_next(data, pos):
+    """Reads one DER TLV at pos; returns (tag, value_start, value_end)."""
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        num = length & 0x7f
+        length = int.from_bytes(data[pos:pos + num], 'big')
+        pos += num
+    return tag, pos, pos + length
+
+
+def _decode_oid(raw):
+    parts = [raw[0] // 40, raw[0] % 40]
+    value = 0
+    for b in raw[1:]:
+        value = (value << 7) | (b & 0x7f)
+        if not b & 0x80:
+            parts.append(value)
+            value = 0
+    return ".".join(str(p) for p in parts)
+
+
+def create_debug_keystore(path, password="android", alias="androiddebugkey"):
+    """Generates the same debug identity keytool would (RSA 2048, CN=Android Debug) as PKCS#12."""
+    import datetime
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, "Android Debug"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Android"),
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
+    ])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=10000))
+            .sign(key, hashes.SHA256()))
+    data = pkcs12.serialize_key_and_certificates(alias.encode('utf-8'), key, cert, None,
+                                                 serialization.BestAvailableEncryption(password.encode('utf-8')))
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# Signing
+class ApkSigner:
+    """
+    In-process APK signer: JAR (v1), APK Signature Scheme v2 and v3.
+
+    Needs the optional 'cryptography' package; without it BuildEngine keeps
+    spawning apksigner. The v2/v3 content digests are computed over 1 MiB
+    chunks of the zip sections on a thread pool (hashlib releases the GIL),
+    then the APK Signing Block is written between the entries and the
+    central directory.
+    """
+
+    def __init__(self, private_key, certificates, min_sdk=21, v1=True, v2=True, v3=True, workers=None):
+        from cryptography.hazmat.primitives.asymmetric import ec, rsa
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm, self.v1_ext = RSA_PKCS1_SHA256, "RSA"
+        elif isinstance(private_key, ec.EllipticCurvePrivateKey):
+            self.algorithm, self.v1_ext = ECDSA_SHA256, "EC"
+        else:
+            raise SigningError("Only RSA and EC signing keys are supported")
+        self.key = private_key
+        self.certificates = certificates
+        self.min_sdk = min_sdk
+        self.v1 = v1 and min_sdk < 24  # Android 7.0+ only needs the v2/v3 block
+        self.v2 = v2
+        self.v3 = v3
+        self.workers = workers or os.cpu_count() or 1
+
+    def sign(self, in_apk, out_apk):
+        tmp = out_apk + ".unsigned.tmp"
+        try:
+            self._write_v1(in_apk, tmp)
+            if self.v2 or self.v3:
+                self._write_signing_block(tmp, out_apk + ".tmp")
+                os.replace(out_apk + ".tmp", out_apk)
+            else:
+                os.replace(tmp, out_apk)
+        finally:
+            for leftover in (tmp, out_apk + ".tmp"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+    def _sign_bytes(self, data):
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec, padding
+        if self.algorithm == RSA_PKCS1_SHA256:
+            return self.key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        return self.key.sign(data, ec.ECDSA(hashes.SHA256()))
+
+    # v1
+    @staticmethod
+    def _is_signature_file(name):
+        upper = name.upper()
+        if not upper.startswith("META-INF/"):
+            return False
+        return upper == "META-INF/MANIFEST.MF" or upper.endswith((".SF", ".RSA", ".DSA", ".EC"))
+
+    def _write_v1(self, in_apk, out_path):
+        with zipfile.ZipFile(in_apk) as zf:
+            names = [i.filename for i in zf.infolist() if not i.is_dir() and not self._is_signature_file(i.filename)]
+            signature_files = {i.filename for i in zf.infolist() if self._is_signature_file(i.filename)}
+            if self.v1:
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    digests = list(pool.map(lambda n: hashlib.sha256(zf.read(n)).digest(), names))
+
+        with ApkWriter(out_path) as apk:
+            apk.add_zip_entries(in_apk, exclude=signature_files)
+            if not self.v1:
+                return
+            manifest, sections = self._build_manifest(names, digests)
+            signature_file = self._build_signature_file(manifest, sections)
+            apk.add_bytes("META-INF/MANIFEST.MF", manifest, compress=True)
+            apk.add_bytes("META-INF/CERT.SF", signature_file, compress=True)
+            apk.add_bytes(f"META-INF/CERT.{self.v1_ext}", self._pkcs7(signature_file), compress=True)
+
+    @staticmethod
+    def _manifest_attr(name, value):
+        line = f"{name}: {value}".encode('utf-8')
+        # Lines are limited to 72 bytes including CRLF, continuation lines start with a space
+        parts = [line[:70]]
+        line = line[70:]
+        while line:
+            parts.append(b" " + line[:69])
+            line = line[69:]
+        return b"\r\n".join(parts) + b"\r\n"
+
+    def _build_manifest(self, names, digests):
+        main = b"Manifest-Version: 1.0\r\nCreated-By: 1.0 (website2app)\r\n\r\n"
+        sections = []
+        for name, digest in zip(names, digests):
+            section = (self._manifest_attr("Name", name)
+                       + self._manifest_attr("SHA-256-Digest", base64.b64encode(digest).decode('ascii'))
+                       + b"\r\n")
+            sections.append((name, section))
+        return main + b"".join(s for _, s in sections), sections
+
+    def _build_signature_file(self, manifest, sections):
+        stripping = []
+        if self.v2:
+            stripping.append("2")
+        if self.v3:
+            stripping.append("3")
+        out = b"Signature-Version: 1.0\r\nCreated-By: 1.0 (website2app)\r\n"
+        manifest_digest = base64.b64encode(hashlib.sha256(manifest).digest()).decode()
+        out += self._manifest_attr("SHA-256-Digest-Manifest", manifest_digest)
+        if stripping:
+            # Lets Android 7.0+ reject copies whose v2/v3 signature was stripped
+            out += self._manifest_attr("X-Android-APK-Signed", ", ".join(stripping))
+        out += b"\r\n"
+        for name, section in sections:
+            out += (self._manifest_attr("Name", name)
+                    + self._manifest_attr("SHA-256-Digest", base64.b64encode(hashlib.sha256(section).digest()).decode())
+                    + b"\r\n")
+        return out
+
+    def _pkcs7(self, data):
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.serialization import pkcs7
+        builder = (pkcs7.PKCS7SignatureBuilder().set_data(data)
+                   .add_signer(self.certificates[0], self.key, hashes.SHA256()))
+        for cert in self.certificates[1:]:
+            builder = builder.add_certificate(cert)
+        options = [pkcs7.PKCS7Options.DetachedSignature, pkcs7.PKCS7Options.Binary, pkcs7.PKCS7Options.NoAttributes]
+        return builder.sign(serialization.Encoding.DER, options)
+
+    # v2 / v3
+    def _write_signing_block(self, in_path, out_path):
+        with open(in_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            eocd_offset = data.rfind(struct.pack('<I', EOCD_SIG))
+            if eocd_offset < 0:
+                raise SigningError("Not a zip archive: end of central directory not found")
+            eocd = END_OF_CENTRAL_DIR.unpack_from(data, eocd_offset)
+            cd_size, cd_offset = eocd[5], eocd[6]
+
+            view = memoryview(data)
+            try:
+                # The EOCD is digested as-is: its CD offset already points where the signing block will start
+                digest = self._content_digest([view[:cd_offset], view[cd_offset:cd_offset + cd_size],
+                                               view[eocd_offset:]])
+                block = self._signing_block(digest)
+
+                with open(out_path, 'wb') as out:
+                    out.write(view[:cd_offset])
+                    out.write(block)
+                    out.write(view[cd_offset:eocd_offset])
+                    patched = bytearray(view[eocd_offset:])
+                    struct.pack_into('<I', patched, 16, cd_offset + len(block))
+                    out.write(patched)
+            finally:
+                view.release()
+
+    def _content_digest(self, sections):
+        chunks = []
+        for section in sections:
+            for start in range(0, len(section), CHUNK_SIZE):
+                chunks.append(section[start:start + CHUNK_SIZE])
+
+        def chunk_digest(chunk):
+            h = hashlib.sha256(b"\xa5" + struct.pack('<I', len(chunk)))
+            h.update(chunk)
+            return h.digest()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            digests = list(pool.map(chunk_digest, chunks))
+        return hashlib.sha256(b"\x5a" + struct.pack('<I', len(chunks)) + b"".join(digests)).digest()
+
+    def _signing_block(self, digest):
+        from cryptography.hazmat.primitives import serialization
+        certs = _lp_seq([c.public_bytes(serialization.Encoding.DER) for c in self.certificates])
+        public_key = self.key.public_key().public_bytes(serialization.Encoding.DER,
+                                                        serialization.PublicFormat.SubjectPublicKeyInfo)
+        digests = _lp_seq([struct.pack('<I', self.algorithm) + _lp(digest)])
+
+        pairs = []
+        if self.v2:
+            # Additional attributes: a length-prefixed sequence, empty unless v3 is also written
+            attrs = _lp(b"")
+            if self.v3:
+                attrs = _lp_seq([struct.pack('<II', STRIPPING_PROTECTION_ATTR_ID, 3)])
+            signed_data = digests + certs + attrs
+            signer = (_lp(signed_data)
+                      + _lp_seq([struct.pack('<I', self.algorithm) + _lp(self._sign_bytes(signed_data))])
+                      + _lp(public_key))
+            pairs.append((V2_BLOCK_ID, _lp_seq([signer])))
+        if self.v3:
+            sdk_range = struct.pack('<II', max(self.min_sdk, V3_MIN_SDK), 0x7fffffff)
+            signed_data = digests + certs + sdk_range + _lp(b"")
+            signer = (_lp(signed_data) + sdk_range
+                      + _lp_seq([struct.pack('<I', self.algorithm) + _lp(self._sign_bytes(signed_data))])
+                      + _lp(public_key))
+            pairs.append((V3_BLOCK_ID, _lp_seq([signer])))
+
+        body = b"".join(struct.pack('<QI', len(value) + 4, block_id) + value for block_id, value in pairs)
+        size = len(body) + 8 + len(APK_SIG_BLOCK_MAGIC)
+        return struct.pack('<Q', size) + body + struct.pack('<Q', size) + APK_SIG_BLOCK_MAGIC
+
+
+def _lp(data):
+    return struct.pack('<I', len(data)) + data
+
+
+def _lp_seq(items):
+    return _lp(b"".join(_lp(item) for item in items))
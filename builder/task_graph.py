@@ -0,0 +1,124 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Task:
+    """One node of a TaskGraph: action() turns the declared inputs into the declared outputs."""
+
+    def __init__(self, name, action, inputs=(), outputs=(), after=()):
+        self.name = name
+        self.action = action
+        self.inputs = [os.path.abspath(p) for p in inputs]
+        self.outputs = [os.path.abspath(p) for p in outputs]
+        self.after = list(after)  # Names of tasks that must finish first although no path links them
+        self.deps = set()
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end - self.start) if self.end is not None else 0.0
+
+
+class TaskGraph:
+    """
+    Build steps as a dependency graph.
+
+    A task depends on every task that declares, as an output, one of its
+    inputs or a directory containing it (plus any names listed in after).
+    run() starts each task as soon as its dependencies have finished, up to
+    max_workers at a time, so the build takes as long as its critical path
+    rather than the sum of its steps. The first failure stops new tasks
+    from starting, calls on_failure() (e.g. to kill the running tools) and
+    is re-raised once the running tasks have returned.
+    """
+
+    def __init__(self, max_workers=4, on_failure=None):
+        self.max_workers = max_workers
+        self.on_failure = on_failure
+        self.tasks = {}
+
+    def add(self, name, action, inputs=(), outputs=(), after=()):
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task: {name}")
+        self.tasks[name] = task = Task(name, action, inputs, outputs, after)
+        return task
+
+    def run(self):
+        self._link()
+        pending = dict(self.tasks)
+        done = set()
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                if error is None:
+                    for name, task in list(pending.items()):
+                        if task.deps <= done:
+                            del pending[name]
+                            running[pool.submit(self._run_task, task)] = task
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        if error is None:
+                            error = e
+                            if self.on_failure:
+                                self.on_failure()
+                    else:
+                        done.add(task.name)
+        if error is not None:
+            raise error
+
+    def critical_path(self):
+        """The chain that set the total time: the last task to finish, back through its latest dependency."""
+        finished = [t for t in self.tasks.values() if t.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda t: t.end)]
+        while path[-1].deps:
+            path.append(max((self.tasks[d] for d in path[-1].deps), key=lambda t: t.end or 0.0))
+        return path[::-1]
+
+    def summary(self):
+        """e.g. 'Critical path 1.92s of 2.40s task time: compile_resources 0.10s -> link_resources 0.21s -> ...'"""
+        path = self.critical_path()
+        if not path:
+            return "No tasks ran."
+        total = sum(t.duration for t in self.tasks.values())
+        steps = " -> ".join(f"{t.name} {t.duration:.2f}s" for t in path)
+        return f"Critical path {path[-1].end - path[0].start:.2f}s of {total:.2f}s task time: {steps}"
+
+    @staticmethod
+    def _run_task(task):
+        task.start = time.perf_counter()
+        try:
+            task.action()
+        finally:
+            task.end = time.perf_counter()
+
+    def _link(self):
+        producers = [(out, t.name) for t in self.tasks.values() for out in t.outputs]
+        for task in self.tasks.values():
+            for name in task.after:
+                if name not in self.tasks:
+                    raise ValueError(f"Task {task.name} runs after unknown task {name}")
+            task.deps = set(task.after)
+            for path in task.inputs:
+                task.deps.update(name for out, name in producers
+                                 if name != task.name and (path == out or path.startswith(out + os.sep)))
+        # Kahn's algorithm, only to reject cycles before anything runs
+        remaining = {name: set(t.deps) for name, t in self.tasks.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Dependency cycle between tasks: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
@@ -0,0 +1,57 @@
+import os
+import threading
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from builder.cache import user_cache_dir
+
+_environments = {}  # absolute template dir -> Environment
+_lock = threading.Lock()
+
+
+def get_environment(template_dir):
+    """
+    Process-wide Jinja2 environment for a template directory.
+
+    Every generator (and every app of a batch) shares it, so each template
+    is parsed and compiled once per process; the compiled bytecode is also
+    kept on disk, so new processes (batch workers, CLI runs) skip parsing
+    too. Templates edited on disk are picked up through auto_reload.
+    """
+    template_dir = os.path.abspath(template_dir)
+    with _lock:
+        env = _environments.get(template_dir)
+        if env is None:
+            env = Environment(loader=FileSystemLoader(template_dir), bytecode_cache=_bytecode_cache(),
+                              cache_size=-1)
+            _environments[template_dir] = env
+        return env
+
+
+class _BytecodeCache(FileSystemBytecodeCache):
+    """Bytecode cache that never fails a render, e.g. when the cache dir is wiped under a running GUI."""
+
+    def dump_bytecode(self, bucket):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass  # The bytecode cache is only an optimization
+
+
+def _bytecode_cache():
+    cache_dir = user_cache_dir("jinja")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return None  # Read-only home: templates are still cached in memory
+    return _BytecodeCache(cache_dir)
+
+
+def precompile(template_dir):
+    """Compiles every template of a directory into the caches ahead of time. Returns the template count."""
+    env = get_environment(template_dir)
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    return len(names)
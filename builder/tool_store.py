@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from builder.cache import file_sha256, user_cache_dir
+
+MANIFEST = "manifest.json"
+
+
+class ToolStore:
+    """
+    Per-user store of SDK toolsets shared by every workspace, container
+    and CI worker that mounts the same cache directory.
+
+    Each toolset lives in <root>/<key>/, where key is derived from the
+    archives it was built from (file names and pinned digests), next to a
+    manifest.json listing every file with its size and SHA-256. Installs
+    are populated in a temp dir inside the store and renamed into place, so
+    a toolset is either complete or absent, and a per-key lock file makes
+    concurrent builds wait for one download instead of starting their own.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or user_cache_dir("tools")
+        self.partial_dir = os.path.join(self.root, "partial")  # Resumable downloads, shared too
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """The toolset's manifest if it is installed and every file has its recorded size, else None."""
+        try:
+            with open(os.path.join(self.path(key), MANIFEST), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            for name, info in manifest["files"].items():
+                if os.path.getsize(os.path.join(self.path(key), name)) != info["size"]:
+                    return None
+        except (OSError, ValueError, KeyError):
+            return None
+        return manifest
+
+    def verify(self, key):
+        """Re-hashes every file of a toolset. Returns the names that are missing or corrupt."""
+        manifest = self.get(key)
+        if manifest is None:
+            return [MANIFEST]
+        corrupt = []
+        for name, info in manifest["files"].items():
+            try:
+                intact = file_sha256(os.path.join(self.path(key), name)) == info["sha256"]
+            except OSError:
+                intact = False
+            if not intact:
+                corrupt.append(name)
+        return corrupt
+
+    def install(self, key, populate, version=None):
+        """
+        Returns the manifest of toolset key, first running populate(dir) to
+        fill a temp dir with its files if no other process has installed
+        it yet.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with self.lock(key):
+            manifest = self.get(key)
+            if manifest is not None:
+                return manifest
+            tmp = tempfile.mkdtemp(prefix=f".tmp-{key}-", dir=self.root)
+            try:
+                populate(tmp)
+                files = {}
+                for name in sorted(os.listdir(tmp)):
+                    path = os.path.join(tmp, name)
+                    files[name] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+                manifest = {"key": key, "version": version, "installed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                            "files": files}
+                with open(os.path.join(tmp, MANIFEST), 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, indent=2)
+                # Only a broken copy can be in the way here (get() rejected it), and we hold the lock
+                if os.path.exists(self.path(key)):
+                    shutil.rmtree(self.path(key))
+                os.rename(tmp, self.path(key))
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+            return manifest
+
+    def remove(self, key):
+        with self.lock(key):
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+    @contextmanager
+    def lock(self, key):
+        """Exclusive lock on one toolset across processes (held while it is downloaded and installed)."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, f"{key}.lock"), 'a+b') as f:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK gives up after ~10 s; downloads take longer than that
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
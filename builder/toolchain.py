@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+from builder.cache import user_cache_dir
+
+FORMAT = 1
+JDK_TOOLS = ("java", "javac", "keytool")
+# SDK tool -> candidate file names in bin/, in order of preference (.jar first so JVM args can be controlled)
+SDK_TOOLS = {
+    "aapt2": ["aapt2.exe"],
+    "android.jar": ["android.jar"],
+    "d8": ["d8.jar", "d8.exe", "d8.bat", "d8"],
+    "apksigner": ["apksigner.jar", "apksigner.exe", "apksigner.bat", "apksigner"],
+    "adb": ["adb.exe"],
+}
+WINDOWS_JDK_ROOTS = ["C:\\Program Files\\Java", "C:\\Program Files (x86)\\Java"]
+
+
+class ToolchainResolver:
+    """
+    Finds the JDK tools (java, javac, keytool) and the SDK tools in bin/.
+
+    Detection (PATH lookups, the keytool search under Program Files, one
+    `javac -version` run) happens once. Its result is kept in a fingerprint
+    file in the user cache together with the size and mtime of every tool
+    found and of every directory that was searched, so later runs only stat
+    those paths: a tool that is updated, removed or shadowed by a new file
+    in an earlier PATH directory changes one of them and triggers a new
+    detection, as does a different PATH.
+    """
+
+    def __init__(self, tools_dir, logger=None, cache_file=None):
+        self.tools_dir = os.path.abspath(tools_dir)
+        self.logger = logger
+        key = hashlib.sha256(self.tools_dir.encode('utf-8')).hexdigest()[:16]
+        self.cache_file = cache_file or user_cache_dir("toolchain", f"{key}.json")
+
+    def log(self, msg):
+        if self.logger:
+            self.logger(msg)
+
+    def resolve(self, refresh=False):
+        """
+        Returns {"tools": {name: path or None}, "versions": {...}, "cached": bool},
+        from the fingerprint file when it is still valid unless refresh is set.
+        """
+        if not refresh:
+            cached = self._load()
+            if cached is not None:
+                return {"tools": cached["tools"], "versions": cached["versions"], "cached": True}
+        found = self._detect()
+        self._save(found)
+        return dict(found, cached=False)
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("format") != FORMAT or data.get("env") != _environment() or data.get("tools_dir") != self.tools_dir:
+            return None
+        for path, expected in data["stats"].items():
+            if _stat(path) != expected:
+                return None
+        return data
+
+    def _save(self, found):
+        stats = {path: _stat(path) for path in found.pop("watch")}
+        data = dict(found, format=FORMAT, env=_environment(), tools_dir=self.tools_dir, stats=stats)
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            self.log(f"Could not save the toolchain fingerprint: {str(e)}")
+
+    def _detect(self):
+        self.log("Detecting toolchain...")
+        watch = set()  # Every directory searched and every file found
+        tools = {name: _which(name, watch) for name in JDK_TOOLS}
+
+        # If keytool is missing from PATH, try to find it near javac
+        if tools["javac"] and not tools["keytool"]:
+            keytool = os.path.join(os.path.dirname(tools["javac"]), "keytool.exe" if os.name == 'nt' else "keytool")
+            watch.add(keytool)
+            if os.path.exists(keytool):
+                tools["keytool"] = keytool
+
+        # More aggressive search for keytool on Windows
+        if not tools["keytool"] and os.name == 'nt':
+            for root_dir in WINDOWS_JDK_ROOTS:
+                watch.add(root_dir)
+                for root, dirs, files in os.walk(root_dir):
+                    if "keytool.exe" in files:
+                        tools["keytool"] = os.path.join(root, "keytool.exe")
+                        break
+                if tools["keytool"]:
+                    break
+
+        watch.add(self.tools_dir)
+        for name, candidates in SDK_TOOLS.items():
+            paths = [os.path.join(self.tools_dir, c) for c in candidates]
+            tools[name] = next((p for p in paths if os.path.isfile(p)), None)
+        watch.update(path for path in tools.values() if path)
+        return {"tools": tools, "versions": {"jdk": _jdk_version(tools["javac"])}, "watch": watch}
+
+
+def _which(name, watch):
+    """shutil.which, one PATH directory at a time so the directories searched before the match can be watched."""
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        if not directory:
+            continue
+        watch.add(directory)
+        found = shutil.which(name, path=directory)
+        if found:
+            return os.path.abspath(found)
+    return None
+
+
+def _jdk_version(javac):
+    """First line of `javac -version` (e.g. 'javac 17.0.2'), or None."""
+    if not javac:
+        return None
+    try:
+        res = subprocess.run([javac, "-version"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = (res.stdout.strip() or res.stderr.strip()).splitlines()
+    return lines[0] if lines else None
+
+
+def _environment():
+    return {"PATH": os.environ.get("PATH", ""), "PATHEXT": os.environ.get("PATHEXT", "")}
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
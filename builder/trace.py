@@ -0,0 +1,184 @@
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Options followed by the path a tool writes to (aapt2 -o, apksigner --out, d8 --output)
+_OUTPUT_OPTIONS = ("-o", "--out", "--output")
+
+_current = None  # Tracer recording in this process, if any
+
+
+class Tracer:
+    """
+    Records timed spans of a build: pipeline steps, every aapt2/javac/d8/
+    apksigner invocation and the generator's asset processing.
+
+    Each span has its wall-clock start and duration, CPU time (the child's
+    own user + system time for external tools, the process CPU time spent
+    while it ran otherwise), peak RSS (of the child for external tools, the
+    process high-water mark otherwise; Linux never reports a child below
+    the parent's RSS at fork) and, where known, bytes in and out.
+    Spans can be exported as plain JSON or in the Chrome trace-event format
+    (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Absolute start times keep spans recorded by different processes (batch workers) on one timeline
+        self._epoch = time.time() - time.perf_counter()
+
+    @contextmanager
+    def span(self, name, cat="build", **args):
+        """Times the enclosed block. Yields the span's args dict so callers can add counters to it."""
+        stack = self._local.__dict__.setdefault("stack", [])
+        record = {"id": f"{os.getpid()}-{next(self._ids)}", "parent": stack[-1]["id"] if stack else None,
+                  "name": name, "cat": cat, "pid": os.getpid(), "thread": threading.get_ident(), "args": args}
+        stack.append(record)
+        cpu = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            record["start"] = round(self._epoch + start, 6)
+            record["duration"] = round(end - start, 6)
+            # record_process() stores the child's own figures; keep those
+            record["cpu"] = round(args.pop("cpu", time.process_time() - cpu), 6)
+            record["peak_rss_kb"] = args.pop("peak_rss_kb", _self_peak_rss_kb())
+            with self._lock:
+                self.spans.append(record)
+
+    def extend(self, spans):
+        """Adds spans recorded elsewhere (e.g. by a batch worker process)."""
+        with self._lock:
+            self.spans.extend(spans)
+
+    def to_json(self):
+        return {"version": 1, "spans": sorted(self.spans, key=lambda s: s["start"])}
+
+    def to_chrome(self):
+        events = []
+        for pid in sorted({s["pid"] for s in self.spans}):
+            name = "website2app" if pid == os.getpid() else f"worker {pid}"
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": name}})
+        for s in sorted(self.spans, key=lambda s: s["start"]):
+            args = dict(s["args"], cpu_ms=round(s["cpu"] * 1000, 3), peak_rss_kb=s["peak_rss_kb"])
+            events.append({"name": s["name"], "cat": s["cat"], "ph": "X", "pid": s["pid"], "tid": s["thread"],
+                           "ts": round(s["start"] * 1e6), "dur": round(s["duration"] * 1e6), "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_json(self, path):
+        _write(path, self.to_json())
+
+    def write_chrome(self, path):
+        _write(path, self.to_chrome())
+
+    def summary(self, top=5):
+        """One line naming the spans with the most total time, e.g. for the end of a build log."""
+        totals = {}
+        for s in self.spans:
+            if s["cat"] != "build":
+                totals[s["name"]] = totals.get(s["name"], 0) + s["duration"]
+        slowest = sorted(totals.items(), key=lambda item: -item[1])[:top]
+        return f"Trace: {len(self.spans)} span(s); slowest: " + ", ".join(f"{n} {d:.2f}s" for n, d in slowest)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+
+
+@contextmanager
+def recording(tracer=None):
+    """Makes tracer (a new one by default) record every span of this process until the block exits."""
+    global _current
+    previous, _current = _current, tracer or Tracer()
+    try:
+        yield _current
+    finally:
+        _current = previous
+
+
+def current():
+    return _current
+
+
+@contextmanager
+def span(name, cat="build", **args):
+    """Span on the recording tracer; a no-op when nothing is recording."""
+    tracer = _current
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, cat, **args) as span_args:
+        yield span_args
+
+
+def path_bytes(paths):
+    """Total size of the existing files among paths (0 when nothing is recording, so callers stay cheap)."""
+    if _current is None:
+        return 0
+    total = 0
+    for path in paths:
+        try:
+            if os.path.isfile(path):
+                total += os.path.getsize(path)
+        except (OSError, TypeError, ValueError):
+            pass
+    return total
+
+
+@contextmanager
+def tool_span(cmd, name=None):
+    """
+    "tool" span around one external process (see builder/process.py)
+    with the sizes of its input and output files. Yields the span's args;
+    the caller adds the exit code and resource usage with record_process().
+    """
+    if _current is None:
+        yield {}
+        return
+    outputs = [cmd[i + 1] for i in range(len(cmd) - 1) if cmd[i] in _OUTPUT_OPTIONS]
+    with span(name or tool_name(cmd), "tool", bytes_in=path_bytes(a for a in cmd[1:] if a not in outputs)) as args:
+        yield args
+        args["bytes_out"] = path_bytes(outputs)
+
+
+def record_process(args, returncode, usage):
+    """Stores a finished child's exit code and, when known, its own CPU time and peak RSS in a tool span."""
+    args["exit_code"] = returncode
+    if usage is not None:
+        args["cpu"] = usage.ru_utime + usage.ru_stime
+        args["peak_rss_kb"] = _rss_kb(usage.ru_maxrss)
+
+
+def tool_name(cmd):
+    """'aapt2 link', 'javac', ... from a command line."""
+    name = os.path.splitext(os.path.basename(str(cmd[0])))[0]
+    if len(cmd) > 1 and str(cmd[1]).isalpha():
+        name += " " + cmd[1]
+    return name
+
+
+def _rss_kb(maxrss):
+    return maxrss // 1024 if sys.platform == 'darwin' else maxrss  # ru_maxrss is in bytes on macOS, KB elsewhere
+
+
+def _self_peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    return _rss_kb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
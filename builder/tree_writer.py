@@ -0,0 +1,247 @@
+import fnmatch
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from builder.cache import file_sha256
+
+IGNORE_FILE = ".w2aignore"
+# Never useful inside an app bundle; .w2aignore adds to these
+DEFAULT_IGNORES = [".git/", ".svn/", ".hg/", ".DS_Store", "Thumbs.db", IGNORE_FILE]
+
+
+class IgnoreRules:
+    """
+    gitignore-style rules from a .w2aignore file at the root of a source tree.
+
+    Supports comments, '!' negation (last match wins), a trailing '/' for
+    directories only, a leading or inner '/' to anchor the pattern to the
+    root, and '*', '?', '[...]' and '**' wildcards.
+    """
+
+    def __init__(self, patterns=()):
+        self.rules = []  # (negate, dir_only, anchored, pattern)
+        for line in patterns:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.strip('/') if dir_only else line
+            anchored = '/' in line
+            self.rules.append((negate, dir_only, anchored, line.lstrip('/')))
+
+    @classmethod
+    def load(cls, src_dir, extra=()):
+        """Defaults, then src_dir's .w2aignore, then extra patterns (which win over both)."""
+        patterns = list(DEFAULT_IGNORES)
+        try:
+            with open(os.path.join(src_dir, IGNORE_FILE), 'r', encoding='utf-8') as f:
+                patterns += f.read().splitlines()
+        except OSError:
+            pass
+        return cls(patterns + list(extra))
+
+    def ignored(self, rel, is_dir=False):
+        """rel is a '/'-separated path relative to the tree root."""
+        name = rel.rsplit('/', 1)[-1]
+        result = False
+        for negate, dir_only, anchored, pattern in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if anchored:
+                matched = fnmatch.fnmatchcase(rel, pattern) or (
+                    pattern.startswith('**/') and fnmatch.fnmatchcase(rel, pattern[3:]))
+            else:
+                matched = fnmatch.fnmatchcase(name, pattern)
+            if matched:
+                result = not negate
+        return result
+
+
+def walk_files(src_dir, ignore=None):
+    """Yields (relative path, absolute path) for every file under src_dir not excluded by ignore rules."""
+    ignore = IgnoreRules.load(src_dir) if ignore is None else ignore
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        rel_dir = os.path.relpath(dirpath, src_dir).replace(os.sep, '/')
+        prefix = "" if rel_dir == "." else rel_dir + "/"
+        dirnames[:] = sorted(d for d in dirnames if not ignore.ignored(prefix + d, is_dir=True))
+        for name in sorted(filenames):
+            if not ignore.ignored(prefix + name):
+                yield os.path.normpath(prefix + name), os.path.join(dirpath, name)
+
+
+class TreeWriter:
+    """
+    Write-if-changed file tree.
+
+    Generators describe the full output tree (rendered text, encoded images,
+    files copied from the user's project) and commit() applies it to disk:
+    files whose bytes are identical are left untouched (keeping their mtimes
+    for downstream caches), changed files are replaced atomically and files
+    that are no longer produced are deleted.
+
+    Copied files count as unchanged when size and mtime match the source
+    (or, failing that, their hashes do). New copies are reflinked where the
+    filesystem supports it and fall back to real copies otherwise; all of it
+    runs on a thread pool. links=True also hardlinks within one filesystem,
+    which shares the inode with the source: only use it for trees nobody
+    edits in place, as an edit would change the source file too. Without it,
+    outputs still hardlinked to their source (from older runs) are replaced
+    by copies.
+    """
+
+    def __init__(self, root, keep=(), prune=True, links=False, max_workers=None):
+        self.root = os.path.abspath(root)
+        self.keep = [os.path.normpath(k) for k in keep]  # Relative paths never pruned (e.g. build dirs)
+        self.prune = prune
+        self.links = links
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self._entries = {}  # relpath -> ("data", bytes) | ("copy", src_path)
+        self._link_modes = {}  # (src st_dev, dest st_dev) -> "reflink" | "link" | "copy"
+        self._lock = threading.Lock()
+
+    def _rel(self, path):
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        if rel.startswith(os.pardir):
+            raise ValueError(f"{path} is outside of {self.root}")
+        return os.path.normpath(rel)
+
+    def write_bytes(self, path, data):
+        self._entries[self._rel(path)] = ("data", bytes(data))
+
+    def write_text(self, path, text):
+        self.write_bytes(path, text.encode('utf-8'))
+
+    def copy_file(self, path, src):
+        self._entries[self._rel(path)] = ("copy", os.path.abspath(src))
+
+    def copy_tree(self, path, src_dir, ignore=None):
+        """Copies src_dir to path, skipping whatever its .w2aignore (or the given IgnoreRules) excludes."""
+        for rel, src in walk_files(src_dir, ignore):
+            self.copy_file(os.path.join(path, rel), src)
+
+    def commit(self):
+        """Applies the tree to disk. Returns counts of written, linked, unchanged and deleted files."""
+        stats = {"written": 0, "linked": 0, "unchanged": 0, "deleted": 0}
+        if self._entries:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for result in pool.map(self._apply, self._entries.items()):
+                    stats[result] += 1
+
+        if self.prune:
+            stats["deleted"] = self._delete_stale()
+        return stats
+
+    def _apply(self, item):
+        rel, (kind, payload) = item
+        dest = os.path.join(self.root, rel)
+        if kind == "data":
+            if self._same_bytes(dest, payload):
+                return "unchanged"
+        elif self._same_file(dest, payload):
+            return "unchanged"
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{threading.get_ident()}.w2a-tmp"
+        result = "written"
+        if kind == "data":
+            with open(tmp, 'wb') as f:
+                f.write(payload)
+        else:
+            result = self._clone(payload, tmp)
+        os.replace(tmp, dest)
+        return result
+
+    def _clone(self, src, tmp):
+        """Reflinks, hardlinks or copies src to tmp, remembering what works per pair of filesystems."""
+        devices = (os.stat(src).st_dev, os.stat(os.path.dirname(tmp)).st_dev)
+        with self._lock:
+            mode = self._link_modes.get(devices)
+        if mode in (None, "reflink"):
+            if _reflink(src, tmp):
+                shutil.copystat(src, tmp)
+                mode = "reflink"
+            else:
+                mode = "link" if self.links and devices[0] == devices[1] else "copy"
+            with self._lock:
+                self._link_modes.setdefault(devices, mode)
+            if mode == "reflink":
+                return "linked"
+        if mode == "link":
+            try:
+                os.link(src, tmp)
+                return "linked"
+            except OSError:
+                with self._lock:
+                    self._link_modes[devices] = "copy"
+        shutil.copy2(src, tmp)
+        return "written"
+
+    def _delete_stale(self):
+        deleted = 0
+        if not os.path.isdir(self.root):
+            return deleted
+        for dirpath, dirnames, filenames in os.walk(self.root, topdown=False):
+            rel_dir = os.path.normpath(os.path.relpath(dirpath, self.root))
+            if self._is_kept(rel_dir):
+                continue
+            for name in filenames:
+                rel = os.path.normpath(os.path.join(rel_dir, name))
+                if rel not in self._entries and not self._is_kept(rel):
+                    os.remove(os.path.join(dirpath, name))
+                    deleted += 1
+            if rel_dir != os.curdir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+        return deleted
+
+    def _is_kept(self, rel):
+        return any(rel == k or rel.startswith(k + os.sep) for k in self.keep)
+
+    @staticmethod
+    def _same_bytes(path, data):
+        try:
+            if os.path.getsize(path) != len(data):
+                return False
+            with open(path, 'rb') as f:
+                return f.read() == data
+        except OSError:
+            return False
+
+    def _same_file(self, path, src):
+        try:
+            dest_st, src_st = os.stat(path), os.stat(src)
+        except OSError:
+            return False
+        if dest_st.st_size != src_st.st_size:
+            return False
+        if os.path.samestat(dest_st, src_st):
+            return self.links  # A hardlink is only kept when links are wanted
+        if dest_st.st_mtime_ns == src_st.st_mtime_ns:
+            return True  # Copied with copy2/copystat and not touched since
+        return file_sha256(path) == file_sha256(src)
+
+
+def _reflink(src, dst):
+    """Copy-on-write clone (Linux FICLONE on btrfs/XFS, clonefile on APFS). False if unsupported."""
+    try:
+        if sys.platform.startswith('linux'):
+            import fcntl
+            ficlone = 0x40049409
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), ficlone, s.fileno())
+            return True
+        if sys.platform == 'darwin':
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0:
+                return True
+    except (OSError, AttributeError):
+        pass
+    if os.path.exists(dst):
+        os.remove(dst)
+    return False
@@ -0,0 +1,360 @@
+import hashlib
+import os
+import re
+
+from builder.cache import user_cache_dir
+from builder.tree_writer import IgnoreRules, walk_files
+
+# Keywords after which a '/' starts a regular expression rather than a division
+_REGEX_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case", "do",
+                   "else", "yield", "await"}
+_JS_SPACE = " \t\r\f\v\u00a0\ufeff"
+_JS_NEWLINE = "\n\u2028\u2029"
+_SOURCE_MAP_COMMENT = re.compile(r'^[ \t]*(?://[#@]\s*sourceMappingURL=[^\n]*'
+                                 r'|/\*[#@]\s*sourceMappingURL=[^*]*\*/)[ \t]*$', re.M)
+# Comments, raw-text elements, tags (copied verbatim so quoted attribute values keep their spaces), whitespace
+_HTML_TOKEN = re.compile(r'<!--.*?-->|<(script|style|pre|textarea)\b([^>]*)>(.*?)</\1\s*>'
+                         r'|<[a-zA-Z/!?][^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>|\s+', re.S | re.I)
+_SCRIPT_TYPE = re.compile(r'\btype\s*=\s*["\']?([^"\'\s>]+)', re.I)
+_JS_TYPES = {"", "text/javascript", "application/javascript", "module", "text/ecmascript"}
+
+
+class MinifyError(Exception):
+    """The source could not be tokenized safely; it is shipped unmodified instead."""
+
+
+def _is_word(c):
+    return c.isalnum() or c in "_$\\" or ord(c) > 127
+
+
+def minify_js(src):
+    """
+    Conservative JavaScript minifier.
+
+    Removes comments (keeping /*! license */ blocks) and collapses
+    whitespace, but keeps one line break wherever the source had one so
+    automatic semicolon insertion behaves exactly as before. Strings,
+    template literals and regular expressions are copied verbatim.
+    """
+    out = []
+    last = ""  # Last significant token (identifier/keyword or single character)
+    pending = ""  # Whitespace seen since the last emitted token
+    i, n = 0, len(src)
+    while i < n:
+        c = src[i]
+        if c in _JS_SPACE:
+            pending = pending or " "
+            i += 1
+            continue
+        if c in _JS_NEWLINE:
+            pending = "\n"
+            i += 1
+            continue
+        if c == '/' and src.startswith('//', i):
+            end = src.find('\n', i)
+            i = n if end < 0 else end
+            continue
+        if c == '/' and src.startswith('/*', i):
+            end = src.find('*/', i + 2)
+            if end < 0:
+                raise MinifyError("Unterminated comment")
+            comment = src[i:end + 2]
+            i = end + 2
+            if not comment.startswith('/*!'):
+                pending = "\n" if "\n" in comment or pending == "\n" else (pending or " ")
+                continue
+            token = comment
+        elif c in "'\"":
+            token, i = _scan_string(src, i)
+        elif c == '`':
+            token, i = _scan_template(src, i)
+        elif c == '/' and (not last or last in _REGEX_KEYWORDS or (len(last) == 1 and last in "(,=:[!&|?{};+-*%<>~^")):
+            token, i = _scan_regex(src, i)
+        elif _is_word(c):
+            j = i + 1
+            while j < n and (_is_word(src[j]) or (src[j] == '.' and src[i].isdigit())):
+                j += 1
+            token, i = src[i:j], j
+        else:
+            token, i = c, i + 1
+
+        if out and pending:
+            prev = out[-1][-1]
+            if pending == "\n":
+                out.append("\n")
+            elif (_is_word(prev) and _is_word(token[0])) or (prev == token[0] and prev in "+-") \
+                    or (prev.isdigit() and token[0] == '.'):
+                out.append(" ")
+        pending = ""
+        out.append(token)
+        last = token if _is_word(token[0]) or len(token) == 1 else "x"
+    return "".join(out)
+
+
+def _scan_string(src, i):
+    quote = src[i]
+    j = i + 1
+    while j < len(src):
+        c = src[j]
+        if c == '\\':
+            j += 2
+            continue
+        if c == quote:
+            return src[i:j + 1], j + 1
+        if c == '\n':
+            break
+        j += 1
+    raise MinifyError("Unterminated string")
+
+
+def _scan_template(src, i):
+    j = i + 1
+    while j < len(src):
+        c = src[j]
+        if c == '\\':
+            j += 2
+        elif c == '`':
+            return src[i:j + 1], j + 1
+        elif c == '$' and src.startswith('${', j):
+            j = _skip_expression(src, j + 2)
+        else:
+            j += 1
+    raise MinifyError("Unterminated template literal")
+
+
+def _skip_expression(src, j):
+    """Returns the index just past the '}' closing a template ${...} expression (copied verbatim)."""
+    depth = 1
+    while j < len(src):
+        c = src[j]
+        if c in "'\"":
+            j = _scan_string(src, j)[1]
+        elif c == '`':
+            j = _scan_template(src, j)[1]
+        elif c == '{':
+            depth += 1
+            j += 1
+        elif c == '}':
+            depth -= 1
+            j += 1
+            if depth == 0:
+                return j
+        else:
+            j += 1
+    raise MinifyError("Unterminated template expression")
+
+
+def _scan_regex(src, i):
+    j = i + 1
+    in_class = False
+    while j < len(src):
+        c = src[j]
+        if c == '\\':
+            j += 2
+            continue
+        if c == '\n':
+            break
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            j += 1
+            while j < len(src) and _is_word(src[j]):
+                j += 1
+            return src[i:j], j
+        j += 1
+    raise MinifyError("Unterminated regular expression")
+
+
+def minify_css(src):
+    """Removes comments (keeping /*! */) and insignificant whitespace around braces, semicolons and commas."""
+    out = []
+    i, n = 0, len(src)
+    while i < n:
+        c = src[i]
+        if c == '/' and src.startswith('/*', i):
+            end = src.find('*/', i + 2)
+            if end < 0:
+                raise MinifyError("Unterminated comment")
+            if src.startswith('/*!', i):
+                out.append(src[i:end + 2])
+            elif out and out[-1] != " ":
+                out.append(" ")
+            i = end + 2
+        elif c in "'\"":
+            token, i = _scan_string(src, i)
+            out.append(token)
+        elif c.isspace():
+            while i < n and src[i].isspace():
+                i += 1
+            if out and out[-1] != " ":
+                out.append(" ")
+        else:
+            out.append(c)
+            i += 1
+    css = "".join(out)
+    # Outside of strings these characters never need surrounding whitespace
+    parts = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*!.*?\*/)', css, flags=re.S)
+    for k in range(0, len(parts), 2):
+        parts[k] = re.sub(r'\s*([{};,])\s*', r'\1', parts[k]).replace(';}', '}')
+    return "".join(parts).strip()
+
+
+def minify_html(src):
+    """
+    Removes comments (keeping conditional comments) and collapses whitespace
+    runs between and inside text, leaving <pre> and <textarea> untouched.
+    Inline scripts and styles go through minify_js/minify_css.
+    """
+    def replace(match):
+        token = match.group(0)
+        if token.startswith('<!--'):
+            return token if token.startswith(('<!--[if', '<!--!')) else ""
+        tag = match.group(1)
+        if tag is None:
+            if token.startswith('<'):
+                return token
+            return "\n" if "\n" in token else " "
+        tag = tag.lower()
+        attrs, body = match.group(2), match.group(3)
+        try:
+            if tag == "script":
+                script_type = _SCRIPT_TYPE.search(attrs)
+                if (script_type.group(1).lower() if script_type else "") in _JS_TYPES:
+                    body = minify_js(body)
+            elif tag == "style":
+                body = minify_css(body)
+            else:
+                return token
+        except MinifyError:
+            return token
+        start = match.start(0)
+        return token[:match.start(3) - start] + body + token[match.end(3) - start:]
+    return _HTML_TOKEN.sub(replace, src).strip()
+
+
+def strip_source_map_comment(text):
+    return _SOURCE_MAP_COMMENT.sub("", text)
+
+
+class WebAssetPipeline:
+    """
+    Optional optimization of the web content copied into the app.
+
+    Dotfiles (and dot-directories) and *.map source maps are dropped,
+    sourceMappingURL comments are removed and HTML/CSS/JS is minified.
+    Already compressed media needs no work here: ApkWriter stores those
+    formats uncompressed and aligned so the WebView can map them directly.
+
+    Minified outputs are cached on disk by content hash, so unchanged
+    bundles cost one hash per file on the next generation.
+    """
+
+    VERSION = 1  # Bump whenever the minifiers' output changes
+    MINIFIERS = {".html": minify_html, ".htm": minify_html, ".css": minify_css, ".js": minify_js,
+                 ".mjs": minify_js}
+
+    def __init__(self, minify=True, strip_source_maps=True, strip_dotfiles=True, cache_dir=None):
+        self.minify = minify
+        self.strip_source_maps = strip_source_maps
+        self.strip_dotfiles = strip_dotfiles
+        self.cache_dir = cache_dir if cache_dir is not None else user_cache_dir("web")
+        self.stats = {"files": 0, "minified": 0, "skipped": 0, "original_bytes": 0, "output_bytes": 0}
+
+    def skip(self, rel_path):
+        """True for files that should not be shipped at all."""
+        parts = rel_path.replace(os.sep, '/').split('/')
+        if self.strip_dotfiles and any(p.startswith('.') for p in parts):
+            return True
+        return self.strip_source_maps and parts[-1].endswith('.map')
+
+    def process_tree(self, src_dir):
+        """
+        Returns [(relative path, source path, optimized bytes or None)] for
+        the files of src_dir to ship, honoring .w2aignore. None means the
+        file is shipped unchanged.
+        """
+        # Prune dot-directories without walking them; dotfiles are counted as skipped below
+        ignore = IgnoreRules.load(src_dir, extra=[".*/"] if self.strip_dotfiles else [])
+        entries = []
+        for rel, src in walk_files(src_dir, ignore):
+            if self.skip(rel):
+                self.stats["skipped"] += 1
+                continue
+            entries.append((rel, src, self.process_file(src)))
+        return entries
+
+    def process_file(self, src):
+        """Optimized bytes for src, or None to ship it unchanged."""
+        size = os.path.getsize(src)
+        self.stats["files"] += 1
+        self.stats["original_bytes"] += size
+        data = self._optimized(src)
+        if data is None:
+            self.stats["output_bytes"] += size
+        else:
+            self.stats["minified"] += 1
+            self.stats["output_bytes"] += len(data)
+        return data
+
+    def _optimized(self, src):
+        """Optimized bytes for a text asset, or None to copy the file unchanged."""
+        ext = os.path.splitext(src)[1].lower()
+        minifier = self.MINIFIERS.get(ext) if self.minify else None
+        if minifier is None and not (self.strip_source_maps and ext in (".js", ".mjs", ".css")):
+            return None
+        if minifier is not None and src.lower().endswith((".min.js", ".min.css")):
+            minifier = None  # Already minified by the site's own bundler
+        with open(src, 'rb') as f:
+            raw = f.read()
+
+        key = hashlib.sha256(f"{self.VERSION}|{minifier is not None}|{self.strip_source_maps}|".encode('ascii')
+                             + raw).hexdigest()
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        try:
+            text = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+        if self.strip_source_maps:
+            text = strip_source_map_comment(text)
+        if minifier is not None:
+            try:
+                text = minifier(text)
+            except (MinifyError, RecursionError):
+                pass  # Ship it unminified rather than risk breaking the page
+        data = text.encode('utf-8')
+        if len(data) >= len(raw):
+            data = raw
+        self._cache_put(key, data)
+        return data
+
+    def _cache_get(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, key[:2], key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _cache_put(self, key, data):
+        if not self.cache_dir:
+            return
+        path = os.path.join(self.cache_dir, key[:2], key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # The cache is only an optimization
+
+
+def format_web_report(stats):
+    saved = stats["original_bytes"] - stats["output_bytes"]
+    return (f"Web assets: {stats['files']} file(s), {stats['minified']} optimized, {stats['skipped']} stripped, "
+            f"saved {saved / 1024:.1f} KB")
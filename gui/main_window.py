@@ -11,6 +11,9 @@ from PyQt6.QtCore import Qt, pyqtSignal, QObject
 
 from gui.widgets import FilePicker
 from builder.generator import ProjectGenerator
+from builder.images import format_image_report
+from builder.project_ir import generate_targets
+from builder.web_assets import format_web_report
 from builder.engine import BuildEngine
 from builder.project_manager import ProjectManager, HistoryManager
 
@@ -19,6 +22,9 @@ class Signaller(QObject):
     finished = pyqtSignal(bool)
     status = pyqtSignal(str)
     progress = pyqtSignal(int)
+    devices = pyqtSignal(list)
+    installed = pyqtSignal(bool, str)
+    batch_finished = pyqtSignal(list)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -44,6 +50,10 @@ class MainWindow(QMainWindow):
         self.signaller.finished.connect(self.post_build)
         self.signaller.status.connect(self.update_status)
         self.signaller.progress.connect(self.update_progress)
+        self.signaller.devices.connect(self.update_device_list)
+        self.signaller.installed.connect(self.post_install)
+        self.signaller.batch_finished.connect(self.post_batch_build)
+        self.device_tracker = None
 
         self.setup_menu()
         self.setup_header()
@@ -63,6 +73,9 @@ class MainWindow(QMainWindow):
         
         save_act = file_menu.addAction('Save Project')
         save_act.triggered.connect(self.save_project_ui)
+
+        batch_act = file_menu.addAction('Batch Build Projects...')
+        batch_act.triggered.connect(self.start_batch_build_thread)
         
         file_menu.addSeparator()
         exit_act = file_menu.addAction('Exit')
@@ -77,6 +90,8 @@ class MainWindow(QMainWindow):
         validate_act.triggered.connect(self.validate_project)
         build_act = build_menu.addAction('Build APK')
         build_act.triggered.connect(self.start_build_thread)
+        build_both_act = build_menu.addAction('Build APK + Export iOS Project')
+        build_both_act.triggered.connect(lambda: self.start_build_thread(with_ios=True))
 
     def setup_header(self):
         header = QWidget()
@@ -170,6 +185,9 @@ class MainWindow(QMainWindow):
         
         self.start_page = QLineEdit("index.html")
         web_layout.addRow("Start Page:", self.start_page)
+
+        self.optimize_web = QCheckBox("Optimize Web Assets (minify HTML/CSS/JS, strip source maps and dotfiles)")
+        web_layout.addRow(self.optimize_web)
         
         web_group.setLayout(web_layout)
         layout.addWidget(web_group)
@@ -231,6 +249,12 @@ class MainWindow(QMainWindow):
         self.headers = QLineEdit()
         self.headers.setPlaceholderText('e.g. {"X-App": "W2APK"}')
         conf_layout.addWidget(self.headers, 6, 1, 1, 2)
+
+        # Splash is always downscaled per density; this picks the encoding of icons and splash
+        conf_layout.addWidget(QLabel("Image Optimization:"), 7, 0)
+        self.image_optimization = QComboBox()
+        self.image_optimization.addItems(["None", "Lossless PNG", "WebP"])
+        conf_layout.addWidget(self.image_optimization, 7, 1)
         
         conf_group.setLayout(conf_layout)
         android_layout.addWidget(conf_group)
@@ -283,6 +307,9 @@ class MainWindow(QMainWindow):
         self.build_btn.setFixedHeight(50)
         self.build_btn.setStyleSheet("background-color: #27ae60; font-size: 16px; color: white;")
         android_layout.addWidget(self.build_btn)
+        self.cancel_build_btn = QPushButton("CANCEL BUILD")
+        self.cancel_build_btn.setEnabled(False)
+        android_layout.addWidget(self.cancel_build_btn)
         
         self.tabs.addTab(android_tab, "Android Settings")
         
@@ -357,6 +384,7 @@ class MainWindow(QMainWindow):
         # Connect Buttons
         self.validate_btn.clicked.connect(self.validate_project)
         self.build_btn.clicked.connect(self.start_build_thread)
+        self.cancel_build_btn.clicked.connect(self.cancel_build)
         self.reset_btn.clicked.connect(self.reset_fields)
         self.save_cfg_btn.clicked.connect(self.save_project_ui)
         self.analyze_btn.clicked.connect(self.analyze_apk_action)
@@ -487,10 +515,12 @@ class MainWindow(QMainWindow):
             "web_path": self.web_path.input_field.text(),
             "url": self.url_input.text(),
             "start_page": self.start_page.text(),
+            "optimize_web_assets": self.optimize_web.isChecked(),
             "icon_path": self.icon_path.input_field.text(),
             "splash_path": self.splash_path.input_field.text(),
             "splash_duration": self.splash_duration.value(),
             "orientation": self.orientation.currentText(),
+            "image_optimization": self.image_optimization.currentText(),
             "show_status_bar": self.show_status_bar.isChecked(),
             "show_nav_bar": self.show_nav_bar.isChecked(),
             "enable_js": self.enable_js.isChecked(),
@@ -524,10 +554,12 @@ class MainWindow(QMainWindow):
         self.web_path.set_path(cfg.get("web_path", ""))
         self.url_input.setText(cfg.get("url", ""))
         self.start_page.setText(cfg.get("start_page", "index.html"))
+        self.optimize_web.setChecked(cfg.get("optimize_web_assets", False))
         self.icon_path.set_path(cfg.get("icon_path", ""))
         self.splash_path.set_path(cfg.get("splash_path", ""))
         self.splash_duration.setValue(cfg.get("splash_duration", 2000))
         self.orientation.setCurrentText(cfg.get("orientation", "Auto Rotate"))
+        self.image_optimization.setCurrentText(cfg.get("image_optimization", "None"))
         self.show_status_bar.setChecked(cfg.get("show_status_bar", True))
         self.show_nav_bar.setChecked(cfg.get("show_nav_bar", True))
         self.enable_js.setChecked(cfg.get("enable_js", True))
@@ -553,18 +585,19 @@ class MainWindow(QMainWindow):
         self.ios_display_name.setText(ios.get("display_name", "My App"))
         self.ios_build_num.setValue(ios.get("build_num", 1))
 
-    def start_build_thread(self):
+    def start_build_thread(self, with_ios=False):
         if not self.validate_project(silent=True):
             QMessageBox.warning(self, "Validation Error", "Please fix the project configuration errors before building. Check the package name for spaces or invalid characters.")
             return
         self.build_btn.setEnabled(False)
+        self.cancel_build_btn.setEnabled(True)
         self.console.clear()
         self.progress_bar.setValue(0)
         self.log("Starting build process...")
-        t = threading.Thread(target=self.run_build)
+        t = threading.Thread(target=self.run_build, args=(with_ios,))
         t.start()
 
-    def run_build(self):
+    def run_build(self, with_ios=False):
         try:
             config = self.get_config()
             output_dir = config['output_dir']
@@ -583,6 +616,7 @@ class MainWindow(QMainWindow):
                 "custom_ks": config.get("custom_ks", {})
             }
             engine = BuildEngine(base_dir, logger_callback=self.signaller.log.emit, signing_config=signing_config)
+            self.current_engine = engine
             ok, msg = engine.check_dependencies()
             if not ok:
                 self.signaller.log.emit(f"Dependency Error: {msg}")
@@ -592,10 +626,19 @@ class MainWindow(QMainWindow):
             self.signaller.progress.emit(20)
             
             # 3. Generate Project
-            self.signaller.status.emit("Generating project...")
-            template_dir = os.path.join(base_dir, "assets", "template")
-            gen = ProjectGenerator(template_dir)
-            gen.generate(config, output_dir)
+            if with_ios:
+                # Both targets from one shared generation pass
+                self.signaller.status.emit("Generating Android and iOS projects...")
+                stats = generate_targets(config, output_dir, base_dir)["android"]
+                self.signaller.log.emit(f"iOS project exported to {os.path.join(output_dir, 'WebApp_iOS')}")
+            else:
+                self.signaller.status.emit("Generating project...")
+                template_dir = os.path.join(base_dir, "assets", "template")
+                gen = ProjectGenerator(template_dir)
+                stats = gen.generate(config, output_dir)
+            self.signaller.log.emit(format_image_report(stats["images"]))
+            if stats["web"]:
+                self.signaller.log.emit(format_web_report(stats["web"]))
             
             self.signaller.progress.emit(40)
             
@@ -613,6 +656,45 @@ class MainWindow(QMainWindow):
             self.signaller.log.emit(traceback.format_exc())
             self.signaller.finished.emit(False)
 
+    def start_batch_build_thread(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Batch Build Projects", "", "Project Files (*.w2apk)")
+        if not paths:
+            return
+        self.build_btn.setEnabled(False)
+        self.cancel_build_btn.setEnabled(True)
+        self.console.clear()
+        self.progress_bar.setValue(0)
+        self.log(f"Starting batch build of {len(paths)} project(s)...")
+        t = threading.Thread(target=self.run_batch_build, args=(paths,))
+        t.start()
+
+    def run_batch_build(self, paths):
+        try:
+            from builder.batch import BatchBuilder
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            batch = BatchBuilder(base_dir, logger=self.signaller.log.emit)
+            self.current_batch = batch
+            configs = batch.load_projects(paths)
+            total = len(batch.plan(configs))
+            done = []
+
+            def on_result(result):
+                done.append(result)
+                if not result["success"]:
+                    for line in result["log"][-5:]:
+                        self.signaller.log.emit(f"    {line}")
+                self.signaller.progress.emit(int(100 * len(done) / total))
+
+            self.signaller.status.emit(f"Batch building {total} APK(s)...")
+            results = batch.build(configs, on_result=on_result)
+            self.signaller.batch_finished.emit(results)
+
+        except Exception as e:
+            self.signaller.log.emit(f"Batch Build Error: {str(e)}")
+            import traceback
+            self.signaller.log.emit(traceback.format_exc())
+            self.signaller.batch_finished.emit([])
+
     def start_ios_export_thread(self):
         self.ios_export_btn.setEnabled(False)
         self.console.clear()
@@ -648,7 +730,20 @@ class MainWindow(QMainWindow):
             self.signaller.log.emit(traceback.format_exc())
             self.signaller.finished.emit(False)
 
+    def cancel_build(self):
+        engine = getattr(self, "current_engine", None)
+        if engine:
+            self.log("Cancelling build...")
+            engine.cancel()
+        batch = getattr(self, "current_batch", None)
+        if batch:
+            self.log("Cancelling batch: queued builds are dropped, running ones finish...")
+            batch.cancel()
+        self.cancel_build_btn.setEnabled(False)
+
     def post_build(self, success):
+        self.current_engine = None
+        self.cancel_build_btn.setEnabled(False)
         self.build_btn.setEnabled(True)
         self.ios_export_btn.setEnabled(True)
         self.signaller.status.emit("Ready")
@@ -659,6 +754,25 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.warning(self, "Build Failed", "Check the console log for details.")
 
+    def post_batch_build(self, results):
+        self.current_batch = None
+        self.cancel_build_btn.setEnabled(False)
+        self.build_btn.setEnabled(True)
+        self.signaller.status.emit("Ready")
+        built = [r for r in results if r["success"]]
+        for result in built:
+            # The batch job's own work dir, not the project's output dir shown in the form
+            self.history_manager.add_entry({"app_title": result["app_title"], "package_name": result["package_name"],
+                                            "output_dir": result["project_dir"]})
+        failed = len(results) - len(built)
+        if not results:
+            QMessageBox.warning(self, "Batch Build Failed", "Check the console log for details.")
+        elif failed:
+            QMessageBox.warning(self, "Batch Build Finished",
+                                f"{len(built)} APK(s) built, {failed} failed. Check the console log for details.")
+        else:
+            QMessageBox.information(self, "Batch Build Complete", f"{len(built)} APK(s) generated successfully!")
+
     def show_history(self):
         history = self.history_manager.get_history()
         if not history:
@@ -696,7 +810,7 @@ class MainWindow(QMainWindow):
         self.console.clear()
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         engine = BuildEngine(base_dir, logger_callback=self.log)
-        ok, msg = engine.check_dependencies()
+        ok, msg = engine.check_dependencies(refresh=True)
         if ok:
             QMessageBox.information(self, "Dependencies", "All dependencies found!")
             self.refresh_devices()
@@ -704,19 +818,36 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Dependencies", f"Issues found: {msg}")
 
     def refresh_devices(self):
-        from builder.engine import ADBManager
+        from builder.adb import ADBManager
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        adb = ADBManager(os.path.join(base_dir, "bin"), logger=self.log)
-        devices = adb.list_devices()
-        self.device_list.clear()
-        self.device_list.addItems(devices)
-        if devices:
-            self.log(f"Found {len(devices)} device(s).")
+        adb = ADBManager(os.path.join(base_dir, "bin"), logger=self.signaller.log.emit)
+        # The adb server pushes device changes, so the list stays current without clicking refresh again
+        if self.device_tracker:
+            self.device_tracker.stop()
+        self.device_tracker = adb.track(on_change=self.signaller.devices.emit)
+        devices = adb.devices()
+        self.update_device_list(devices)
+        online = [d for d in devices if d["state"] == "device"]
+        if online:
+            self.log(f"Found {len(online)} device(s).")
         else:
             self.log("No ADB devices found.")
 
+    def update_device_list(self, devices):
+        current = self.device_list.currentData()
+        online = [d for d in devices if d["state"] == "device"]
+        self.device_list.clear()
+        if len(online) > 1:
+            self.device_list.addItem(f"All devices ({len(online)})", "*")
+        for d in online:
+            label = f"{d['serial']} ({d['model']})" if d.get("model") else d["serial"]
+            self.device_list.addItem(label, d["serial"])
+        index = self.device_list.findData(current)
+        if index >= 0:
+            self.device_list.setCurrentIndex(index)
+
     def install_apk_action(self):
-        device = self.device_list.currentText()
+        device = self.device_list.currentData()
         if not device:
             QMessageBox.warning(self, "ADB", "No device selected.")
             return
@@ -726,12 +857,33 @@ class MainWindow(QMainWindow):
         apk_name = f"output_{variant}.apk"
         apk_path = os.path.join(config['output_dir'], apk_name)
         
-        from builder.engine import ADBManager
+        self.install_btn.setEnabled(False)
+        t = threading.Thread(target=self.run_install, args=(device, apk_path))
+        t.start()
+
+    def run_install(self, device, apk_path):
+        from builder.adb import ADBManager
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        adb = ADBManager(os.path.join(base_dir, "bin"), logger=self.log)
-        
-        success, msg = adb.install_apk(device, apk_path)
-        if success:
+        adb = ADBManager(os.path.join(base_dir, "bin"), logger=self.signaller.log.emit)
+        try:
+            if device != "*":
+                success, msg = adb.install_apk(device, apk_path)
+                self.signaller.installed.emit(success, msg)
+                return
+            # Every connected device at once
+            results = adb.install_all(apk_path)
+            failed = [r for r in results if not r["success"]]
+            msg = "\n".join(f"{r['serial']}: {r['message']}" for r in failed)
+            self.signaller.installed.emit(bool(results) and not failed, msg or "No devices connected.")
+        except Exception as e:
+            self.signaller.installed.emit(False, str(e))
+
+    def post_install(self, success, msg):
+        from builder.adb import UNCHANGED
+        self.install_btn.setEnabled(True)
+        if success and msg == UNCHANGED:
+            QMessageBox.information(self, "ADB", "The device already has this build installed.")
+        elif success:
             QMessageBox.information(self, "ADB", "Installation successful!")
         else:
             QMessageBox.critical(self, "ADB", f"Installation failed:\n{msg}")
@@ -1,8 +1,17 @@
 import sys
-from PyQt6.QtWidgets import QApplication
-from gui.main_window import MainWindow
+
+# Subcommands handled by the headless CLI (builder.cli). Anything else starts the GUI.
+CLI_COMMANDS = ("build", "ios", "batch", "install", "check", "daemon", "-h", "--help")
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        # Build servers never import PyQt6
+        from builder.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
+    from PyQt6.QtWidgets import QApplication
+    from gui.main_window import MainWindow
+
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,58 @@
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from builder.adb import ADBManager
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="the fake adb is a shell script")
+
+# Every adb command takes 0.1 s, or 5 s on the "slow" device
+FAKE_ADB = """#!/bin/sh
+if [ "$2" = "slow" ]; then sleep 5; else sleep 0.1; fi
+[ "$3" = "install" ] && echo Success
+exit 0
+"""
+
+
+def _device(serial):
+    return {"serial": serial, "state": "device", "model": None, "product": None, "device": None, "transport_id": None}
+
+
+@pytest.fixture
+def adb(tmp_path):
+    path = tmp_path / "adb.exe"
+    path.write_text(FAKE_ADB)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    apk = tmp_path / "app.apk"
+    apk.write_bytes(b"not really an apk")
+    return ADBManager(str(tmp_path)), str(apk)
+
+
+def test_interrupt_kills_running_installs(adb):
+    manager, apk = adb
+
+    def on_result(result):
+        raise KeyboardInterrupt  # As if Ctrl-C arrived once the first device finished
+
+    started = time.time()
+    with pytest.raises(KeyboardInterrupt):
+        manager.install_all(apk, devices=[_device("fast"), _device("slow")], on_result=on_result, force=True)
+    assert time.time() - started < 3
+    assert manager.runner.cancelled
+
+
+@pytest.mark.parametrize("force", [True, False])
+def test_cancel_reports_cancelled_devices(adb, force):
+    manager, apk = adb
+    # Without force the slow device is cancelled while its installed APK is being queried
+    manager.local_state = lambda path: {"package": "com.example.app", "version_code": 1, "sha256": "0" * 64}
+    threading.Timer(0.5, manager.cancel).start()
+    started = time.time()
+    results = manager.install_all(apk, devices=[_device("fast"), _device("slow")], force=force)
+    assert time.time() - started < 3
+    by_serial = {r["serial"]: r for r in results}
+    assert by_serial["fast"]["success"]
+    assert not by_serial["slow"]["success"] and by_serial["slow"]["message"] == "Cancelled"
@@ -0,0 +1,180 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from builder import downloader, fetch
+from builder.downloader import SDK_ARCHIVES, MinimalToolsDownloader
+from builder.tool_store import ToolStore
+
+CHUNK = 64 * 1024
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+ARCHIVE_MEMBERS = {
+    "build-tools": {"android-13/aapt2.exe": os.urandom(400 * 1024), "android-13/lib/d8.jar": os.urandom(300 * 1024),
+                    "android-13/lib/apksigner.jar": os.urandom(200 * 1024), "android-13/NOTICE.txt": b"notice"},
+    "platform": {"android-33/android.jar": os.urandom(600 * 1024), "android-33/build.prop": b"ro.build=33"},
+    "platform-tools": {"platform-tools/adb.exe": os.urandom(300 * 1024), "platform-tools/AdbWinApi.dll": b"api",
+                       "platform-tools/AdbWinUsbApi.dll": b"usb", "platform-tools/fastboot.exe": b"fastboot"},
+}
+INSTALLED = ["aapt2.exe", "d8.jar", "apksigner.jar", "android.jar", "adb.exe", "AdbWinApi.dll", "AdbWinUsbApi.dll"]
+
+
+class _Mirror(BaseHTTPRequestHandler):
+    """Serves files by name with Range/If-Range support; can drop a connection half-way through a file."""
+
+    def do_GET(self):
+        server = self.server
+        name = self.path.lstrip('/')
+        data = server.files.get(name)
+        if data is None:
+            self.send_error(404)
+            return
+        etag = '"%s"' % hashlib.sha256(data).hexdigest()[:16]
+        start = 0
+        match = re.match(r'bytes=(\d+)-$', self.headers.get("Range", ""))
+        if match and self.headers.get("If-Range", etag) == etag:
+            start = int(match.group(1))
+            if start >= len(data):
+                self.send_error(416)
+                return
+        with server.lock:
+            server.requests.append((name, start))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self.send_response(206 if start else 200)
+            if start:
+                self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+            self.send_header("Content-Length", str(len(data) - start))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            drop_at = len(data) // 2 if name in server.drop_once else None
+            server.drop_once.discard(name)
+            for pos in range(start, len(data), CHUNK):
+                if drop_at is not None and pos >= drop_at:
+                    self.close_connection = True  # Leaves the client with an incomplete body
+                    return
+                self.wfile.write(data[pos:pos + CHUNK])
+                time.sleep(server.delay)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mirror():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Mirror)
+    server.daemon_threads = True
+    server.files = {SDK_ARCHIVES[name]["file"]: _zip(members) for name, members in ARCHIVE_MEMBERS.items()}
+    server.lock = threading.Lock()
+    server.requests, server.drop_once = [], set()
+    server.active = server.max_active = 0
+    server.delay = 0.005
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(fetch, "time", SimpleNamespace(sleep=lambda seconds: None))
+
+
+def _downloader(tmp_path, mirror, **kwargs):
+    logs = []
+    dl = MinimalToolsDownloader(str(tmp_path / "base"), logger=logs.append, mirror=mirror.url,
+                                store=ToolStore(str(tmp_path / "store")), **kwargs)
+    return dl, logs
+
+
+def _pin(monkeypatch, mirror, **digests):
+    archives = {name: dict(spec) for name, spec in SDK_ARCHIVES.items()}
+    for name, spec in archives.items():
+        spec["sha256"] = digests.get(name, hashlib.sha256(mirror.files[spec["file"]]).hexdigest())
+    monkeypatch.setattr(downloader, "SDK_ARCHIVES", archives)
+
+
+def test_parallel_fetch_installs_toolset(tmp_path, mirror, monkeypatch):
+    _pin(monkeypatch, mirror)
+    dl, logs = _downloader(tmp_path, mirror)
+    assert dl.download_and_setup(), logs
+    assert sorted(os.listdir(dl.tools_dir)) == sorted(INSTALLED + [downloader.TOOLSET_FILE])
+    with open(os.path.join(dl.tools_dir, "android.jar"), 'rb') as f:
+        assert f.read() == ARCHIVE_MEMBERS["platform"]["android-33/android.jar"]
+    assert mirror.max_active == len(SDK_ARCHIVES)  # Every archive was downloading at the same time
+    assert dl.is_installed()
+    assert not os.listdir(dl.store.partial_dir)  # Part files are discarded once installed
+
+
+def test_resume_after_dropped_connection(tmp_path, mirror, monkeypatch):
+    _pin(monkeypatch, mirror)
+    platform = SDK_ARCHIVES["platform"]["file"]
+    mirror.drop_once.add(platform)
+    dl, logs = _downloader(tmp_path, mirror)
+    assert dl.download_and_setup(), logs
+    requests = [start for name, start in mirror.requests if name == platform]
+    assert len(requests) == 2 and requests[0] == 0 and requests[1] > 0  # The second request was a Range request
+    assert any(msg.startswith("Connection lost") for msg in logs)
+    with open(os.path.join(dl.tools_dir, "android.jar"), 'rb') as f:
+        assert f.read() == ARCHIVE_MEMBERS["platform"]["android-33/android.jar"]
+
+
+def test_sha256_mismatch_is_rejected(tmp_path, mirror, monkeypatch):
+    _pin(monkeypatch, mirror, platform="0" * 64)
+    dl, logs = _downloader(tmp_path, mirror)
+    assert not dl.download_and_setup()
+    assert any("SHA-256 mismatch for platform-33_r02.zip" in msg for msg in logs)
+    assert not dl.is_installed()
+    assert not os.path.exists(os.path.join(dl.tools_dir, "android.jar"))
+    # The corrupt download is deleted; the verified ones are kept to be resumed
+    kept = [SDK_ARCHIVES[name]["file"] + ".part" for name in ("build-tools", "platform-tools")]
+    assert sorted(os.listdir(dl.store.partial_dir)) == sorted(kept + [part + ".json" for part in kept])
+
+
+def test_unpinned_archives_are_accepted_with_a_warning(tmp_path, mirror, monkeypatch):
+    monkeypatch.delenv(downloader.REQUIRE_PINNED_ENV, raising=False)
+    _pin(monkeypatch, mirror, platform=None)
+    dl, logs = _downloader(tmp_path, mirror)
+    assert dl.download_and_setup(), logs
+    digest = hashlib.sha256(mirror.files["platform-33_r02.zip"]).hexdigest()
+    assert [msg for msg in logs if msg.startswith("Warning:")] == [
+        f"Warning: platform-33_r02.zip has no pinned SHA-256 in SDK_ARCHIVES and was not verified "
+        f"(downloaded SHA-256: {digest})"]
+
+
+def test_fresh_install_with_shipped_archives(tmp_path, mirror, monkeypatch):
+    monkeypatch.delenv(downloader.REQUIRE_PINNED_ENV, raising=False)
+    dl, logs = _downloader(tmp_path, mirror)
+    assert dl.download_and_setup(), logs
+    assert dl.is_installed()
+
+
+def test_unpinned_archives_are_refused_when_pinning_is_required(tmp_path, mirror, monkeypatch):
+    monkeypatch.setenv(downloader.REQUIRE_PINNED_ENV, "1")
+    _pin(monkeypatch, mirror, platform=None)
+    dl, logs = _downloader(tmp_path, mirror)
+    assert not dl.download_and_setup()
+    assert any("no pinned SHA-256 for platform-33_r02.zip" in msg for msg in logs)
+    assert mirror.requests == []
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import zipfile
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from builder import signer  # noqa: E402
+from builder.apk import END_OF_CENTRAL_DIR, EOCD_SIG, ApkWriter  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _read_lp(data, pos):
+    length = struct.unpack_from('<I', data, pos)[0]
+    return data[pos + 4:pos + 4 + length], pos + 4 + length
+
+
+def _read_seq(data):
+    """Items of a length-prefixed sequence's contents; fails on trailing bytes."""
+    items, pos = [], 0
+    while pos < len(data):
+        item, pos = _read_lp(data, pos)
+        items.append(item)
+    assert pos == len(data)
+    return items
+
+
+def _signing_block(apk):
+    """({block id: value}, block offset, central directory offset) of a signed APK."""
+    eocd_offset = apk.rfind(struct.pack('<I', EOCD_SIG))
+    cd_size, cd_offset = END_OF_CENTRAL_DIR.unpack_from(apk, eocd_offset)[5:7]
+    assert apk[cd_offset - 16:cd_offset] == signer.APK_SIG_BLOCK_MAGIC
+    size = struct.unpack_from('<Q', apk, cd_offset - 24)[0]
+    start = cd_offset - size - 8
+    assert struct.unpack_from('<Q', apk, start)[0] == size
+    pairs, pos = {}, start + 8
+    while pos < cd_offset - 24:
+        length, block_id = struct.unpack_from('<QI', apk, pos)
+        pairs[block_id] = apk[pos + 12:pos + 8 + length]
+        pos += 8 + length
+    return pairs, start, cd_offset
+
+
+def _content_digest(apk, block_start, cd_offset):
+    """The v2/v3 content digest, computed independently of ApkSigner._content_digest."""
+    eocd_offset = apk.rfind(struct.pack('<I', EOCD_SIG))
+    eocd = bytearray(apk[eocd_offset:])
+    struct.pack_into('<I', eocd, 16, block_start)  # Digested as if the central directory followed the entries
+    chunks = []
+    for section in (apk[:block_start], apk[cd_offset:eocd_offset], bytes(eocd)):
+        chunks += [section[i:i + signer.CHUNK_SIZE] for i in range(0, len(section), signer.CHUNK_SIZE)]
+    digests = b"".join(hashlib.sha256(b"\xa5" + struct.pack('<I', len(c)) + c).digest() for c in chunks)
+    return hashlib.sha256(b"\x5a" + struct.pack('<I', len(chunks)) + digests).digest()
+
+
+def _verify_signer(value, v3):
+    """Parses and verifies the single signer of a v2/v3 block. Returns its additional attributes."""
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    (signer_data,) = _read_seq(_read_lp(value, 0)[0])
+    signed_data, pos = _read_lp(signer_data, 0)
+    if v3:
+        pos += 8  # minSdk, maxSdk
+    signatures, pos = _read_lp(signer_data, pos)
+    public_key, pos = _read_lp(signer_data, pos)
+    assert pos == len(signer_data)
+
+    digests, offset = _read_lp(signed_data, 0)
+    certificates, offset = _read_lp(signed_data, offset)
+    if v3:
+        offset += 8
+    attributes, offset = _read_lp(signed_data, offset)
+    assert offset == len(signed_data)
+
+    key = serialization.load_der_public_key(public_key)
+    for signature in _read_seq(signatures):
+        algorithm = struct.unpack_from('<I', signature)[0]
+        assert algorithm == signer.RSA_PKCS1_SHA256
+        key.verify(_read_lp(signature, 4)[0], signed_data, padding.PKCS1v15(), hashes.SHA256())
+    assert _read_seq(certificates)
+    (digest,) = _read_seq(digests)
+    return _read_lp(digest, 4)[0], [(struct.unpack_from('<I', a)[0], a[4:]) for a in _read_seq(attributes)]
+
+
+@pytest.fixture(scope="module")
+def signed_apk(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("signer")
+    unsigned = str(tmp / "unsigned.apk")
+    with ApkWriter(unsigned) as apk:
+        apk.add_bytes("AndroidManifest.xml", b"\x03\x00\x08\x00" + b"\x00" * 4)
+        apk.add_bytes("classes.dex", os.urandom(3 * signer.CHUNK_SIZE // 2))
+        apk.add_bytes("assets/index.html", b"<html></html>" * 1000)
+    keystore = str(tmp / "debug.keystore")
+    signer.create_debug_keystore(keystore)
+    key, certificates = signer.load_keystore(keystore, "android", "androiddebugkey", "android")
+    signed = str(tmp / "signed.apk")
+    signer.ApkSigner(key, certificates, min_sdk=21).sign(unsigned, signed)
+    return signed
+
+
+def test_signing_block_round_trip(signed_apk):
+    with open(signed_apk, 'rb') as f:
+        apk = f.read()
+    pairs, block_start, cd_offset = _signing_block(apk)
+    expected = _content_digest(apk, block_start, cd_offset)
+
+    digest, attributes = _verify_signer(pairs[signer.V2_BLOCK_ID], v3=False)
+    assert digest == expected
+    # v2 -> v3 stripping protection: exactly one attribute, the v3 scheme id
+    assert attributes == [(signer.STRIPPING_PROTECTION_ATTR_ID, struct.pack('<I', 3))]
+
+    digest, attributes = _verify_signer(pairs[signer.V3_BLOCK_ID], v3=True)
+    assert digest == expected
+    assert attributes == []
+
+
+def test_v1_signature(signed_apk):
+    with zipfile.ZipFile(signed_apk) as zf:
+        names = zf.namelist()
+        assert zf.testzip() is None
+    assert {"META-INF/MANIFEST.MF", "META-INF/CERT.SF", "META-INF/CERT.RSA"} <= set(names)
+
+
+def _apksigner():
+    """Command running apksigner, from $APKSIGNER, bin/apksigner.jar (with java) or PATH; None if missing."""
+    if os.environ.get("APKSIGNER"):
+        return [os.environ["APKSIGNER"]]
+    jar = os.path.join(BASE_DIR, "bin", "apksigner.jar")
+    if os.path.exists(jar) and shutil.which("java"):
+        return ["java", "-jar", jar]
+    found = shutil.which("apksigner")
+    return [found] if found else None
+
+
+@pytest.mark.skipif(_apksigner() is None, reason="apksigner not available")
+def test_apksigner_verifies(signed_apk):
+    res = subprocess.run(_apksigner() + ["verify", "-v", "--min-sdk-version", "21", signed_apk],
+                         capture_output=True, text=True)
+    assert res.returncode == 0, res.stdout + res.stderr
+    for scheme in ("v1", "v2", "v3"):
+        assert f"Verified using {scheme} scheme (APK Signature Scheme {scheme}): true" in res.stdout \
+            or f"Verified using {scheme} scheme (JAR signing): true" in res.stdout